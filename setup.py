@@ -47,8 +47,10 @@ setup(name='ViTables',
           'License :: OSI Approved :: GNU General Public License v3 (GPLv3)',
           'Operating System :: POSIX',
           'Programming Language :: Python',
+          'Programming Language :: Python :: 3',
           'Topic :: Scientific/Engineering'
       ],
+      python_requires='>=3.9',
       install_requires=[
           'qtpy (>=1.2.1)',
           'PyQt5 (>=5.5.1)',
@@ -58,6 +60,7 @@ setup(name='ViTables',
       ],
       entry_points={
           'gui_scripts': ['vitables = vitables.start:gui'],
+          'console_scripts': ['vitables-csv = vitables.csv.batch:main'],
           'vitables.plugins':
           [('columnar_org = '
             'vitables.plugins.columnorg.columnar_org:ArrayColsOrganizer'),
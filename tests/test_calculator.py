@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#       Copyright (C) 2008-2017 Vicent Mas. All rights reserved
+#
+#       This program is free software: you can redistribute it and/or modify
+#       it under the terms of the GNU General Public License as published by
+#       the Free Software Foundation, either version 3 of the License, or
+#       (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#       MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#       GNU General Public License for more details.
+#
+#       You should have received a copy of the GNU General Public License
+#       along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#       Author:  Vicent Mas - vmas@vitables.org
+
+
+"""Test class for the out-of-core evaluation of calculator expressions."""
+
+import multiprocessing
+
+import numpy
+import pytest
+import tables
+
+import vitables.calculator.blockwise as blockwise
+import vitables.calculator.calcworker as calcworker
+import vitables.calculator.evaluator as evaluator
+
+
+@pytest.fixture
+def h5file(tmpdir):
+    h5file = tables.open_file(str(tmpdir.join('calc.h5')), 'w')
+    h5file.create_carray('/', 'a', obj=numpy.arange(1000, dtype='float64'),
+                         chunkshape=(64, ))
+    h5file.create_array('/', 'b', obj=numpy.ones(1000, dtype='float64'))
+    h5file.create_array('/', 'c', obj=numpy.ones(10, dtype='float64'))
+    yield h5file
+    h5file.close()
+
+
+class TestBlockwise(object):
+    """Test class for module blockwise."""
+
+    @pytest.mark.parametrize('expression, elementwise', [
+        ('a * 2 + sin(b)', True),
+        ('where(a > 500, a, -b)', True),
+        ('a.sum()', False),
+        ('a[:10] + 1', False),
+        ('a @ b', False),
+        ('matmul(a, b)', False),
+        ('divmod(a, 2)', False),
+        ('modf(a)', False),
+        ('a + c', False),
+        ('sum(a)', False),
+        ('a < b < 10', False),
+    ])
+    def test_elementwiseOperands(self, h5file, expression, elementwise):
+        namespace = evaluator.namespace('', {'a': h5file.root.a,
+                                             'b': h5file.root.b,
+                                             'c': h5file.root.c})
+        operands = blockwise.elementwise_operands(expression, namespace)
+        assert (operands is not None) == elementwise
+
+    def test_storeBlocks(self, h5file, monkeypatch):
+        # Small blocks so that the expression is evaluated in several steps
+        monkeypatch.setattr(blockwise, 'BLOCK_BYTES', 1000)
+        expression = 'where(a > 500, a * 2, -b)'
+        namespace = evaluator.namespace('', {'a': h5file.root.a,
+                                             'b': h5file.root.b})
+        operands = blockwise.elementwise_operands(expression, namespace)
+        written = list(blockwise.store_blocks(
+            h5file.root, 'result', 1000,
+            blockwise.evaluate_blocks(expression, namespace, operands)))
+        assert len(written) > 1
+        assert written[-1] == 1000
+        a = numpy.arange(1000, dtype='float64')
+        expected = numpy.where(a > 500, a * 2, -1.0)
+        numpy.testing.assert_array_equal(h5file.root.result.read(), expected)
+        assert isinstance(h5file.root.result, tables.CArray)
+
+    def test_storeBlocksFailure(self, h5file):
+        def blocks():
+            yield 0, 10, numpy.zeros(10)
+            raise ValueError('evaluation failed')
+
+        with pytest.raises(ValueError):
+            for written in blockwise.store_blocks(h5file.root, 'result', 20,
+                                                  blocks()):
+                pass
+        assert 'result' not in h5file.root
+
+    @pytest.mark.parametrize('expression, engine', [
+        ('a * 2 + sin(b) ** 2', 'numexpr'),
+        ('where(a > 500, abs(a), -b)', 'numexpr'),
+        ('a // b', 'numexpr'),
+        ('spacing(a)', 'numpy'),
+    ])
+    def test_selectEngine(self, h5file, expression, engine):
+        namespace = evaluator.namespace('', {'a': h5file.root.a,
+                                             'b': h5file.root.b})
+        operands = blockwise.elementwise_operands(expression, namespace)
+        selected, translated, dtype = blockwise.select_engine(
+            expression, namespace, operands)
+        assert selected == engine
+        results = [numpy.concatenate([block for start, stop, block in
+                                      blockwise.evaluate_blocks(
+                                          source, namespace, operands,
+                                          rows=100, engine=name, threads=2,
+                                          dtype=result_dtype)])
+                   for name, source, result_dtype in (
+                       ('numpy', expression, None),
+                       (selected, translated, dtype))]
+        numpy.testing.assert_allclose(results[0], results[1])
+        assert results[0].dtype == results[1].dtype
+
+    def test_selectEngineDtype(self, tmpdir):
+        with tables.open_file(str(tmpdir.join('float32.h5')), 'w') as h5file:
+            h5file.create_array('/', 'v',
+                                obj=numpy.arange(100, dtype='float32'))
+            namespace = evaluator.namespace('', {'v': h5file.root.v})
+            operands = blockwise.elementwise_operands('v * 2.0', namespace)
+            selected, translated, dtype = blockwise.select_engine(
+                'v * 2.0', namespace, operands)
+            assert (selected, dtype) == ('numexpr', numpy.float32)
+            result = numpy.concatenate([block for start, stop, block in
+                                        blockwise.evaluate_blocks(
+                                            translated, namespace, operands,
+                                            engine=selected, dtype=dtype)])
+        assert result.dtype == numpy.float32
+        numpy.testing.assert_array_equal(
+            result, numpy.arange(100, dtype='float32') * 2)
+
+
+class TestCalcWorker(object):
+    """Test class for module calcworker."""
+
+    def evaluate(self, *args):
+        """Run an evaluation in this process and return its messages."""
+        receiver, sender = multiprocessing.Pipe(duplex=False)
+        calcworker.evaluate_expression(sender, *args)
+        messages = []
+        try:
+            while True:
+                messages.append(receiver.recv())
+        except EOFError:
+            receiver.close()
+        return messages
+
+    def test_evaluateBlocks(self, tmpdir, monkeypatch):
+        monkeypatch.setattr(blockwise, 'BLOCK_BYTES', 4000)
+        filepath = str(tmpdir.join('source.h5'))
+        result_filepath = str(tmpdir.join('result.h5'))
+        with tables.open_file(filepath, 'w') as h5file:
+            h5file.create_array('/', 'a', obj=numpy.arange(1000))
+
+        messages = self.evaluate('k = 3', 'a * k', {'a': (filepath, '/a')},
+                                 result_filepath, 'numexpr', 1)
+        assert messages[0] == ('engine', ('numexpr', 1000))
+        assert [kind for kind, content in messages[1:]] == \
+            ['progress', 'progress', 'done']
+        with tables.open_file(result_filepath, 'r') as h5file:
+            result = h5file.get_node('/', calcworker.RESULT_NAME).read()
+        numpy.testing.assert_array_equal(result, numpy.arange(1000) * 3)
+
+    def test_evaluateInMemory(self, tmpdir):
+        filepath = str(tmpdir.join('source.h5'))
+        result_filepath = str(tmpdir.join('result.h5'))
+        with tables.open_file(filepath, 'w') as h5file:
+            h5file.create_array('/', 'a', obj=numpy.arange(10))
+
+        messages = self.evaluate('', 'a[:].sum()', {'a': (filepath, '/a')},
+                                 result_filepath)
+        assert messages == [('engine', ('memory', None)), ('done', None)]
+        with tables.open_file(result_filepath, 'r') as h5file:
+            result = h5file.get_node('/', calcworker.RESULT_NAME).read()
+        numpy.testing.assert_array_equal(result, [45])
+
+        messages = self.evaluate('', 'a +* 2', {'a': (filepath, '/a')},
+                                 result_filepath)
+        assert messages[-1][0] == 'error'
@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#       Copyright (C) 2008-2017 Vicent Mas. All rights reserved
+#
+#       This program is free software: you can redistribute it and/or modify
+#       it under the terms of the GNU General Public License as published by
+#       the Free Software Foundation, either version 3 of the License, or
+#       (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#       MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#       GNU General Public License for more details.
+#
+#       You should have received a copy of the GNU General Public License
+#       along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#       Author:  Vicent Mas - vmas@vitables.org
+
+"""Test class for the CSV import machinery."""
+
+import io
+import multiprocessing
+import os
+
+import numpy
+import pytest
+import tables
+
+import vitables.csv.batch as batch
+import vitables.csv.csvparser as csvparser
+import vitables.csv.csvwriter as csvwriter
+import vitables.csv.exportworker as exportworker
+import vitables.csv.importdlg as importdlg
+import vitables.workerutils
+
+
+@pytest.fixture(params=['pandas', 'numpy'])
+def parser(request, monkeypatch):
+    if request.param == 'pandas':
+        pytest.importorskip('pandas')
+    else:
+        monkeypatch.setattr(csvparser, 'pandas', None)
+    return request.param
+
+
+class TestCSVParser(object):
+    """Test class for module csvparser."""
+
+    def test_readTableBlocks(self, tmpdir, parser):
+        filepath = str(tmpdir.join('table.csv'))
+        with open(filepath, 'w') as csv_file:
+            for i in range(25):
+                csv_file.write('{0},{1},été{2},{3}\n'.format(
+                    i, i * 0.5, i % 3, i % 2 == 0))
+        dtype = numpy.dtype([('f0', '<i8'), ('f1', '<f8'), ('f2', 'S10'),
+                             ('f3', '?')])
+        with open(filepath, 'r') as csv_file:
+            blocks = [block.copy() for block
+                      in csvparser.readBlocks(csv_file, dtype,
+                                              block_rows=10)]
+        assert [block.shape[0] for block in blocks] == [10, 10, 5]
+        rows = numpy.concatenate(blocks)
+        assert (rows['f0'] == numpy.arange(25)).all()
+        assert (rows['f1'] == numpy.arange(25) * 0.5).all()
+        assert rows['f2'][4] == 'été1'.encode('utf-8')
+        assert (rows['f3'] == (numpy.arange(25) % 2 == 0)).all()
+
+    def test_readArrayBlocks(self, tmpdir, parser):
+        filepath = str(tmpdir.join('array.csv'))
+        data = numpy.arange(60).reshape(20, 3)
+        numpy.savetxt(filepath, data, fmt='%d', delimiter=',')
+        with open(filepath, 'r') as csv_file:
+            rows = numpy.concatenate(
+                [block.copy() for block
+                 in csvparser.readBlocks(csv_file, numpy.dtype('<i4'), 3,
+                                         block_rows=7)])
+        assert (rows == data).all()
+
+    def test_scanFile(self, tmpdir, parser):
+        filepath = str(tmpdir.join('strings.csv'))
+        with open(filepath, 'w', encoding='utf-8') as csv_file:
+            for i in range(30):
+                csv_file.write('{0},{1},{2}\n'.format(i, 'a' * i, 'é' * 2))
+        with open(filepath, 'r', encoding='utf-8') as csv_file:
+            (widths, nlines, nbytes) = \
+                csvparser.scanFile(csv_file, [1, 2], block_rows=7)
+        assert widths == {1: 29, 2: 4}
+        assert nlines == 30
+        # Non-ASCII lines are measured in bytes, not characters
+        assert nbytes == os.path.getsize(filepath)
+        with open(filepath, 'r') as csv_file:
+            (widths, nlines, nbytes) = \
+                csvparser.scanFile(csv_file, [1], sample_lines=10)
+        assert widths == {1: 9}
+        assert nlines == 10
+
+    def test_columnOverflow(self, tmpdir, parser):
+        filepath = str(tmpdir.join('overflow.csv'))
+        with open(filepath, 'w') as csv_file:
+            for i in range(20):
+                csv_file.write('{0},{1}\n'.format(i, 'b' * i))
+        dtype = numpy.dtype([('f0', '<i8'), ('f1', 'S10')])
+        with open(filepath, 'r') as csv_file:
+            with pytest.raises(csvparser.ColumnOverflow) as info:
+                for block in csvparser.readBlocks(csv_file, dtype,
+                                                  block_rows=5):
+                    pass
+        assert info.value.column == 1
+        assert info.value.width == 14
+
+    def test_parallelBlocks(self, tmpdir):
+        filepath = str(tmpdir.join('parallel.csv'))
+        with open(filepath, 'w') as csv_file:
+            csv_file.write('a,b\n')
+            for i in range(2000):
+                csv_file.write('{0},{1}\n'.format(i, 'x' * (i % 7)))
+        dtype = numpy.dtype([('a', '<i8'), ('b', 'S6')])
+        ranges = csvparser.byteRanges(filepath, 1, range_bytes=1000)
+        assert len(ranges) > 10
+        pool = vitables.workerutils.startPool(2)
+        try:
+            rows = numpy.concatenate(list(csvparser.parallelBlocks(
+                pool, filepath, dtype, skip_lines=1, window=3,
+                range_bytes=1000)))
+            assert (rows['a'] == numpy.arange(2000)).all()
+            assert rows['b'][6] == b'x' * 6
+            narrow = numpy.dtype([('a', '<i8'), ('b', 'S3')])
+            with pytest.raises(csvparser.ColumnOverflow) as info:
+                list(csvparser.parallelBlocks(pool, filepath, narrow,
+                                              skip_lines=1,
+                                              range_bytes=1000))
+            assert (info.value.column, info.value.width) == (1, 6)
+        finally:
+            pool.terminate()
+            pool.join()
+
+    @pytest.mark.parametrize('module,extension',
+                             [('gzip', '.gz'), ('bz2', '.bz2'),
+                              ('lzma', '.xz')])
+    def test_openCompressedFile(self, tmpdir, module, extension):
+        module = pytest.importorskip(module)
+        filepath = str(tmpdir.join('data.csv' + extension))
+        with module.open(filepath, 'wt') as csv_file:
+            for i in range(50):
+                csv_file.write('{0},{1}\n'.format(i, i * 2))
+        assert csvparser.stripCompressionExtension('data.csv' + extension) \
+            == 'data.csv'
+        with csvparser.openFile(filepath) as csv_file:
+            assert isinstance(csv_file, csvparser.CompressedInput)
+            rows = numpy.concatenate(
+                [block.copy() for block
+                 in csvparser.readBlocks(csv_file, numpy.dtype('<i8'), 2,
+                                         block_rows=20)])
+        assert (rows[:, 1] == numpy.arange(50) * 2).all()
+
+
+class TestImportSettings(object):
+    """Test class for the storage settings of imported datasets."""
+
+    def test_parseChunkshape(self):
+        assert importdlg.parseChunkshape('', 2) is None
+        assert importdlg.parseChunkshape(' 1000, 4 ', 2) == (1000, 4)
+        for text in ('1000', '0, 4', 'a, 4'):
+            with pytest.raises(ValueError):
+                importdlg.parseChunkshape(text, 2)
+
+    def test_defaultSettings(self):
+        settings = importdlg.defaultSettings()
+        assert settings['chunkshape'] is None
+        assert settings['filters'].complib in importdlg.availableComplibs()
+
+
+class TestCSVWriter(object):
+    """Test class for module csvwriter."""
+
+    def test_writeTableRows(self, tmpdir):
+        h5file = tables.open_file(str(tmpdir.join('export.h5')), 'w')
+        try:
+            description = {'a': tables.Int32Col(pos=0),
+                           'b': tables.StringCol(8, pos=1),
+                           'c': {'d': tables.Float64Col(pos=0)},
+                           'v': tables.Int8Col(shape=(2, ), pos=3)}
+            table = h5file.create_table('/', 'table', description)
+            rows = numpy.zeros(25, dtype=table.dtype)
+            rows['a'] = numpy.arange(25)
+            rows['b'] = 'été'.encode('utf-8')
+            rows['c']['d'] = numpy.arange(25) * 0.5
+            table.append(rows)
+            assert csvwriter.tableColumns(table) == ['a', 'b', 'c/d']
+
+            out_handler = io.BytesIO()
+            written = list(csvwriter.writeRows(
+                out_handler, table, 2, 20, 3, ['c/d', 'b'],
+                add_header=True, block_rows=4))
+            assert written == [4, 6]
+            lines = out_handler.getvalue().decode('utf-8').splitlines()
+            assert lines[0] == 'c/d,b'
+            assert lines[1:3] == ['1.0,été', '2.5,été']
+            assert len(lines) == 7
+        finally:
+            h5file.close()
+
+    def test_writeArrayRows(self, tmpdir):
+        h5file = tables.open_file(str(tmpdir.join('export.h5')), 'w')
+        try:
+            data = numpy.arange(30).reshape(10, 3)
+            array = h5file.create_array('/', 'array', data)
+            out_handler = io.BytesIO()
+            list(csvwriter.writeRows(out_handler, array, columns=[2, 0],
+                                     block_rows=3))
+            out_handler.seek(0)
+            exported = numpy.loadtxt(out_handler, delimiter=',', dtype=int)
+            assert (exported == data[:, [2, 0]]).all()
+        finally:
+            h5file.close()
+
+
+class TestExportWorker(object):
+    """Test class for module exportworker."""
+
+    def export(self, filepath, nodepath, csv_filepath, options):
+        """Run an export in this process and return its messages."""
+
+        receiver, sender = multiprocessing.Pipe(duplex=False)
+        exportworker.exportDataset(sender, filepath, nodepath, csv_filepath,
+                                   options)
+        messages = []
+        try:
+            while True:
+                messages.append(receiver.recv())
+        except EOFError:
+            receiver.close()
+        return messages
+
+    def test_exportDataset(self, tmpdir):
+        filepath = str(tmpdir.join('export.h5'))
+        csv_filepath = str(tmpdir.join('export.csv'))
+        with tables.open_file(filepath, 'w') as h5file:
+            h5file.create_array('/', 'array', numpy.arange(10))
+
+        messages = self.export(filepath, '/array', csv_filepath,
+                               {'step': 2, 'block_rows': 2})
+        assert [kind for kind, content in messages] == \
+            ['progress', 'progress', 'progress', 'done']
+        assert messages[-1][1] == (5, 10)
+        with open(csv_filepath) as csv_file:
+            assert csv_file.read() == '0\n2\n4\n6\n8\n'
+
+    def test_exportFrameView(self, tmpdir):
+        pandas = pytest.importorskip('pandas')
+        filepath = str(tmpdir.join('frame.h5'))
+        csv_filepath = str(tmpdir.join('frame.csv'))
+        pandas.DataFrame({'x': range(10)}).to_hdf(filepath, key='df',
+                                                  format='table')
+
+        # Only the rows of the view are exported, in the order of the view
+        messages = self.export(
+            filepath, '/df/table', csv_filepath,
+            {'frame_key': '/df', 'coordinates': numpy.array([7, 2, 5]),
+             'add_header': True})
+        assert messages[-1] == ('done', (3, 15))
+        with open(csv_filepath) as csv_file:
+            assert csv_file.read().split() == [',x', '7,7', '2,2', '5,5']
+
+    def test_exportError(self, tmpdir):
+        filepath = str(tmpdir.join('export.h5'))
+        csv_filepath = str(tmpdir.join('export.csv'))
+        with tables.open_file(filepath, 'w') as h5file:
+            h5file.create_array('/', 'array', numpy.arange(10))
+
+        messages = self.export(filepath, '/missing', csv_filepath, {})
+        assert messages[-1][0] == 'error'
+        assert not tmpdir.join('export.csv').exists()
+
+
+class TestBatch(object):
+    """Test class for module batch."""
+
+    def test_roundTrip(self, tmpdir):
+        csv_file = tmpdir.join('data.csv')
+        csv_file.write('a,b\n1,x\n2,yy\n3,zzz\n')
+        assert batch.main(['-j', '1', 'import', '--complevel', '0',
+                           str(csv_file)]) == 0
+        with tables.open_file(str(tmpdir.join('data.h5'))) as h5file:
+            table = h5file.root.imported_Table
+            assert table.colnames == ['a', 'b']
+            assert table.nrows == 3
+
+        out_dir = tmpdir.join('out')
+        assert batch.main(['-o', str(out_dir), 'export', '--header',
+                           str(tmpdir.join('data.h5'))]) == 0
+        assert out_dir.join('data_imported_Table.csv').read() == \
+            csv_file.read()
+
+        # Existing files are not overwritten
+        assert batch.main(['import', str(csv_file)]) == 1
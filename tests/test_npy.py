@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#       Copyright (C) 2008-2017 Vicent Mas. All rights reserved
+#
+#       This program is free software: you can redistribute it and/or modify
+#       it under the terms of the GNU General Public License as published by
+#       the Free Software Foundation, either version 3 of the License, or
+#       (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#       MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#       GNU General Public License for more details.
+#
+#       You should have received a copy of the GNU General Public License
+#       along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#       Author:  Vicent Mas - vmas@vitables.org
+
+
+"""Test class for the .npy import/export machinery."""
+
+import numpy
+import pytest
+import tables
+
+import vitables.npy.npyutils as npyutils
+
+
+class TestNPY(object):
+    """Test class for module npyutils."""
+
+    @pytest.mark.parametrize('kind', ['CArray', 'EArray'])
+    def test_importArray(self, tmpdir, monkeypatch, kind):
+        # Small blocks so that the array is copied in several slices
+        monkeypatch.setattr(npyutils, 'BLOCK_BYTES', 1000)
+        data = numpy.arange(3000, dtype='int32').reshape(1000, 3)
+        numpy.save(str(tmpdir.join('data.npy')), data)
+        source = npyutils.openSource(str(tmpdir.join('data.npy')))
+        settings = {'filters': tables.Filters(1, 'zlib'),
+                    'chunkshape': (20, 3)}
+        with tables.open_file(str(tmpdir.join('data.h5')), 'w') as h5file:
+            dataset = npyutils.createDataset(h5file, kind, source, settings)
+            written = list(npyutils.importRows(dataset, source))
+            assert written[-1] == 1000
+            # Blocks span whole chunks
+            assert all(rows % 20 == 0 for rows in written)
+            assert (dataset.read() == data).all()
+
+    def test_structuredRoundTrip(self, tmpdir):
+        data = numpy.zeros(50, dtype=[('a', 'i4'), ('b', 'S3')])
+        data['a'] = numpy.arange(50)
+        data['b'] = b'xyz'
+        numpy.save(str(tmpdir.join('data.npy')), data)
+        source = npyutils.openSource(str(tmpdir.join('data.npy')))
+        settings = {'filters': tables.Filters(), 'chunkshape': None}
+        with pytest.raises(ValueError):
+            npyutils.checkSource(source, 'CArray')
+        with tables.open_file(str(tmpdir.join('data.h5')), 'w') as h5file:
+            table = npyutils.createDataset(h5file, 'Table', source, settings)
+            list(npyutils.importRows(table, source))
+            list(npyutils.exportRows(table, str(tmpdir.join('out.npy'))))
+        exported = numpy.load(str(tmpdir.join('out.npy')))
+        assert (exported == data).all()
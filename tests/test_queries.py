@@ -0,0 +1,430 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#       Copyright (C) 2008-2017 Vicent Mas. All rights reserved
+#
+#       This program is free software: you can redistribute it and/or modify
+#       it under the terms of the GNU General Public License as published by
+#       the Free Software Foundation, either version 3 of the License, or
+#       (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#       MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#       GNU General Public License for more details.
+#
+#       You should have received a copy of the GNU General Public License
+#       along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#       Author:  Vicent Mas - vmas@vitables.org
+
+"""Test class for the query worker."""
+
+import multiprocessing
+import os
+import threading
+import types
+
+import numpy
+import pytest
+import tables
+
+import vitables.queries.queryworker as queryworker
+import vitables.queries.tablecondition as tablecondition
+
+
+def runWorker(qdescr, ft_dtype, target=queryworker.queryTable):
+    """Run a query in the current process and collect its messages."""
+
+    conn, child_conn = multiprocessing.Pipe(duplex=False)
+    worker = threading.Thread(target=target,
+                              args=(child_conn, qdescr, ft_dtype))
+    worker.start()
+    messages = []
+    while not messages or messages[-1][0] not in ('done', 'error'):
+        messages.append(conn.recv())
+    worker.join()
+    return messages
+
+
+class TestQueryWorker(object):
+    """Test class for module queryworker."""
+
+    nrows = 100000
+
+    @pytest.fixture()
+    def h5table(self, tmpdir):
+        filepath = str(tmpdir.join('query.h5'))
+        with tables.open_file(filepath, 'w') as h5file:
+            table = h5file.create_table(
+                '/', 'table', {'x': tables.Int64Col(pos=0),
+                               'y': tables.Float64Col(pos=1)})
+            data = numpy.empty(self.nrows, dtype=table.dtype)
+            data['x'] = numpy.arange(self.nrows)
+            data['y'] = data['x'] * 0.5
+            table.append(data)
+        return filepath
+
+    def qdescr(self, filepath, rows_range, indices_field_name=''):
+        return {'src_filepath': filepath,
+                'src_path': '/table',
+                'condition': '(x % 7) == 0',
+                'condvars': {'col0': 'y'},
+                'rows_range': rows_range,
+                'indices_field_name': indices_field_name}
+
+    def test_scanSize(self, h5table):
+        with tables.open_file(h5table, 'r') as h5file:
+            table = h5file.root.table
+            size = queryworker.scanSize(table)
+            assert size >= table.nrowsinbuf
+            assert size % table.chunkshape[0] == 0
+            assert queryworker.scanSize(table, 3) % 3 == 0
+
+    def test_rowsRange(self):
+        ranges = list(queryworker.rowsRange(5, 27, 10))
+        assert ranges[0] == (5, 15)
+        assert ranges[-1][1] == 27
+        covered = sum(lstop - lstart for (lstart, lstop) in ranges)
+        assert covered == 22
+
+    def test_queryWithIndex(self, h5table):
+        ft_dtype = numpy.dtype([('idx', '<i8'), ('x', '<i8'), ('y', '<f8')])
+        qdescr = self.qdescr(h5table, (0, self.nrows, 3), 'idx')
+        messages = runWorker(qdescr, ft_dtype)
+        assert messages[-1] == ('done', None)
+        progress = [content for (kind, content) in messages
+                    if kind == 'progress']
+        assert progress[-1] == self.nrows
+        rows = numpy.concatenate([content for (kind, content) in messages
+                                  if kind == 'rows'])
+        expected = numpy.arange(0, self.nrows, 3)
+        expected = expected[expected % 7 == 0]
+        assert (rows['idx'] == expected).all()
+        assert (rows['x'] == expected).all()
+        assert (rows['y'] == expected * 0.5).all()
+        # Only the scanned slices are counted, as with no indices column
+        profile = dict(messages)['profile']
+        with tables.open_file(h5table, 'r') as h5file:
+            rowsize = h5file.root.table.rowsize
+        assert profile['bytes_read'] == self.nrows * rowsize
+
+    def test_queryWithNoIndex(self, h5table):
+        with tables.open_file(h5table, 'r') as h5file:
+            ft_dtype = h5file.root.table.dtype
+            rowsize = h5file.root.table.rowsize
+        qdescr = self.qdescr(h5table, (10, 5000, 1))
+        messages = runWorker(qdescr, ft_dtype)
+        assert messages[-1] == ('done', None)
+        (kind, profile) = messages[-2]
+        assert kind == 'profile'
+        assert not profile['uses_index']
+        assert profile['chunks'] >= 1
+        assert profile['bytes_read'] == (5000 - 10) * rowsize
+        rows = numpy.concatenate([content for (kind, content) in messages
+                                  if kind == 'rows'])
+        expected = numpy.arange(10, 5000)
+        assert (rows['x'] == expected[expected % 7 == 0]).all()
+
+    def test_indexedQuery(self, h5table):
+        with tables.open_file(h5table, 'a') as h5file:
+            h5file.root.table.cols.x.create_csindex()
+        ft_dtype = numpy.dtype([('idx', '<i8'), ('x', '<i8'), ('y', '<f8')])
+        qdescr = self.qdescr(h5table, (0, self.nrows, 1), 'idx')
+        qdescr['condition'] = '(x >= 500) & (x < 99000)'
+        messages = runWorker(qdescr, ft_dtype)
+        assert ('indexed', True) in messages
+        assert messages[-3] == ('progress', self.nrows)
+        (kind, profile) = messages[-2]
+        assert kind == 'profile'
+        assert profile['uses_index']
+        assert profile['rows_scanned'] == self.nrows
+        rows = numpy.concatenate([content for (kind, content) in messages
+                                  if kind == 'rows'])
+        assert (rows['idx'] == numpy.arange(500, 99000)).all()
+
+    def test_manageIndex(self, h5table):
+        conn, child_conn = multiprocessing.Pipe(duplex=False)
+        queryworker.manageIndex(child_conn, h5table, '/table', 'y', 'create')
+        assert conn.recv() == ('done', None)
+        with tables.open_file(h5table, 'r') as h5file:
+            assert h5file.root.table.cols.y.is_indexed
+        conn, child_conn = multiprocessing.Pipe(duplex=False)
+        queryworker.manageIndex(child_conn, h5table, '/table', 'y', 'remove')
+        assert conn.recv() == ('done', None)
+        with tables.open_file(h5table, 'r') as h5file:
+            assert not h5file.root.table.cols.y.is_indexed
+
+    def test_queryError(self, h5table):
+        qdescr = self.qdescr(h5table, (0, self.nrows, 1))
+        qdescr['condition'] = 'z > 0'
+        messages = runWorker(qdescr, None)
+        assert messages[-1][0] == 'error'
+
+    def test_queryArray(self, tmpdir):
+        filepath = str(tmpdir.join('array.h5'))
+        with tables.open_file(filepath, 'w') as h5file:
+            earray = h5file.create_earray('/', 'earray', tables.Int32Atom(),
+                                          shape=(3, 0))
+            earray.append(numpy.arange(3000).reshape(3, 1000))
+        ft_dtype = numpy.dtype([('coordinates', '<i8', (2, )),
+                                ('values', '<i4')])
+        qdescr = {'src_filepath': filepath,
+                  'src_path': '/earray',
+                  'condition': '(values % 10) == 0',
+                  'rows_range': (1, 1000, 3),
+                  'indices_field_name': 'coordinates'}
+        messages = runWorker(qdescr, ft_dtype, queryworker.queryArray)
+        assert messages[-1] == ('done', None)
+        rows = numpy.concatenate([content for (kind, content) in messages
+                                  if kind == 'rows'])
+        data = numpy.arange(3000).reshape(3, 1000)
+        assert (data[tuple(rows['coordinates'].T)] == rows['values']).all()
+        expected = data[:, 1:1000:3]
+        assert rows.shape[0] == (expected % 10 == 0).sum()
+
+    def test_arrayMask(self):
+        values = numpy.arange(10.)
+        assert queryworker.arrayMask('values > 3.5', values).sum() == 6
+        with pytest.raises(TypeError):
+            queryworker.arrayMask('values + 1', values)
+
+    def test_queryFile(self, h5table):
+        ft_dtype = numpy.dtype([('source_file', 'S200'), ('x', '<i8'),
+                                ('y', '<f8')])
+        with tables.open_file(h5table, 'r') as h5file:
+            src_dtype = h5file.root.table.dtype
+        qdescr = self.qdescr(h5table, (10, None, 1))
+        qdescr['condvars'] = {}
+        qdescr['condition'] = 'x >= 99990'
+        (filepath, rows, profile, error) = queryworker.queryFile(
+            (qdescr, src_dtype, ft_dtype, 'source_file'))
+        assert error is None
+        assert profile['rows_scanned'] == self.nrows - 10
+        assert (rows['x'] == numpy.arange(99990, self.nrows)).all()
+        assert (rows['source_file'] == h5table.encode('utf-8')).all()
+
+        qdescr['src_path'] = '/nonexistent'
+        (filepath, rows, profile, error) = queryworker.queryFile(
+            (qdescr, src_dtype, ft_dtype, 'source_file'))
+        assert rows is None
+        assert error
+
+    def test_groupAccumulator(self):
+        keys = numpy.arange(1000) % 7
+        values = numpy.arange(1000, dtype=numpy.int16)
+        accumulator = queryworker.GroupAccumulator(keys.dtype,
+                                                   {'v': values.dtype})
+        for start in range(0, 1000, 300):
+            accumulator.update(keys[start:start + 300],
+                               {'v': values[start:start + 300]})
+        dtype = numpy.dtype([('k', '<i8'), ('count', '<i8'),
+                             ('v_sum', '<i8'), ('v_min', '<i2'),
+                             ('v_max', '<i2'), ('v_mean', '<f8')])
+        result = accumulator.result(
+            dtype, 'k', [('v', 'sum', 'v_sum'), ('v', 'min', 'v_min'),
+                         ('v', 'max', 'v_max'), ('v', 'mean', 'v_mean')])
+        assert (result['k'] == numpy.arange(7)).all()
+        for row in result:
+            group = values[keys == row['k']]
+            assert row['count'] == group.shape[0]
+            assert row['v_sum'] == group.sum()
+            assert row['v_min'] == group.min()
+            assert row['v_max'] == group.max()
+            assert row['v_mean'] == group.mean()
+
+    def test_aggregateTable(self, h5table):
+        qdescr = self.qdescr(h5table, (0, self.nrows, 1))
+        qdescr.update({'condvars': {}, 'condition': 'x < 1000',
+                       'group_by': 'x', 'key_field': 'x',
+                       'aggregates': [('y', 'max', 'y_max')]})
+        ft_dtype = numpy.dtype([('x', '<i8'), ('count', '<i8'),
+                                ('y_max', '<f8')])
+        messages = runWorker(qdescr, ft_dtype, queryworker.aggregateTable)
+        assert messages[-1] == ('done', None)
+        (kind, rows) = messages[-3]
+        assert kind == 'rows'
+        assert (rows['x'] == numpy.arange(1000)).all()
+        assert (rows['count'] == 1).all()
+        assert (rows['y_max'] == rows['x'] * 0.5).all()
+
+    def test_matchKeys(self):
+        sorted_keys = numpy.array([1, 1, 2, 5, 5, 9])
+        keys = numpy.array([5, 0, 1, 9])
+        (probe, build) = queryworker.matchKeys(sorted_keys, keys)
+        assert (keys[probe] == sorted_keys[build]).all()
+        assert probe.tolist() == [0, 0, 2, 2, 3]
+
+    def test_joinTables(self, h5table, tmpdir):
+        filepath = str(tmpdir.join('right.h5'))
+        with tables.open_file(filepath, 'w') as h5file:
+            table = h5file.create_table(
+                '/', 'table', {'key': tables.Int32Col(pos=0),
+                               'z': tables.Float64Col(pos=1)})
+            keys = numpy.array([7, 7, 14, 10**6])
+            data = numpy.empty(keys.shape[0], dtype=table.dtype)
+            data['key'] = keys
+            data['z'] = keys * 2.
+            table.append(data)
+        with tables.open_file(h5table, 'r') as h5file:
+            left_dtype = h5file.root.table.dtype
+        ft_dtype = numpy.dtype([('left', left_dtype),
+                                ('right', [('key', '<i4'), ('z', '<f8')])])
+        qdescr = self.qdescr(h5table, (0, self.nrows, 1))
+        qdescr.update({'right_filepath': filepath, 'right_path': '/table',
+                       'left_key': 'x', 'right_key': 'key',
+                       'build_side': 'right', 'memory_budget': 2**20})
+        messages = runWorker(qdescr, ft_dtype, queryworker.joinTables)
+        assert messages[-1] == ('done', None)
+        rows = numpy.concatenate([content for (kind, content) in messages
+                                  if kind == 'rows'])
+        assert sorted(rows['left']['x'].tolist()) == [7, 7, 14]
+        assert (rows['right']['z'] == rows['left']['x'] * 2.).all()
+
+        qdescr['memory_budget'] = 1
+        messages = runWorker(qdescr, ft_dtype, queryworker.joinTables)
+        assert messages[-1][0] == 'error'
+        assert 'MemoryError' in messages[-1][1]
+
+
+class TestTableCondition(object):
+    """Test class for conditions on nested and multidimensional columns."""
+
+    nrows = 1000
+
+    @pytest.fixture()
+    def h5table(self, tmpdir):
+        filepath = str(tmpdir.join('nested.h5'))
+        description = {'x': tables.Int64Col(pos=0),
+                       'v': tables.Float64Col(shape=(3, ), pos=1),
+                       'info': {'energy': tables.Float64Col(pos=0),
+                                'hits': tables.Int32Col(shape=(2, ),
+                                                        pos=1)}}
+        with tables.open_file(filepath, 'w') as h5file:
+            table = h5file.create_table('/', 'table', description)
+            data = numpy.zeros(self.nrows, dtype=table.dtype)
+            data['x'] = numpy.arange(self.nrows)
+            data['v'] = numpy.arange(3 * self.nrows).reshape(self.nrows, 3)
+            data['info']['energy'] = data['x'] * 0.5
+            data['info']['hits'][:, 1] = data['x'] % 10
+            table.append(data)
+        return filepath
+
+    def test_nestedCondition(self, h5table):
+        with tables.open_file(h5table, 'r') as h5file:
+            table = h5file.root.table
+            tcond = tablecondition.TableCondition(
+                table, 'info.energy > 100', {})
+            assert not tcond.elementwise
+            assert tcond.expression == 'info__energy > 100'
+            rows = table.read_where(tcond.expression, tcond.condvars)
+            assert (rows['x'] == numpy.arange(201, self.nrows)).all()
+            with pytest.raises(NameError):
+                tablecondition.TableCondition(table, 'info.mass > 1', {})
+
+    def test_elementwiseCondition(self, h5table):
+        with tables.open_file(h5table, 'r') as h5file:
+            table = h5file.root.table
+            tcond = tablecondition.TableCondition(
+                table, '(v[1] < 100) & any(info.hits == 3)', {})
+            assert tcond.elementwise
+            mask = tcond.mask(tcond.readColumns(0, self.nrows, 1),
+                              self.nrows)
+            assert (mask.nonzero()[0] == [3, 13, 23]).all()
+            rows = table.read()
+            assert (tcond.mask(tcond.rowColumns(rows), self.nrows) ==
+                    mask).all()
+            tcond = tablecondition.TableCondition(table, 'v > 3', {})
+            with pytest.raises(TypeError):
+                tcond.mask(tcond.readColumns(0, 10, 1), 10)
+            with pytest.raises(SyntaxError):
+                tablecondition.TableCondition(table, 'x[0] > 3', {})
+            with pytest.raises(SyntaxError):
+                tablecondition.TableCondition(table, '[y for y in v]', {})
+
+    def test_queryElementwise(self, h5table):
+        with tables.open_file(h5table, 'r') as h5file:
+            ft_dtype = numpy.dtype(h5file.root.table.dtype.descr +
+                                   [('coords', '<i8')])
+        qdescr = {'src_filepath': h5table,
+                  'src_path': '/table',
+                  'condition': 'all(col0 >= 2991)',
+                  'condvars': {'col0': 'v'},
+                  'rows_range': (numpy.int64(0), numpy.int64(self.nrows),
+                                 numpy.int64(1)),
+                  'indices_field_name': 'coords'}
+        messages = runWorker(qdescr, ft_dtype)
+        assert messages[-1] == ('done', None)
+        rows = numpy.concatenate([content for (kind, content) in messages
+                                  if kind == 'rows'])
+        assert (rows['coords'] == [997, 998, 999]).all()
+        assert (rows['x'] == rows['coords']).all()
+
+
+class TestFrameQuery(object):
+    """Test class for queries on pandas frame_table nodes."""
+
+    @pytest.fixture()
+    def h5frame(self, tmpdir):
+        pandas = pytest.importorskip('pandas')
+        filepath = str(tmpdir.join('frame.h5'))
+        frame = pandas.DataFrame({'A': numpy.arange(100),
+                                  'B': numpy.arange(100) * 0.5})
+        with pandas.HDFStore(filepath, 'w') as hstore:
+            hstore.append('frame', frame, data_columns=['A'])
+        return filepath
+
+    def test_selectCoordinates(self, h5frame):
+        from vitables.vttables import df_model
+        with tables.open_file(h5frame, 'r') as h5file:
+            hstore = df_model.open_hdfstore(h5file)
+            (coordinates, used_columns) = df_model.select_coordinates(
+                hstore, '/frame', 'A >= 95')
+            assert (coordinates == numpy.arange(95, 100)).all()
+            assert used_columns == {'A': True}
+            # B is not a data column so the frame is scanned
+            (coordinates, used_columns) = df_model.select_coordinates(
+                hstore, '/frame', 'B < 1')
+            assert (coordinates == [0, 1]).all()
+            assert used_columns is None
+
+
+class TestQueryCache(object):
+    """Test class for the cache of query results."""
+
+    def test_replacedResult(self, tmpdir):
+        from vitables.queries import querymgr
+        src_filepath = str(tmpdir.join('source.h5'))
+        tables.open_file(src_filepath, 'w').close()
+        stat = os.stat(src_filepath)
+        key = (src_filepath, '/table', stat.st_mtime, stat.st_size,
+               'x > 1', (), (0, 10, 1), None)
+        with tables.open_file(str(tmpdir.join('tmp.h5')), 'w') as tmp_h5file:
+            ftable = tmp_h5file.create_table('/', 'ft', {'x': tables.IntCol()})
+            ftable.attrs[querymgr.RESULT_ID_ATTR] = 'result'
+            manager = types.SimpleNamespace(
+                dbt_model=types.SimpleNamespace(
+                    tmp_dbdoc=types.SimpleNamespace(h5file=tmp_h5file)),
+                results_cache={key: ('/ft', 'result')})
+            get = querymgr.QueriesManager.getCachedResult
+            assert get(manager, key) == '/ft'
+            # A new table at the same path (and maybe the same address) is
+            # not mistaken for the cached result
+            tmp_h5file.remove_node('/ft')
+            tmp_h5file.create_table('/', 'ft', {'x': tables.IntCol()})
+            assert get(manager, key) is None
+            assert manager.results_cache == {}
+
+    def test_copyCachedResult(self, tmpdir):
+        from vitables.queries import querymgr
+        with tables.open_file(str(tmpdir.join('tmp.h5')), 'w') as tmp_h5file:
+            ftable = tmp_h5file.create_table('/', 'ft', {'x': tables.IntCol()})
+            ftable.append(numpy.array([(1, ), (2, )], dtype=ftable.dtype))
+            ftable.attrs[querymgr.RESULT_ID_ATTR] = 'result'
+            ftable.attrs[queryworker.PROFILE_PREFIX + 'seconds'] = 1.5
+            ftable.attrs.condition = 'x > 0'
+            copy = querymgr.copyCachedResult(tmp_h5file, '/ft', 'ft_copy')
+            assert copy.read()['x'].tolist() == [1, 2]
+            assert copy.attrs._f_list('user') == ['condition']
+            # The cached table is left untouched
+            assert ftable.attrs[querymgr.RESULT_ID_ATTR] == 'result'
@@ -1,6 +1,7 @@
 """Test class for vtgui.py"""
 
 import pytest
+import tables
 
 from qtpy import QtCore
 from qtpy import QtWidgets
@@ -40,7 +41,8 @@ class TestVTGui(object):
             ['fileNew', 'fileOpen', 'fileOpenRO', 'fileClose', 'fileCloseAll',
              'fileSaveAs', 'fileExit', 'nodeOpen', 'nodeClose',
              'nodeProperties', 'nodeNew', 'nodeRename', 'nodeCut', 'nodeCopy',
-             'nodePaste', 'nodeDelete', 'queryNew', 'queryDeleteAll',
+             'nodePaste', 'nodeDelete', 'queryNew', 'queryBatch',
+             'queryAggregate', 'queryJoin', 'queryDeleteAll',
              'settingsPreferences', 'windowCascade', 'windowTile',
              'windowRestoreAll', 'windowMinimizeAll', 'windowClose',
              'windowCloseAll', 'windowSeparator', 'mdiTabbed',
@@ -109,7 +111,8 @@ class TestVTGui(object):
         assert sorted(actions) == sorted(expected_actions)
 
         menus = [a.menu().objectName() for a in menu_actions if a.menu()]
-        assert sorted(menus) == ['import_csv_submenu', 'open_recent_submenu']
+        assert sorted(menus) == ['import_csv_submenu', 'import_npy_submenu',
+                                 'open_recent_submenu']
 
         separators = [a for a in menu_actions if a.isSeparator()]
         assert len(separators) == 4
@@ -136,11 +139,16 @@ class TestVTGui(object):
 
         actions = [a.objectName() for a in menu_actions
                    if not (a.isSeparator() or a.menu())]
-        expected_actions = ['queryNew', 'calculate', 'export_csv']
+        expected_actions = ['queryNew', 'queryBatch', 'queryAggregate',
+                            'queryJoin', 'calculate', 'export_csv',
+                            'export_view_csv', 'export_npy']
         assert sorted(actions) == sorted(expected_actions)
 
+        menus = [a.menu().objectName() for a in menu_actions if a.menu()]
+        assert sorted(menus) == ['index_submenu']
+
         separators = [a for a in menu_actions if a.isSeparator()]
-        assert len(separators) == 1
+        assert len(separators) == 3
 
     def test_settingsMenu(self, menuBar):
         menu = menuBar.findChild(QtWidgets.QMenu, 'settings_menu')
@@ -199,7 +207,8 @@ class TestVTGui(object):
         assert sorted(actions) == sorted(expected_actions)
 
         menus = [a.menu().objectName() for a in menu_actions if a.menu()]
-        assert sorted(menus) == ['import_csv_submenu', 'open_recent_submenu']
+        assert sorted(menus) == ['import_csv_submenu', 'import_npy_submenu',
+                                 'open_recent_submenu']
 
         separators = [a for a in menu_actions if a.isSeparator()]
         assert len(separators) == 4
@@ -242,11 +251,16 @@ class TestVTGui(object):
                    if not (a.isSeparator() or a.menu())]
         expected_actions = ['nodeOpen', 'nodeClose',  'nodeProperties',
                             'nodeRename', 'nodeCut', 'nodeCopy', 'nodePaste',
-                            'nodeDelete', 'queryNew', 'export_csv']
+                            'nodeDelete', 'queryNew', 'queryBatch',
+                            'queryAggregate', 'queryJoin', 'export_csv',
+                            'export_npy']
         assert sorted(actions) == sorted(expected_actions)
 
+        menus = [a.menu().objectName() for a in menu_actions if a.menu()]
+        assert sorted(menus) == ['index_submenu']
+
         separators = [a for a in menu_actions if a.isSeparator()]
-        assert len(separators) == 4
+        assert len(separators) == 6
 
     def test_mdiCM(self, launcher):
         menu = launcher.gui.findChild(QtWidgets.QMenu, 'mdi_cm')
@@ -255,3 +269,15 @@ class TestVTGui(object):
 
         menus = [a.menu().objectName() for a in menu_actions if a.menu()]
         assert sorted(menus) == ['window_menu']
+
+    def test_fileOpenWhileIndexing(self, launcher, tmpdir):
+        filepath = str(tmpdir.join('indexing.h5')).replace('\\', '/')
+        tables.open_file(filepath, 'w').close()
+        jobs = launcher.vtapp_object.indexes_mgr.jobs
+        jobs[filepath] = {}
+        try:
+            launcher.vtapp_object.fileOpen(filepath)
+        finally:
+            del jobs[filepath]
+        model = launcher.gui.dbs_tree_model
+        assert filepath not in [doc.filepath for doc in model.root.children]
@@ -0,0 +1,289 @@
+"""Out-of-core evaluation of element-wise calculator expressions.
+
+Expressions made only of arithmetic operators, comparisons and numpy
+universal functions applied to arrays of the same shape are evaluated block
+by block: every block of rows of the operands is read, the expression is
+evaluated on it and the result is written to a chunked, compressed CArray.
+So the memory used doesn't depend on the size of the operands.
+
+Blocks are evaluated with numpy or, if the expression only uses operators and
+functions that numexpr supports, with numexpr using several threads.
+
+Other expressions (reductions, slicing, calls to arbitrary functions...)
+cannot be split into blocks and are evaluated in memory.
+
+This module doesn't import Qt.
+
+"""
+
+import ast
+import logging
+
+import numexpr
+import numpy
+import tables
+
+log = logging.getLogger(__name__)
+
+# Approximate size in bytes of the blocks of every operand.
+BLOCK_BYTES = 16 * 1024 * 1024
+
+# Syntax allowed in element-wise expressions. Calls are checked separately.
+ELEMENTWISE_NODES = (ast.Expression, ast.BinOp, ast.UnaryOp, ast.Compare,
+                     ast.Call, ast.Name, ast.Load, ast.Constant,
+                     ast.operator, ast.unaryop, ast.cmpop)
+
+# Functions that are element-wise but are not numpy universal functions.
+ELEMENTWISE_FUNCTIONS = (numpy.where, )
+
+# Names of the numexpr functions equivalent to numpy functions. Functions
+# missing in the installed numexpr version are discarded.
+NUMEXPR_FUNCTIONS = dict(
+    (function, name) for function, name in (
+        (numpy.sin, 'sin'), (numpy.cos, 'cos'), (numpy.tan, 'tan'),
+        (numpy.arcsin, 'arcsin'), (numpy.arccos, 'arccos'),
+        (numpy.arctan, 'arctan'), (numpy.arctan2, 'arctan2'),
+        (numpy.sinh, 'sinh'), (numpy.cosh, 'cosh'), (numpy.tanh, 'tanh'),
+        (numpy.arcsinh, 'arcsinh'), (numpy.arccosh, 'arccosh'),
+        (numpy.arctanh, 'arctanh'), (numpy.exp, 'exp'),
+        (numpy.expm1, 'expm1'), (numpy.log, 'log'), (numpy.log10, 'log10'),
+        (numpy.log1p, 'log1p'), (numpy.log2, 'log2'), (numpy.sqrt, 'sqrt'),
+        (numpy.absolute, 'abs'), (numpy.conjugate, 'conj'),
+        (numpy.floor, 'floor'), (numpy.ceil, 'ceil'),
+        (numpy.trunc, 'trunc'), (numpy.fmod, 'fmod'),
+        (numpy.hypot, 'hypot'), (numpy.copysign, 'copysign'),
+        (numpy.isfinite, 'isfinite'), (numpy.isinf, 'isinf'),
+        (numpy.isnan, 'isnan'), (numpy.maximum, 'maximum'),
+        (numpy.minimum, 'minimum'), (numpy.where, 'where'))
+    if name in numexpr.expressions.functions)
+
+# The engines that evaluate element-wise expressions.
+ENGINES = ('numexpr', 'numpy')
+
+
+def default_filters():
+    """Return the filters of the arrays where results are stored."""
+    if 'lz4' in tables.blosc_compressor_list():
+        return tables.Filters(complevel=5, complib='blosc:lz4', shuffle=True)
+    return tables.Filters(complevel=5, complib='zlib', shuffle=True)
+
+
+def is_elementwise_function(value):
+    """Return True if value is a function that works element by element.
+
+    Generalized ufuncs (like matmul) work on core dimensions and ufuncs with
+    several outputs (like divmod) return tuples, so neither is element-wise.
+
+    """
+    if isinstance(value, numpy.ufunc):
+        return value.signature is None and value.nout == 1
+    return any(value is function for function in ELEMENTWISE_FUNCTIONS)
+
+
+def elementwise_operands(expression, namespace):
+    """Return the array nodes of an element-wise expression.
+
+    The return value maps variable names to the arrays they reference.
+    None is returned if the expression is not element-wise or its operands
+    cannot be split into the same blocks of rows (all of them must have the
+    same shape).
+
+    """
+    try:
+        tree = ast.parse(expression.strip(), mode='eval')
+    except SyntaxError:
+        return None
+    operands = {}
+    for node in ast.walk(tree):
+        if not isinstance(node, ELEMENTWISE_NODES) \
+                or isinstance(node, ast.MatMult):
+            return None
+        # Chained comparisons need the truth value of whole arrays
+        if isinstance(node, ast.Compare) and len(node.ops) > 1:
+            return None
+        if isinstance(node, ast.Call):
+            if node.keywords or not isinstance(node.func, ast.Name) \
+                    or not is_elementwise_function(
+                        namespace.get(node.func.id)):
+                return None
+        elif isinstance(node, ast.Name):
+            value = namespace.get(node.id)
+            if isinstance(value, tables.Leaf):
+                if not isinstance(value, tables.Array) \
+                        or isinstance(value, tables.VLArray) \
+                        or value.maindim != 0 or value.shape == () \
+                        or value.shape[0] == 0:
+                    return None
+                operands[node.id] = value
+            elif not (is_elementwise_function(value)
+                      or isinstance(value, (int, float, complex,
+                                            numpy.number))):
+                return None
+    shapes = set(tuple(leaf.shape) for leaf in operands.values())
+    if len(shapes) != 1:
+        return None
+    return operands
+
+
+def default_threads():
+    """Return the default number of threads used by numexpr."""
+    return max(1, min(numexpr.detect_number_of_cores(), numexpr.MAX_THREADS))
+
+
+def numexpr_expression(expression, namespace):
+    """Translate an element-wise expression to numexpr syntax.
+
+    Functions are renamed after their numexpr equivalent. None is returned
+    if the expression uses functions or syntax that numexpr doesn't support.
+
+    """
+    tree = ast.parse(expression.strip(), mode='eval')
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Call):
+            function = namespace.get(node.func.id)
+            if not any(function is known for known in NUMEXPR_FUNCTIONS):
+                return None
+            node.func.id = NUMEXPR_FUNCTIONS[function]
+    return ast.unparse(tree)
+
+
+def numexpr_variables(expression, namespace):
+    """Return the variables of an expression that aren't functions."""
+    tree = ast.parse(expression.strip(), mode='eval')
+    functions = set(node.func.id for node in ast.walk(tree)
+                    if isinstance(node, ast.Call))
+    return dict((node.id, namespace[node.id]) for node in ast.walk(tree)
+                if isinstance(node, ast.Name) and node.id not in functions)
+
+
+def select_engine(expression, namespace, operands, engine='numexpr'):
+    """Choose the engine that evaluates an element-wise expression.
+
+    numexpr is used only if it is requested and it can evaluate the
+    expression on the first row of the operands (it doesn't support every
+    dtype). Returns a tuple (engine, expression, dtype) with the expression
+    translated to the syntax of the chosen engine. numexpr upcasts some
+    results (float32 * 2.0 is float64), so dtype is the dtype numpy gives
+    to the result on the first row; it is None for the numpy engine.
+
+    """
+    if engine != 'numexpr':
+        return 'numpy', expression, None
+    translated = numexpr_expression(expression, namespace)
+    if translated is None:
+        log.debug('numexpr does not support the expression {0}'.format(
+            expression))
+        return 'numpy', expression, None
+    variables = numexpr_variables(expression, namespace)
+    variables.update((name, leaf[:1]) for name, leaf in operands.items())
+    row_namespace = dict(namespace)
+    row_namespace.update((name, leaf[:1]) for name, leaf in operands.items())
+    try:
+        numexpr.evaluate(translated, local_dict=variables, global_dict={})
+        dtype = numpy.asarray(eval(expression.strip(), row_namespace)).dtype
+    except Exception as e:
+        log.debug('numexpr cannot evaluate {0}: {1}'.format(expression, e))
+        return 'numpy', expression, None
+    return 'numexpr', translated, dtype
+
+
+def block_rows(operands):
+    """Return the number of rows of the blocks read from the operands.
+
+    Blocks are about BLOCK_BYTES long (for the widest operand) and span
+    whole chunks of the first chunked operand.
+
+    """
+    leaves = list(operands.values())
+    row_bytes = max(max(1, leaf.atom.size * int(numpy.prod(leaf.shape[1:])))
+                    for leaf in leaves)
+    rows = max(1, BLOCK_BYTES // row_bytes)
+    chunkshapes = [leaf.chunkshape for leaf in leaves if leaf.chunkshape]
+    if chunkshapes:
+        chunk_rows = chunkshapes[0][0]
+        rows = max(chunk_rows, rows - rows % chunk_rows)
+    return rows
+
+
+def evaluate_blocks(expression, namespace, operands, rows=None,
+                    engine='numpy', threads=None, dtype=None):
+    """Evaluate an element-wise expression block by block.
+
+    Yields tuples (start, stop, result) where result is the value of the
+    expression for rows start to stop of the operands. With the numexpr
+    engine the expression must be translated by select_engine, threads
+    is the number of threads used (by default, all the cores) and the
+    results are cast to dtype if it is given.
+
+    """
+    nrows = next(iter(operands.values())).shape[0]
+    if rows is None:
+        rows = block_rows(operands)
+    if engine == 'numexpr':
+        block_namespace = numexpr_variables(expression, namespace)
+        previous_threads = numexpr.set_num_threads(
+            threads or default_threads())
+    else:
+        code = compile(expression.strip(), '<expression>', 'eval')
+        block_namespace = dict(namespace)
+    try:
+        for start in range(0, nrows, rows):
+            stop = min(start + rows, nrows)
+            for name, leaf in operands.items():
+                block_namespace[name] = leaf[start:stop]
+            if engine == 'numexpr':
+                result = numexpr.evaluate(expression,
+                                          local_dict=block_namespace,
+                                          global_dict={})
+                if dtype is not None:
+                    result = result.astype(dtype, copy=False)
+            else:
+                result = numpy.asarray(eval(code, block_namespace))
+            if result.shape[:1] != (stop - start, ):
+                raise ValueError('The expression is not element-wise, its '
+                                 'result has shape {0}'.format(result.shape))
+            yield start, stop, result
+    finally:
+        if engine == 'numexpr':
+            numexpr.set_num_threads(previous_threads)
+
+
+def read_blocks(leaf, rows=None):
+    """Read an array block by block.
+
+    Yields tuples (start, stop, block) like evaluate_blocks, so arrays
+    can be copied with store_blocks.
+
+    """
+    if rows is None:
+        rows = block_rows({leaf.name: leaf})
+    nrows = leaf.shape[0]
+    for start in range(0, nrows, rows):
+        stop = min(start + rows, nrows)
+        yield start, stop, leaf[start:stop]
+
+
+def store_blocks(group, name, nrows, blocks, title='', filters=None):
+    """Write the blocks of a result into a new CArray.
+
+    The CArray is created when the first block is available, its atom and
+    shape are taken from that block. If the evaluation fails the CArray is
+    removed. Yields the number of rows written so far after every block.
+
+    """
+    if filters is None:
+        filters = default_filters()
+    result = None
+    try:
+        for start, stop, block in blocks:
+            if result is None:
+                result = group._v_file.create_carray(
+                    group, name, atom=tables.Atom.from_dtype(block.dtype),
+                    shape=(nrows, ) + block.shape[1:], filters=filters,
+                    title=title)
+            result[start:stop] = block
+            yield stop
+    except BaseException:
+        if result is not None:
+            result._f_remove()
+        raise
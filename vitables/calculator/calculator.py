@@ -5,16 +5,20 @@
 import logging
 import os
 import re
+import tempfile
+import time
 from vitables.calculator.calculator_dlg import Ui_CalculatorDialog
 
 from qtpy import QtCore
 from qtpy import QtGui
 from qtpy import QtWidgets
+import numexpr
 import tables
 
-import numpy as np
-import vitables.calculator.evaluator as vtce
+import vitables.calculator.blockwise as vtcb
+import vitables.calculator.calcworker as vtcw
 import vitables.utils as vtu
+import vitables.workerutils
 
 
 translate = QtCore.QCoreApplication.translate
@@ -45,6 +49,15 @@ def run():
     dialog.exec_()
 
 
+# Interval (in milliseconds) between reads of the progress of the jobs.
+POLL_INTERVAL = 100
+
+# Number of steps of the progress dialogs.
+PROGRESS_STEPS = 1000
+
+# The running jobs and their progress dialogs.
+_jobs = {}
+
 # Marker used as prefix to distinguish identifiers from functions.
 IDENTIFIER_MARKER = '$'
 
@@ -136,6 +149,271 @@ def build_identifier_node_dict(identifiers, current_group):
     return identifier_node_dict
 
 
+class CalculatorJob(QtCore.QObject):
+    """An expression evaluated in a worker process.
+
+    The messages sent by the worker are read periodically (using a
+    timer). The worker stores the result in a temporary file next to the
+    destination file. When the worker is done the result is copied to its
+    destination block by block, a few blocks on every timer tick, so the
+    GUI keeps responsive.
+
+    """
+
+    # Rows evaluated (or stored) and throughput (rows/s) of the job
+    job_progress = QtCore.Signal(object, float)
+    # The job and whether it has been successful or not
+    job_completed = QtCore.Signal(object, bool)
+
+    def __init__(self, statements, expression, nodes, result_group,
+                 result_name, title, engine, threads):
+        super(CalculatorJob, self).__init__()
+        self.statements = statements
+        self.expression = expression
+        self.nodes = nodes
+        self.result_group = result_group
+        self.result_name = result_name
+        self.title = title
+        self.requested_engine = engine
+        self.threads = threads
+        self.engine = None
+        self.rows_total = None
+        self.rows_evaluated = 0
+        self.rows_stored = 0
+        self.start_time = None
+        self.store_time = None
+        self.cancelled = False
+        self.result_filepath = None
+
+        # The worker process and the receiving end of the pipe connected
+        # to it
+        self.worker = None
+        self.conn = None
+
+        # The temporary file and the generator that copies the result to
+        # its destination
+        self.result_file = None
+        self.copy = None
+
+        self.timer = QtCore.QTimer(self)
+        self.timer.timeout.connect(self.read_progress)
+
+    def run(self):
+        """Launch the worker process that evaluates the expression."""
+        handle, self.result_filepath = tempfile.mkstemp(
+            prefix='.vitables_calculator_', suffix='.h5',
+            dir=os.path.dirname(os.path.abspath(
+                self.result_group._v_file.filename)))
+        os.close(handle)
+        self.start_time = time.time()
+        self.worker, self.conn = vitables.workerutils.startWorker(
+            vtcw.evaluate_expression,
+            (self.statements, self.expression, self.nodes,
+             self.result_filepath, self.requested_engine, self.threads))
+        self.timer.start(POLL_INTERVAL)
+
+    def elapsed(self):
+        """Return the time (in seconds) elapsed since the job started."""
+        return time.time() - self.start_time
+
+    def storing(self):
+        """Return True if the result is being copied to its destination."""
+        return self.copy is not None
+
+    def read_progress(self):
+        """Read the messages sent by the worker process.
+
+        This is a slot called periodically by the job timer. Once the
+        worker is done it copies blocks of the result instead.
+
+        """
+        if self.storing():
+            self.store_blocks()
+            return
+        try:
+            while self.conn.poll():
+                kind, content = self.conn.recv()
+                if kind == 'engine':
+                    self.engine, self.rows_total = content
+                elif kind == 'progress':
+                    self.rows_evaluated = content
+                elif kind == 'done':
+                    self.store_result()
+                    return
+                else:
+                    log.error(content)
+                    self.finish(False)
+                    return
+        except (EOFError, OSError):
+            # The worker process died unexpectedly
+            vtu.formatExceptionInfo()
+            self.finish(False)
+            return
+        elapsed = self.elapsed()
+        throughput = self.rows_evaluated / elapsed if elapsed > 0 else 0.0
+        self.job_progress.emit(self.rows_evaluated, throughput)
+
+    def store_result(self):
+        """Start copying the result from the temporary file.
+
+        Results evaluated block by block are copied in blocks by the
+        following timer ticks. Results evaluated in memory are copied at
+        once.
+
+        """
+        self.conn.close()
+        self.worker.join()
+        try:
+            self.result_file = tables.open_file(self.result_filepath, 'r')
+            result = self.result_file.get_node('/', vtcw.RESULT_NAME)
+            if not isinstance(result, tables.CArray):
+                result._f_copy(self.result_group, self.result_name,
+                               title=self.title)
+                self.result_group._v_file.flush()
+                self.finish(True)
+                return
+            self.rows_total = result.nrows
+            self.store_time = time.time()
+            self.copy = vtcb.store_blocks(
+                self.result_group, self.result_name, result.nrows,
+                vtcb.read_blocks(result), self.title, result.filters)
+        except Exception as e:
+            log.error(str(e))
+            self.finish(False)
+
+    def store_blocks(self):
+        """Copy blocks of the result for about one timer interval."""
+        started = time.time()
+        try:
+            while time.time() - started < POLL_INTERVAL / 1000.0:
+                self.rows_stored = next(self.copy)
+        except StopIteration:
+            self.copy = None
+            self.result_group._v_file.flush()
+            self.finish(True)
+            return
+        except Exception as e:
+            self.copy = None
+            log.error(str(e))
+            self.finish(False)
+            return
+        elapsed = time.time() - self.store_time
+        throughput = self.rows_stored / elapsed if elapsed > 0 else 0.0
+        self.job_progress.emit(self.rows_stored, throughput)
+
+    def cancel(self):
+        """Stop the evaluation or the copy of the result.
+
+        This is a slot called when the user cancels the job. Calls done
+        after the job has finished are ignored.
+
+        """
+        if not self.timer.isActive():
+            return
+        self.cancelled = True
+        self.worker.terminate()
+        self.finish(False)
+
+    def finish(self, completed):
+        """Release the worker process and remove the temporary file.
+
+        A partially copied result is removed.
+
+        """
+        self.timer.stop()
+        self.conn.close()
+        self.worker.join()
+        if self.copy is not None:
+            self.copy.close()
+            self.copy = None
+        if self.result_file is not None:
+            self.result_file.close()
+            self.result_file = None
+        if os.path.exists(self.result_filepath):
+            os.remove(self.result_filepath)
+        self.job_completed.emit(self, completed)
+
+
+def start_job(job):
+    """Launch a calculator job and show its progress."""
+    job.job_completed.connect(job_completed)
+    _jobs[job] = create_progress_dialog(job)
+    job.run()
+
+
+def create_progress_dialog(job):
+    """Create a dialog that reports the progress of a calculator job.
+
+    Its Cancel button stops the job. Expressions evaluated in memory
+    don't report progress, then the dialog shows a busy indicator.
+
+    """
+    dialog = QtWidgets.QProgressDialog(vtu.getGui())
+    dialog.setWindowTitle(
+        translate('Calculator', 'Evaluating {0}').format(job.result_name))
+    dialog.setLabelText(translate('Calculator',
+                                  'Starting the evaluation...'))
+    dialog.setCancelButtonText(translate('Calculator', 'Cancel'))
+    dialog.setRange(0, PROGRESS_STEPS)
+    dialog.setAutoClose(False)
+    dialog.setAutoReset(False)
+    dialog.setMinimumDuration(500)
+    dialog.setValue(0)
+
+    def update_progress(rows_evaluated, throughput):
+        """Update the dialog with the progress of the job."""
+        if job.engine is None:
+            return
+        if job.rows_total is None:
+            dialog.setRange(0, 0)
+            dialog.setLabelText(translate('Calculator',
+                                          'Evaluating in memory...'))
+            return
+        dialog.setRange(0, PROGRESS_STEPS)
+        dialog.setValue(rows_evaluated * PROGRESS_STEPS // job.rows_total)
+        if job.storing():
+            label = translate('Calculator', 'Rows stored: {0} of {1}\n'
+                              'Throughput: {3:.0f} rows/s')
+        else:
+            label = translate('Calculator', 'Rows evaluated: {0} of {1}\n'
+                              'Engine: {2}\n'
+                              'Throughput: {3:.0f} rows/s')
+        dialog.setLabelText(label.format(rows_evaluated, job.rows_total,
+                                         job.engine, throughput))
+
+    job.job_progress.connect(update_progress)
+    dialog.canceled.connect(job.cancel)
+    return dialog
+
+
+def job_completed(job, completed):
+    """Release a finished calculator job and report its result."""
+    dialog = _jobs.pop(job)
+    dialog.close()
+    dialog.deleteLater()
+    if completed:
+        if job.engine == 'numexpr':
+            engine = translate('Calculator', 'numexpr ({0} threads)').format(
+                job.threads)
+        elif job.engine == 'numpy':
+            engine = 'numpy'
+        else:
+            engine = translate('Calculator', 'numpy in memory')
+        log.info(translate(
+            'Calculator', 'Expression evaluated with {0} in {1:.1f} s.'
+        ).format(engine, job.elapsed()))
+        vtu.getModel().updateTreeFromData()
+    elif job.cancelled:
+        log.info(translate('Calculator', 'Evaluation of {0} cancelled.'
+                           ).format(job.result_name))
+    else:
+        QtWidgets.QMessageBox.critical(
+            vtu.getGui(), translate('Calculator', 'Evaluation error'),
+            translate('Calculator', 'An exception was raised during '
+                      'evaluation, see log for details.'))
+    job.deleteLater()
+
+
 class CalculatorDialog(QtWidgets.QDialog, Ui_CalculatorDialog):
     def __init__(self, parent=None):
         super(CalculatorDialog, self).__init__(parent)
@@ -144,10 +422,12 @@ class CalculatorDialog(QtWidgets.QDialog, Ui_CalculatorDialog):
         self._settings = QtCore.QSettings()
         self._settings.beginGroup('Calculator')
         self._restore_expressions()
+        self._restore_engine()
 
     def on_buttons_rejected(self):
         """Slot for cancel button, save expressions on exit."""
         self._store_expressions()
+        self._store_engine()
         self.reject()
 
     def on_buttons_clicked(self, button):
@@ -156,6 +436,7 @@ class CalculatorDialog(QtWidgets.QDialog, Ui_CalculatorDialog):
         if button_id == QtWidgets.QDialogButtonBox.Apply:
             if self._execute_expression():
                 self._store_expressions()
+                self._store_engine()
                 self.accept()
 
     @QtCore.Slot()
@@ -267,6 +548,22 @@ class CalculatorDialog(QtWidgets.QDialog, Ui_CalculatorDialog):
             self.saved_list.addItem(name)
         self._settings.endArray()
 
+    def _store_engine(self):
+        """Save the evaluation engine settings."""
+        self._settings.setValue('use_numexpr',
+                                self.numexpr_check.isChecked())
+        self._settings.setValue('threads', self.threads_spin.value())
+
+    def _restore_engine(self):
+        """Read the evaluation engine settings and update widgets."""
+        self.threads_spin.setMaximum(numexpr.MAX_THREADS)
+        use_numexpr = self._settings.value('use_numexpr', True)
+        self.numexpr_check.setChecked(use_numexpr in (True, 'true'))
+        self.threads_spin.setValue(int(self._settings.value(
+            'threads', vtcb.default_threads())))
+        self.threads_spin.setEnabled(self.numexpr_check.isChecked())
+        self.numexpr_check.toggled.connect(self.threads_spin.setEnabled)
+
     def _all_identifiers_found(self, identifiers, identifier_node_dict):
         """Return false if identifier is not found or references a group."""
         for identifier in identifiers:
@@ -353,10 +650,10 @@ class CalculatorDialog(QtWidgets.QDialog, Ui_CalculatorDialog):
         return result_group, result_name
 
     def _execute_expression(self):
-        """Execute expression and store results.
+        """Start the evaluation of the expression in a worker process.
 
         Check existence of all tables used in the expression and
-        result.
+        result. The result is stored when the worker process is done.
 
         """
         statements = self.statements_edit.toPlainText()
@@ -374,30 +671,17 @@ class CalculatorDialog(QtWidgets.QDialog, Ui_CalculatorDialog):
         if results is None:
             return False
         result_group, result_name = results
-        try:
-            result = vtce.evaluate(statements, expression, eval_globals)
-        except Exception as e:
-            log.error(str(e))
-            QtWidgets.QMessageBox.critical(
-                self, translate('Calculator', 'Evaluation error'),
-                translate('Calculator', 'An exception was raised during '
-                          'evaluation, see log for details.'))
-            return False
-        if not isinstance(result, np.ndarray):
-            if isinstance(result, (list, tuple)):
-                result = np.array(result)
-            else:
-                result = np.array([result])
-        try:
-            result_group._v_file.create_array(
-                result_group, result_name, obj=result,
-                title='Expression: ' + self.expression_edit.toPlainText())
-        except Exception as e:
-            log.error(str(e))
-            QtWidgets.QMessageBox.critical(
-                self, translate('Calculator', 'Result save error'),
-                translate('Calculator', 'An exception was raised while '
-                          'trying to store results, see log for details.'))
-            return False
-        vtu.getModel().updateTreeFromData()
+        nodes = {}
+        for name, node in eval_globals.items():
+            if node._v_file.mode != 'r':
+                # Make sure that the worker process sees the current
+                # content of the node
+                node._v_file.flush()
+            nodes[name] = (node._v_file.filename, node._v_pathname)
+        job = CalculatorJob(
+            statements, expression, nodes, result_group, result_name,
+            'Expression: ' + self.expression_edit.toPlainText(),
+            'numexpr' if self.numexpr_check.isChecked() else 'numpy',
+            self.threads_spin.value())
+        start_job(job)
         return True
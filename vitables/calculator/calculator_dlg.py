@@ -64,6 +64,21 @@ class Ui_CalculatorDialog(object):
         self.result_edit = QtWidgets.QLineEdit(CalculatorDialog)
         self.result_edit.setObjectName("result_edit")
         self.evaluation_layout.addWidget(self.result_edit)
+        self.engine_layout = QtWidgets.QHBoxLayout()
+        self.engine_layout.setObjectName("engine_layout")
+        self.numexpr_check = QtWidgets.QCheckBox(CalculatorDialog)
+        self.numexpr_check.setObjectName("numexpr_check")
+        self.engine_layout.addWidget(self.numexpr_check)
+        self.threads_label = QtWidgets.QLabel(CalculatorDialog)
+        self.threads_label.setObjectName("threads_label")
+        self.engine_layout.addWidget(self.threads_label)
+        self.threads_spin = QtWidgets.QSpinBox(CalculatorDialog)
+        self.threads_spin.setMinimum(1)
+        self.threads_spin.setObjectName("threads_spin")
+        self.engine_layout.addWidget(self.threads_spin)
+        spacerItem = QtWidgets.QSpacerItem(40, 20, QtWidgets.QSizePolicy.Expanding, QtWidgets.QSizePolicy.Minimum)
+        self.engine_layout.addItem(spacerItem)
+        self.evaluation_layout.addLayout(self.engine_layout)
         self.main_layout.addLayout(self.evaluation_layout)
         self.main_layout.setStretch(0, 1)
         self.main_layout.setStretch(1, 3)
@@ -98,4 +113,9 @@ class Ui_CalculatorDialog(object):
 "<p>Reference to the destination for the expression result. Data refenrence is a string which is build by joining group names that lead to the data by dots. For example: &quot;filename.h5.some_group.sub_group.myresult&quot;. If &quot;sub_group&quot; is the current group then the string &quot;myresult&quot; can  be used as reference.</p>\n"
 "<p>The result table must not exitst.</p>\n"
 "</body></html>", None))
+        self.numexpr_check.setToolTip(_translate("CalculatorDialog", "<html><head/><body>\n"
+"<p>Evaluate element-wise expressions with numexpr using several threads. Expressions that numexpr doesn't support are evaluated with numpy.</p>\n"
+"</body></html>", None))
+        self.numexpr_check.setText(_translate("CalculatorDialog", "Use numexpr", None))
+        self.threads_label.setText(_translate("CalculatorDialog", "Threads:", None))
 
@@ -0,0 +1,85 @@
+"""Evaluation of calculator expressions in a worker process.
+
+The worker opens the files of the nodes referenced by the expression in
+read-only mode, evaluates the expression and stores its result in a
+temporary file. The GUI process copies the result to its destination when
+the worker is done. Messages are sent to the GUI process through a pipe as
+tuples (kind, content) where kind is one of:
+
+- 'engine': content is a tuple (engine, rows). engine is 'numexpr' or
+  'numpy' for expressions evaluated block by block and 'memory' for
+  expressions evaluated in memory, then rows is None
+- 'progress': content is the number of rows evaluated so far
+- 'done': content is None, the result is stored in the temporary file
+- 'error': content is the traceback of the exception that stopped the
+  evaluation
+
+This module doesn't import Qt.
+
+"""
+
+import traceback
+
+import numpy
+import tables
+
+import vitables.calculator.blockwise as blockwise
+import vitables.calculator.evaluator as evaluator
+
+# Name of the result node in the temporary file.
+RESULT_NAME = 'result'
+
+
+def result_array(result):
+    """Convert the result of an in-memory evaluation to an array."""
+    if isinstance(result, numpy.ndarray):
+        return result
+    if isinstance(result, (list, tuple)):
+        return numpy.array(result)
+    return numpy.array([result])
+
+
+def evaluate_expression(conn, statements, expression, nodes,
+                        result_filepath, engine='numpy', threads=None):
+    """Evaluate an expression and store its result in a new file.
+
+    This is the function run by the calculator worker processes. nodes maps
+    the variables of the expression to tuples (file path, node path).
+    Element-wise expressions are evaluated with the requested engine (see
+    blockwise.select_engine) and the progress is sent after every block.
+
+    """
+    files = {}
+    try:
+        variables = {}
+        for name, (filepath, nodepath) in nodes.items():
+            if filepath not in files:
+                files[filepath] = tables.open_file(filepath, 'r')
+            variables[name] = files[filepath].get_node(nodepath)
+        namespace = evaluator.namespace(statements, variables)
+        with tables.open_file(result_filepath, 'w') as result_file:
+            operands = blockwise.elementwise_operands(expression, namespace)
+            if operands is None:
+                conn.send(('engine', ('memory', None)))
+                result_file.create_array(
+                    '/', RESULT_NAME,
+                    obj=result_array(eval(expression, namespace)))
+            else:
+                engine, expression, dtype = blockwise.select_engine(
+                    expression, namespace, operands, engine)
+                nrows = next(iter(operands.values())).shape[0]
+                conn.send(('engine', (engine, nrows)))
+                blocks = blockwise.evaluate_blocks(
+                    expression, namespace, operands, engine=engine,
+                    threads=threads, dtype=dtype)
+                for written in blockwise.store_blocks(
+                        result_file.root, RESULT_NAME, nrows, blocks):
+                    conn.send(('progress', written))
+    except Exception:
+        conn.send(('error', traceback.format_exc()))
+    else:
+        conn.send(('done', None))
+    finally:
+        for h5file in files.values():
+            h5file.close()
+        conn.close()
@@ -11,7 +11,12 @@ from numpy import *
 
 def evaluate(statements, expression, globals_dict):
     """Evaluate expression and return results."""
+    return eval(expression, namespace(statements, globals_dict))
+
+
+def namespace(statements, globals_dict):
+    """Execute statements and return the namespace of expressions."""
     exec(statements)
     globals_dict.update(globals())
     globals_dict.update(locals())
-    return eval(expression, globals_dict)
+    return globals_dict
@@ -16,4 +16,5 @@
 #
 #       Author:  Vicent Mas - vmas@vitables.org
 
-__all__ = ['csvutils', 'export_csv', 'import_csv']
+__all__ = ['batch', 'csvparser', 'csvutils', 'csvwriter', 'export_csv',
+           'exportdlg', 'exportworker', 'import_csv', 'importdlg']
@@ -0,0 +1,358 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#       Copyright (C) 2008-2017 Vicent Mas. All rights reserved
+#
+#       This program is free software: you can redistribute it and/or modify
+#       it under the terms of the GNU General Public License as published by
+#       the Free Software Foundation, either version 3 of the License, or
+#       (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#       MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#       GNU General Public License for more details.
+#
+#       You should have received a copy of the GNU General Public License
+#       along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#       Author:  Vicent Mas - vmas@vitables.org
+
+"""Headless batch conversion between `CSV` and `PyTables` files.
+
+This module is the ``vitables-csv`` command line tool. It converts many
+files with no GUI (and no display)::
+
+    vitables-csv import [options] csvfile...
+    vitables-csv export [options] h5file...
+
+Files are imported with the same schema inference and parsing code that the
+`Import from CSV` actions use (see :mod:`vitables.csv.csvutils` and
+:mod:`vitables.csv.csvparser`), and exported with the writer used by the
+`Export to CSV` action (see :mod:`vitables.csv.csvwriter`).
+
+Files are converted in parallel by a pool of worker processes, one file per
+task. A single imported file is converted by the main process instead so its
+lines can be parsed in parallel.
+"""
+
+__docformat__ = 'restructuredtext'
+
+import argparse
+import logging
+import os
+import sys
+import time
+import traceback
+
+import tables
+
+import vitables.csv.csvparser as csvparser
+import vitables.csv.csvutils as csvutils
+import vitables.csv.csvwriter as csvwriter
+import vitables.csv.importdlg as importdlg
+import vitables.workerutils
+
+log = logging.getLogger(__name__)
+
+# The kinds of datasets that can be imported. Arrays are not supported
+# because they require the whole file to be loaded in memory
+IMPORT_KINDS = ('Table', 'EArray', 'CArray')
+
+# Map number of -v's on command line to logging level
+_VERBOSITY_LOGLEVEL_DICT = {0: logging.WARNING, 1: logging.INFO,
+                            2: logging.DEBUG}
+
+
+def destinationPath(filepath, output_dir, extension):
+    """Return the path of the file a source file is converted into.
+
+    :Parameters:
+
+    - `filepath`: the path of the source file
+    - `output_dir`: the directory of the converted file. By default, the
+      directory of the source file
+    - `extension`: the extension of the converted file
+    """
+
+    dirname, filename = os.path.split(filepath)
+    filename = csvparser.stripCompressionExtension(filename)
+    root = os.path.splitext(filename)[0]
+    if output_dir is not None:
+        dirname = output_dir
+    return os.path.join(dirname, root + extension)
+
+
+def importFile(csv_filepath, h5_filepath, kind, settings, header=False,
+               sample_lines=None, processes=1):
+    """Import a `CSV` file into a new `PyTables` file.
+
+    :Parameters:
+
+    - `csv_filepath`: the path of the `CSV` file
+    - `h5_filepath`: the path of the created `PyTables` file
+    - `kind`: the kind of the imported dataset, one of `IMPORT_KINDS`
+    - `settings`: the storage settings of the dataset. The chunkshape is
+      given as a string (see :func:`vitables.csv.importdlg.parseChunkshape`)
+    - `header`: True if the first line of tables whose fields are all strings
+      is a header. Headers of other tables are detected automatically
+    - `sample_lines`: the maximum number of lines scanned for finding out the
+      itemsizes of string columns. By default the whole file is scanned
+    - `processes`: the number of processes that parse the file
+
+    :Returns: the number of rows of the imported dataset
+    """
+
+    if os.path.exists(h5_filepath):
+        raise OSError('destination file {0} already exists'.format(
+            h5_filepath))
+    with csvparser.openFile(csv_filepath) as input_handler:
+        has_header = False
+        if kind == 'Table':
+            role = 'Header' if header else 'Data'
+            (nrows, description, has_header) = csvutils.tableInfo(
+                input_handler, sample_lines, lambda first_line: role)
+            shape = None
+        elif kind == 'EArray':
+            (nrows, description, shape) = csvutils.earrayInfo(
+                input_handler, sample_lines)
+        else:
+            (description, shape) = csvutils.carrayInfo(input_handler,
+                                                       sample_lines)
+            nrows = shape[0]
+        rank = 1 if shape is None else len(shape)
+        settings = dict(settings, chunkshape=importdlg.parseChunkshape(
+            settings['chunkshape'], rank))
+
+        title = 'Source CSV file {0}'.format(os.path.basename(csv_filepath))
+        try:
+            with tables.open_file(h5_filepath, 'w') as h5file:
+                dataset = csvutils.fillDataset(
+                    h5file, kind, description, shape, settings,
+                    lambda dtype, ncols: csvparser.parseFile(
+                        input_handler, has_header, dtype, ncols, processes),
+                    title, nrows)
+                return dataset.nrows
+        except BaseException:
+            os.remove(h5_filepath)
+            raise
+
+
+def exportFile(h5_filepath, output_dir=None, nodepaths=None,
+               add_header=False):
+    """Export the datasets of a `PyTables` file to `CSV` files.
+
+    Every dataset is written to its own file, named after the `PyTables`
+    file and the path of the dataset.
+
+    :Parameters:
+
+    - `h5_filepath`: the path of the `PyTables` file
+    - `output_dir`: the directory of the `CSV` files. By default, the
+      directory of the `PyTables` file
+    - `nodepaths`: the paths of the exported datasets. By default, all the
+      datasets that can be exported
+    - `add_header`: True if headers with the column names of tables are
+      written
+
+    :Returns: the number of rows exported
+    """
+
+    exported = 0
+    root = destinationPath(h5_filepath, output_dir, '')
+    with tables.open_file(h5_filepath, 'r') as h5file:
+        if nodepaths:
+            leaves = [h5file.get_node(nodepath) for nodepath in nodepaths]
+        else:
+            leaves = [leaf for leaf in h5file.walk_nodes('/', 'Leaf')
+                      if csvwriter.isExportable(leaf)]
+        for leaf in leaves:
+            if not csvwriter.isExportable(leaf):
+                raise ValueError('{0} cannot be exported to CSV'.format(
+                    leaf._v_pathname))
+            csv_filepath = '{0}{1}.csv'.format(
+                root, leaf._v_pathname.replace('/', '_'))
+            if os.path.exists(csv_filepath):
+                raise OSError('destination file {0} already exists'.format(
+                    csv_filepath))
+            try:
+                with open(csv_filepath, 'wb') as out_handler:
+                    for written in csvwriter.writeRows(
+                            out_handler, leaf, add_header=add_header):
+                        pass
+            except BaseException:
+                os.remove(csv_filepath)
+                raise
+            exported += written
+    return exported
+
+
+def runTask(task):
+    """Run a conversion task and report its result.
+
+    This is the function run by the worker processes of the pool.
+
+    :Parameter task: a tuple (source file, converting function, keyword
+      arguments of the function)
+
+    :Returns: a tuple (source file, number of rows converted, seconds, error
+      traceback or None)
+    """
+
+    (filepath, function, kwargs) = task
+    started = time.time()
+    try:
+        nrows = function(filepath, **kwargs)
+    except Exception:
+        return (filepath, 0, time.time() - started, traceback.format_exc())
+    return (filepath, nrows, time.time() - started, None)
+
+
+def runTasks(tasks, processes):
+    """Run conversion tasks in parallel and log their results.
+
+    :Parameters:
+
+    - `tasks`: a list of tasks (see :func:`runTask`)
+    - `processes`: the number of worker processes
+
+    :Returns: the number of failed tasks
+    """
+
+    if (len(tasks) < 2) or (processes < 2):
+        results = map(runTask, tasks)
+        pool = None
+    else:
+        pool = vitables.workerutils.startPool(min(processes, len(tasks)))
+        results = pool.imap_unordered(runTask, tasks)
+    failed = 0
+    try:
+        for (filepath, nrows, seconds, error) in results:
+            if error is None:
+                log.info('{0}: {1} rows converted in {2:.1f} s'.format(
+                    filepath, nrows, seconds))
+            else:
+                failed += 1
+                log.error('{0}: conversion failed\n{1}'.format(filepath,
+                                                               error))
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    return failed
+
+
+def importTasks(args):
+    """Return the tasks of an `import` command.
+
+    :Parameter args: the parsed command line
+    """
+
+    settings = {
+        'filters': tables.Filters(complevel=args.complevel,
+                                  complib=args.complib,
+                                  shuffle=not args.no_shuffle),
+        'chunkshape': args.chunkshape,
+    }
+    # A single file is parsed by all the processes
+    processes = args.jobs if len(args.files) == 1 else 1
+    return [(filepath, importFile,
+             {'h5_filepath': destinationPath(filepath, args.output_dir,
+                                             '.h5'),
+              'kind': args.kind, 'settings': settings,
+              'header': args.header, 'sample_lines': args.sample_lines,
+              'processes': processes})
+            for filepath in args.files]
+
+
+def exportTasks(args):
+    """Return the tasks of an `export` command.
+
+    :Parameter args: the parsed command line
+    """
+
+    return [(filepath, exportFile,
+             {'output_dir': args.output_dir, 'nodepaths': args.node,
+              'add_header': args.header})
+            for filepath in args.files]
+
+
+def _parse_command_line(argv=None):
+    """Create parser and parse command line."""
+
+    defaults = importdlg.defaultSettings()['filters']
+    parser = argparse.ArgumentParser(
+        prog='vitables-csv',
+        description='Convert CSV files to PyTables files and back.')
+    parser.add_argument('-j', '--jobs', type=int,
+                        default=os.cpu_count() or 1,
+                        help='number of worker processes (default: number '
+                        'of CPUs)')
+    parser.add_argument('-o', '--output-dir',
+                        help='directory of the converted files (default: '
+                        'the directory of every source file)')
+    parser.add_argument('-v', '--verbose', action='count', default=0,
+                        help='log verbosity level')
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    import_parser = commands.add_parser(
+        'import', help='import CSV files into new PyTables files')
+    import_parser.add_argument('-k', '--kind', choices=IMPORT_KINDS,
+                               default='Table',
+                               help='kind of the imported datasets')
+    import_parser.add_argument('--header', action='store_true',
+                               help='the first line of tables whose fields '
+                               'are all strings is a header')
+    import_parser.add_argument('--complib',
+                               choices=importdlg.availableComplibs(),
+                               default=defaults.complib,
+                               help='compression library')
+    import_parser.add_argument('--complevel', type=int, choices=range(10),
+                               default=defaults.complevel, metavar='0-9',
+                               help='compression level')
+    import_parser.add_argument('--no-shuffle', action='store_true',
+                               help='do not shuffle bytes before '
+                               'compressing')
+    import_parser.add_argument('--chunkshape', default='',
+                               help='comma separated chunk dimensions '
+                               '(default: automatic)')
+    import_parser.add_argument('--sample-lines', type=int,
+                               help='lines scanned for finding out the '
+                               'width of string columns (default: all)')
+    import_parser.add_argument('files', nargs='+', metavar='csvfile')
+    import_parser.set_defaults(tasks=importTasks)
+
+    export_parser = commands.add_parser(
+        'export', help='export datasets of PyTables files to CSV files')
+    export_parser.add_argument('-n', '--node', action='append',
+                               help='path of an exported dataset (default: '
+                               'all the datasets); can be repeated')
+    export_parser.add_argument('--header', action='store_true',
+                               help='write the column names of tables')
+    export_parser.add_argument('files', nargs='+', metavar='h5file')
+    export_parser.set_defaults(tasks=exportTasks)
+
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """The command line launcher.
+
+    :Parameter argv: the command line arguments. By default, `sys.argv`
+
+    :Returns: the exit status, the number of files that failed to convert
+    """
+
+    args = _parse_command_line(argv)
+    logging.basicConfig(
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        level=_VERBOSITY_LOGLEVEL_DICT.get(args.verbose, logging.DEBUG))
+    if (args.output_dir is not None) and \
+            not os.path.isdir(args.output_dir):
+        os.makedirs(args.output_dir)
+    return min(runTasks(args.tasks(args), args.jobs), 127)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
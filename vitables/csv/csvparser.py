@@ -0,0 +1,522 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#       Copyright (C) 2008-2017 Vicent Mas. All rights reserved
+#
+#       This program is free software: you can redistribute it and/or modify
+#       it under the terms of the GNU General Public License as published by
+#       the Free Software Foundation, either version 3 of the License, or
+#       (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#       MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#       GNU General Public License for more details.
+#
+#       You should have received a copy of the GNU General Public License
+#       along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#       Author:  Vicent Mas - vmas@vitables.org
+
+"""Streaming parser of `CSV` files.
+
+Once the description of the imported dataset is known, the lines of the
+`CSV` file are parsed block by block straight into typed ``numpy`` arrays.
+The ``C`` parser of ``pandas`` is used if it is available. Otherwise blocks of
+lines are parsed by `numpy.loadtxt`.
+
+Byte strings are stored UTF-8 encoded, as the rest of the import machinery
+does. The itemsizes of string columns are found out by :func:`scanFile` in a
+single pass over the file (or over a sample of its lines). If a string turns
+out to be wider than its column while the file is being parsed then a
+`ColumnOverflow` exception is raised so the dataset can be widened.
+
+Big files can be parsed in parallel by a pool of worker processes (see
+:func:`parseFile` and :func:`parallelBlocks`). The file is split into ranges
+of bytes aligned on line boundaries, every range is parsed by a worker and
+the resulting blocks are yielded in the order of the file so a single writer
+can append them to the dataset.
+
+Files compressed with ``gzip``, ``bzip2`` or ``xz`` are decompressed on the
+fly while they are read (see :func:`openFile`).
+
+Beware that this module doesn't import ``Qt`` so it can be used by worker
+processes.
+"""
+
+__docformat__ = 'restructuredtext'
+
+import bz2
+import collections
+import gzip
+import io
+import itertools
+import lzma
+import os
+
+import numpy
+
+import vitables.workerutils
+
+try:
+    import pandas
+except ImportError:
+    pandas = None
+
+# The number of rows of the blocks yielded by the parser
+BLOCK_ROWS = 10000
+
+# The size (in bytes) of the ranges of the file parsed by the tasks of
+# parallel imports
+RANGE_BYTES = 16 * 1024 * 1024
+
+# Plain files bigger than this (in bytes) are parsed by a pool of worker
+# processes
+PARALLEL_MIN_BYTES = 64 * 1024 * 1024
+
+# The supported compression formats. Every format has its magic bytes, its
+# file name extensions and the class of its decompressed streams
+COMPRESSIONS = {
+    'gzip': (b'\x1f\x8b', ('.gz', '.gzip'), gzip.GzipFile),
+    'bzip2': (b'BZh', ('.bz2', ), bz2.BZ2File),
+    'xz': (b'\xfd7zXZ\x00', ('.xz', ), lzma.LZMAFile),
+}
+
+
+class ColumnOverflow(ValueError):
+    """A string field is wider than the itemsize of its column.
+
+    :Parameters:
+
+    - `column`: the index of the overflowed column
+    - `width`: the length (in bytes) of the widest field of the block
+    """
+
+    def __init__(self, column, width):
+        """Setup the exception."""
+
+        super(ColumnOverflow, self).__init__(
+            'column {0} needs an itemsize of at least {1}'.format(column,
+                                                                  width))
+        self.column = column
+        self.width = width
+
+
+    def __reduce__(self):
+        """Make the exception picklable so workers can send it."""
+        return (ColumnOverflow, (self.column, self.width))
+
+
+class CompressedInput(io.TextIOWrapper):
+    """A text stream that decompresses a `CSV` file while it is read.
+
+    :Parameters:
+
+    - `filepath`: the path of the compressed file
+    - `compression`: the compression format, a key of `COMPRESSIONS`
+    """
+
+    def __init__(self, filepath, compression):
+        """Open the decompressed stream."""
+
+        stream = COMPRESSIONS[compression][2](filepath, 'rb')
+        super(CompressedInput, self).__init__(stream, encoding='utf-8')
+        self.filepath = filepath
+        self.compression = compression
+
+
+    @property
+    def name(self):
+        """The path of the compressed file."""
+        return self.filepath
+
+
+def compression(filepath):
+    """Return the compression format of a file.
+
+    The format is found out by the magic bytes at the beginning of the file
+    or, if the file is too short, by its extension.
+
+    :Parameter filepath: the path of the file
+
+    :Returns: a key of `COMPRESSIONS` or None for plain files
+    """
+
+    with open(filepath, 'rb') as handler:
+        head = handler.read(6)
+    for (name, (magic, extensions, stream_class)) in COMPRESSIONS.items():
+        if head.startswith(magic):
+            return name
+    if len(head) < 6:
+        extension = os.path.splitext(filepath)[1].lower()
+        for (name, (magic, extensions, stream_class)) in COMPRESSIONS.items():
+            if extension in extensions:
+                return name
+    return None
+
+
+def openFile(filepath):
+    """Open a `CSV` file for reading.
+
+    Compressed files are decompressed on the fly so they never have to be
+    decompressed to disk.
+
+    :Parameter filepath: the path of the `CSV` file
+
+    :Returns: a text file handler, a `CompressedInput` instance for compressed
+      files
+    """
+
+    file_compression = compression(filepath)
+    if file_compression is None:
+        return open(filepath, 'r', encoding='utf-8')
+    return CompressedInput(filepath, file_compression)
+
+
+def stripCompressionExtension(filename):
+    """Return a file name without the extension of its compression format.
+
+    :Parameter filename: the name of a file (e.g. ``data.csv.gz``)
+    """
+
+    (root, extension) = os.path.splitext(filename)
+    for (magic, extensions, stream_class) in COMPRESSIONS.values():
+        if extension.lower() in extensions:
+            return root
+    return filename
+
+
+def stringWidths(lines, columns):
+    """Return the maximum length of the fields of some columns.
+
+    Lengths are given in bytes of the UTF-8 encoded fields.
+
+    :Parameters:
+
+    - `lines`: a list of lines of the `CSV` file
+    - `columns`: the indices of the columns being measured
+
+    :Returns: a dictionary mapping column indices to lengths
+    """
+
+    widths = dict.fromkeys(columns, 0)
+    if pandas is not None:
+        chunk = pandas.read_csv(
+            io.StringIO(''.join(lines)), header=None, usecols=columns,
+            dtype=object, keep_default_na=False, comment='#', engine='c')
+        for column in columns:
+            if len(chunk):
+                widths[column] = int(
+                    chunk[column].str.encode('utf-8').str.len().max())
+        return widths
+
+    for line in lines:
+        fields = line.rstrip('\r\n').split(',')
+        for column in columns:
+            widths[column] = max(widths[column],
+                                 len(fields[column].encode('utf-8')))
+    return widths
+
+
+def scanFile(input_handler, columns, sample_lines=None,
+             block_rows=BLOCK_ROWS):
+    """Scan a `CSV` file in a single pass.
+
+    The widths of all the measured columns are found out at the same time,
+    block by block.
+
+    :Parameters:
+
+    - `input_handler`: the file handler of the `CSV` file, positioned at the
+      first line of data
+    - `columns`: the indices of the columns whose widths are measured (see
+      :func:`stringWidths`)
+    - `sample_lines`: the maximum number of lines scanned. By default the
+      whole file is scanned
+    - `block_rows`: the number of lines of every block
+
+    :Returns: a tuple (widths, number of lines scanned, number of bytes
+      scanned)
+    """
+
+    # Lines are measured in bytes so the number of lines of the file can be
+    # estimated from its size
+    encoding = getattr(input_handler, 'encoding', None) or 'utf-8'
+    widths = dict.fromkeys(columns, 0)
+    nlines = 0
+    nbytes = 0
+    while (sample_lines is None) or (nlines < sample_lines):
+        if sample_lines is not None:
+            block_rows = min(block_rows, sample_lines - nlines)
+        lines = list(itertools.islice(input_handler, block_rows))
+        if not lines:
+            break
+        nlines += len(lines)
+        nbytes += sum(len(line.encode(encoding)) for line in lines)
+        if columns:
+            for (column, width) in stringWidths(lines, columns).items():
+                widths[column] = max(widths[column], width)
+    return (widths, nlines, nbytes)
+
+
+def columnTypes(dtype, ncols=None):
+    """Return the dtypes of the columns of the `CSV` file.
+
+    :Parameters:
+
+    - `dtype`: the dtype of the rows of the imported dataset. It has a field
+      per column for tables and is a scalar dtype for arrays
+    - `ncols`: the number of columns of 2-dimensional arrays. It is None for
+      tables and 1-dimensional arrays
+    """
+
+    if dtype.names:
+        return [dtype.fields[name][0] for name in dtype.names]
+    return [dtype] * (ncols or 1)
+
+
+def pandasColumns(input_handler, coltypes, block_rows):
+    """Parse a `CSV` file with the ``pandas`` ``C`` parser.
+
+    Yields a list of column values per block of lines.
+
+    :Parameters:
+
+    - `input_handler`: the file handler of the `CSV` file, positioned at the
+      first line of data
+    - `coltypes`: the dtypes of the columns
+    - `block_rows`: the number of lines of every block
+    """
+
+    names = list(range(len(coltypes)))
+    # Strings are parsed as Python objects and encoded later. Only empty
+    # numeric fields are missing values
+    dtypes = dict((i, object if coltype.kind == 'S' else coltype)
+                  for (i, coltype) in enumerate(coltypes))
+    na_values = dict((i, ['']) for (i, coltype) in enumerate(coltypes)
+                     if coltype.kind == 'f')
+    reader = pandas.read_csv(
+        input_handler, header=None, names=names, dtype=dtypes,
+        keep_default_na=False, na_values=na_values, comment='#',
+        chunksize=block_rows, engine='c')
+    for chunk in reader:
+        yield [chunk[i].values for i in names]
+
+
+def numpyColumns(input_handler, coltypes, block_rows):
+    """Parse a `CSV` file with `numpy.loadtxt`.
+
+    Yields a list of column values per block of lines.
+
+    :Parameters:
+
+    - `input_handler`: the file handler of the `CSV` file, positioned at the
+      first line of data
+    - `coltypes`: the dtypes of the columns
+    - `block_rows`: the number of lines of every block
+    """
+
+    # Strings are parsed as Python objects and encoded later. Booleans are
+    # written as True/False
+    parse_dtype = []
+    converters = {}
+    for (i, coltype) in enumerate(coltypes):
+        if coltype.kind == 'S':
+            coltype = numpy.dtype(object)
+        elif coltype.kind == 'b':
+            converters[i] = lambda field: field.strip() == 'True'
+        parse_dtype.append(('f{0}'.format(i), coltype))
+    while True:
+        lines = list(itertools.islice(input_handler, block_rows))
+        if not lines:
+            break
+        data = numpy.loadtxt(lines, dtype=parse_dtype, delimiter=',',
+                             converters=converters, encoding='utf-8',
+                             ndmin=1)
+        yield [data[name] for (name, coltype) in parse_dtype]
+
+
+def readBlocks(input_handler, dtype, ncols=None, block_rows=BLOCK_ROWS):
+    """Parse the lines of a `CSV` file into blocks of typed rows.
+
+    Blocks are preallocated once and reused, so the yielded arrays are views
+    of a buffer that is overwritten by the next block. They must be written
+    to the dataset before requesting the next block.
+
+    A `ColumnOverflow` exception is raised if a string field doesn't fit in
+    its column.
+
+    :Parameters:
+
+    - `input_handler`: the file handler of the `CSV` file, positioned at the
+      first line of data (i.e. after the header, if any)
+    - `dtype`: the dtype of the rows of the imported dataset. It has a field
+      per column for tables and is a scalar dtype for arrays
+    - `ncols`: the number of columns of 2-dimensional arrays. It is None for
+      tables and 1-dimensional arrays
+    - `block_rows`: the maximum number of rows of every block
+    """
+
+    dtype = numpy.dtype(dtype)
+    coltypes = columnTypes(dtype, ncols)
+    if ncols is None:
+        buffer = numpy.empty(block_rows, dtype=dtype)
+    else:
+        buffer = numpy.empty((block_rows, ncols), dtype=dtype)
+    if pandas is not None:
+        blocks = pandasColumns(input_handler, coltypes, block_rows)
+    else:
+        blocks = numpyColumns(input_handler, coltypes, block_rows)
+    for columns in blocks:
+        block = buffer[:columns[0].shape[0]]
+        for (i, values) in enumerate(columns):
+            if coltypes[i].kind == 'S':
+                values = numpy.char.encode(values.astype(str), 'utf-8')
+                if values.dtype.itemsize > coltypes[i].itemsize:
+                    raise ColumnOverflow(i, values.dtype.itemsize)
+            if dtype.names:
+                block[dtype.names[i]] = values
+            elif ncols is None:
+                block[:] = values
+            else:
+                block[:, i] = values
+        yield block
+
+
+def byteRanges(filepath, skip_lines=0, range_bytes=RANGE_BYTES):
+    """Split a `CSV` file into ranges of bytes aligned on line boundaries.
+
+    :Parameters:
+
+    - `filepath`: the path of the `CSV` file
+    - `skip_lines`: the number of lines (i.e. the header) not included in
+      the ranges
+    - `range_bytes`: the approximate size of every range
+
+    :Returns: a list of tuples (start, stop) of byte offsets
+    """
+
+    filesize = os.path.getsize(filepath)
+    ranges = []
+    with open(filepath, 'rb') as handler:
+        for line in range(skip_lines):
+            handler.readline()
+        start = handler.tell()
+        while start < filesize:
+            # Move the end of the range to the end of its last line
+            handler.seek(min(start + range_bytes, filesize))
+            handler.readline()
+            stop = min(handler.tell(), filesize)
+            ranges.append((start, stop))
+            start = stop
+    return ranges
+
+
+def parseRange(filepath, start, stop, dtype, ncols=None):
+    """Parse a range of bytes of a `CSV` file into a block of typed rows.
+
+    This function is run by the worker processes of parallel imports.
+
+    :Parameters:
+
+    - `filepath`: the path of the `CSV` file
+    - `start`: the offset of the first line of the range
+    - `stop`: the offset of the end of the range. It must be aligned on a line
+      boundary
+    - `dtype`: the dtype of the rows of the imported dataset
+    - `ncols`: the number of columns of 2-dimensional arrays
+
+    :Returns: a ``numpy`` array with all the rows of the range
+    """
+
+    with open(filepath, 'rb') as handler:
+        handler.seek(start)
+        text = handler.read(stop - start).decode('utf-8')
+    # The range is parsed as a single block so the parsed array is returned
+    # with no copies
+    block_rows = text.count('\n') + 1
+    for block in readBlocks(io.StringIO(text), dtype, ncols, block_rows):
+        return block
+    dtype = numpy.dtype(dtype)
+    return numpy.empty((0, ) if ncols is None else (0, ncols), dtype=dtype)
+
+
+def parallelBlocks(pool, filepath, dtype, ncols=None, skip_lines=0,
+                   window=None, range_bytes=RANGE_BYTES):
+    """Parse a `CSV` file in parallel into blocks of typed rows.
+
+    Ranges of the file are parsed by a pool of worker processes. Blocks are
+    yielded in the order of the file. At most `window` ranges are parsed (or
+    waiting for being consumed) at the same time, so memory usage doesn't
+    grow if writing the blocks is slower than parsing them.
+
+    A `ColumnOverflow` exception is raised if a string field doesn't fit in
+    its column.
+
+    :Parameters:
+
+    - `pool`: a `multiprocessing.pool.Pool` instance
+    - `filepath`: the path of the `CSV` file
+    - `dtype`: the dtype of the rows of the imported dataset
+    - `ncols`: the number of columns of 2-dimensional arrays
+    - `skip_lines`: the number of lines at the beginning of the file that are
+      not imported (i.e. the header)
+    - `window`: the maximum number of pending ranges. By default, twice the
+      number of CPUs
+    - `range_bytes`: the approximate size of the parsed ranges
+    """
+
+    if window is None:
+        window = 2 * (os.cpu_count() or 1)
+    pending = collections.deque()
+    for (start, stop) in byteRanges(filepath, skip_lines, range_bytes):
+        pending.append(pool.apply_async(
+            parseRange, (filepath, start, stop, dtype, ncols)))
+        if len(pending) >= window:
+            block = pending.popleft().get()
+            if block.shape[0]:
+                yield block
+    while pending:
+        block = pending.popleft().get()
+        if block.shape[0]:
+            yield block
+
+
+def parseFile(input_handler, has_header, dtype, ncols=None, processes=None,
+              parallel_min_bytes=PARALLEL_MIN_BYTES):
+    """Parse an imported `CSV` file into blocks of typed rows.
+
+    Blocks are yielded in the order of the file. Plain files bigger than
+    `parallel_min_bytes` are parsed in parallel by a pool of worker processes
+    (see :func:`parallelBlocks`). Compressed files cannot be split so they are
+    parsed sequentially while they are decompressed.
+
+    :Parameters:
+
+    - `input_handler`: the file handler of the `CSV` file
+    - `has_header`: True if the first line of the file is a header
+    - `dtype`: the dtype of the rows of the imported dataset
+    - `ncols`: the number of columns of 2-dimensional arrays
+    - `processes`: the number of worker processes. By default, the number of
+      CPUs. With a single process the file is parsed sequentially
+    - `parallel_min_bytes`: the minimum size of files parsed in parallel
+    """
+
+    if processes is None:
+        processes = os.cpu_count() or 1
+    input_handler.seek(0)
+    if isinstance(input_handler, CompressedInput) or (processes < 2) or \
+            os.path.getsize(input_handler.name) < parallel_min_bytes:
+        if has_header:
+            # Skip the header line
+            input_handler.readline()
+        yield from readBlocks(input_handler, dtype, ncols)
+        return
+
+    pool = vitables.workerutils.startPool(processes)
+    try:
+        yield from parallelBlocks(pool, input_handler.name, dtype, ncols,
+                                  int(has_header))
+    finally:
+        pool.terminate()
+        pool.join()
@@ -27,9 +27,9 @@ __docformat__ = 'restructuredtext'
 import logging
 import os
 import re
-import tempfile
 import traceback
 import vitables.utils
+import vitables.csv.csvparser as csvparser
 
 import numpy
 from qtpy import QtWidgets
@@ -43,35 +43,101 @@ TYPE_ERROR = translate(
 
 log = logging.getLogger(__name__)
 
+# The number of lines sampled for estimating the number of rows of a file
+NROWS_SAMPLE_LINES = 1000
+
 
 def getArray(buf):
     """Fill an intermediate ``numpy`` array with data read from the `CSV` file.
 
-    The lines read from the CSV file are stored in a temporary file which is
-    passed to numpy.genfromtxt() in order to create a numpy array.
+    The lines read from the CSV file are passed to numpy.genfromtxt() in
+    order to create a numpy array. This is used for inspecting the `CSV` file
+    (finding out the dtypes of its columns), the data are imported by the
+    :mod:`vitables.csv.csvparser` module.
 
     The dtypes of the numpy array are determined by the contents of each column.
     Multidimensional columns will have string datatype.
 
-    Warning: the temporary file is written in binary mode so lines are stored
-    as bytearrays (encoded as UTF-8). It means that strings in the numpy array
-    will also be bytes with UTF-8 encoding and not Python 3 strings.
+    Warning: lines are passed as bytes (encoded as UTF-8). It means that
+    strings in the numpy array will also be bytes with UTF-8 encoding and not
+    Python 3 strings.
+
+    :Parameter buf: the data buffer is a list of lines of the CSV file (or a
+      single line)
+    """
+
+    if isinstance(buf, str):
+        buf = [buf]
+    return numpy.genfromtxt([line.encode('UTF-8') for line in buf],
+                            delimiter=',', dtype=None)
+
 
-    :Parameter buf: the data buffer is a list of lines of the CSV file
+def fieldName(value):
+    """Return the name of a column given the value of its header field.
+
+    :Parameter value: a field of the header line, as returned by
+      :func:`getArray`
     """
 
-    with tempfile.TemporaryFile(mode='w+b') as temp_file:
-        for line in buf:
-            temp_file.write(bytearray(line, 'UTF-8'))
-        temp_file.seek(0)
-        data = numpy.genfromtxt(temp_file, delimiter=',', dtype=None)
-    return data
+    if isinstance(value, bytes):
+        return value.decode('UTF-8')
+    return str(value)
+
+
+def scanStrings(input_handler, columns, has_header, sample_lines=None,
+                count_rows=False):
+    """Find out the itemsizes of string columns and the number of rows.
 
+    All the string columns are measured in a single pass over the file (see
+    :func:`vitables.csv.csvparser.scanFile`). If only a sample of lines is
+    scanned then the number of rows of the file is estimated from the mean
+    length of the sampled lines, unless `count_rows` is True. The size of
+    compressed files says little about their number of lines so the lines
+    after the sample are always counted (but not parsed) for them.
+
+    :Parameters:
+
+    - `input_handler`: the file handler of the inspected `CSV` file
+    - `columns`: the indices of the string columns
+    - `has_header`: True if the first line of the file is a header
+    - `sample_lines`: the maximum number of lines scanned. By default the
+      whole file is scanned
+    - `count_rows`: True if the number of rows must be exact
+
+    :Returns: a tuple (itemsizes, number of rows). Itemsizes are given as a
+      dictionary mapping column indices to itemsizes
+    """
+
+    input_handler.seek(0)
+    if has_header:
+        # Skip the header
+        input_handler.readline()
+    (widths, nrows, nbytes) = \
+        csvparser.scanFile(input_handler, columns, sample_lines)
+    if (sample_lines is not None) and (nrows == sample_lines):
+        if count_rows or \
+                isinstance(input_handler, csvparser.CompressedInput):
+            nrows += sum(1 for line in input_handler)
+        elif input_handler.readline():
+            filesize = os.path.getsize(input_handler.name)
+            nrows = int(filesize * nrows / nbytes)
+    input_handler.seek(0)
+    itemsizes = dict((column, max(1, width))
+                     for (column, width) in widths.items())
+    return (itemsizes, nrows)
 
-def tableInfo(input_handler):
+
+def tableInfo(input_handler, sample_lines=None, first_line_role=None):
     """Return useful information about the `tables.Table` being created.
 
-    :Parameter input_handler: the file handler of the inspected CSV file
+    :Parameters:
+
+    - `input_handler`: the file handler of the inspected CSV file
+    - `sample_lines`: the maximum number of lines scanned for finding out the
+      itemsizes of string columns. By default the whole file is scanned
+    - `first_line_role`: a callable that tells if the first line of a file
+      whose fields are all strings is a header (see :func:`askForHelp`). By
+      default the user is asked
     """
 
     # Inspect the CSV file reading its second line
@@ -84,26 +150,22 @@ def tableInfo(input_handler):
         # The second line cannot be read. We assume there is only on line
         second_line = first_line
 
-    # Estimate the number of rows of the CSV file
-    filesize = os.path.getsize(input_handler.name)
-    # Record size = number of elements * element size
-    record_size = second_line.size * second_line.itemsize
-    nrows = filesize / record_size
-
     if second_line.dtype.fields is None:
         # second_line is a homogeneous array
-        descr, has_header = \
-            homogeneousTableInfo(input_handler, first_line, second_line)
+        nrows, descr, has_header = homogeneousTableInfo(
+            input_handler, first_line, second_line, sample_lines,
+            first_line_role)
     else:
         # second_line is a heterogeneous array
-        descr, has_header = \
-            heterogeneousTableInfo(input_handler, first_line, second_line)
+        nrows, descr, has_header = heterogeneousTableInfo(
+            input_handler, first_line, second_line, sample_lines)
 
     del second_line
     return (nrows, descr, has_header)
 
 
-def heterogeneousTableInfo(input_handler, first_line, second_line):
+def heterogeneousTableInfo(input_handler, first_line, second_line,
+                           sample_lines=None):
     """Return useful information about the `tables.Table` being created.
 
     The `data` array is heterogenous, i.e. not all fields have the same
@@ -116,6 +178,8 @@ def heterogeneousTableInfo(input_handler, first_line, second_line):
       file
     - `second_line`: a ``numpy`` array which contains the second line of the
       `CSV` file
+    - `sample_lines`: the maximum number of lines scanned for finding out the
+      itemsizes of string columns. By default the whole file is scanned
     """
 
     has_header = False
@@ -123,53 +187,38 @@ def heterogeneousTableInfo(input_handler, first_line, second_line):
     if (fl_dtype.fields is None) and (fl_dtype.char in('S', 'U')):
         has_header = True
 
-    # Stuff used for finding out itemsizes of string fields
-    itemsizes = {}
-    for field in range(0, len(second_line.dtype)):
-        if second_line.dtype[field].name.startswith('str') or \
-                second_line.dtype[field].name.startswith('bytes'):
-            itemsizes[field] = 0
-
-    # If a dtype is a string, find out its biggest itemsize
-    if itemsizes:
-        buf_size = 1024 * 1024
-        input_handler.seek(0)
-        if has_header:
-            # Skip the header
-            input_handler.readline()
-        buf = input_handler.readlines(buf_size)
-        while buf:
-            temp_file = tempfile.TemporaryFile()
-            for line in buf:
-                temp_file.write(bytearray(line, 'UTF-8'))
-            for field in itemsizes.keys():
-                temp_file.seek(0)
-                idata = numpy.genfromtxt(temp_file, delimiter=',',
-                                         usecols=(field,), dtype=None)
-                itemsizes[field] = max(itemsizes[field], idata.dtype.itemsize)
-                del idata
-            temp_file.close()
-            buf = input_handler.readlines(buf_size)
+    # Find out the biggest itemsizes of the string fields. If there are no
+    # string fields a small sample is enough for estimating the number of
+    # rows
+    columns = [field for field in range(0, len(second_line.dtype))
+               if second_line.dtype[field].kind in ('S', 'U')]
+    if not columns:
+        sample_lines = NROWS_SAMPLE_LINES
+    itemsizes, nrows = \
+        scanStrings(input_handler, columns, has_header, sample_lines)
 
     if has_header:
         descr = {}
         for i in range(0, first_line.size):
             dtype = second_line.dtype.fields['f{0}'.format(i)][0]
-            descr[first_line[i].decode('UTF-8')] = tables.Col.from_dtype(dtype,
-                                                                         pos=i)
+            descr[fieldName(first_line[i])] = tables.Col.from_dtype(dtype,
+                                                                    pos=i)
         for i in itemsizes:
-            descr[first_line[i].decode(
-                'UTF-8')] = tables.StringCol(itemsizes[i], pos=i)
+            descr[fieldName(first_line[i])] = tables.StringCol(itemsizes[i],
+                                                               pos=i)
     else:
-        descr = dict([(f, tables.Col.from_dtype(t[0])) for f, t in
-                      second_line.dtype.fields.items()])
+        # Positions keep the columns in the order of the CSV file (with no
+        # positions f10 would come before f2)
+        descr = dict([(f, tables.Col.from_dtype(t[0], pos=i)) for i, (f, t) in
+                      enumerate(second_line.dtype.fields.items())])
         for i in itemsizes:
-            descr['f{0}'.format(i)] = tables.StringCol(itemsizes[i])
+            descr['f{0}'.format(i)] = tables.StringCol(itemsizes[i], pos=i)
 
-    return descr, has_header
+    return nrows, descr, has_header
 
 
-def homogeneousTableInfo(input_handler, first_line, second_line):
+def homogeneousTableInfo(input_handler, first_line, second_line,
+                         sample_lines=None, first_line_role=None):
     """Return useful information about the `tables.Table` being created.
 
     The `second_line` array is homegenous, i.e. all fields have the same dtype.
@@ -179,40 +228,26 @@ def homogeneousTableInfo(input_handler, first_line, second_line):
     - `input_handler`: the file handler of the inspected `CSV` file
     - `first_line`: a ``numpy`` array which contains the first line of the
       `CSV` file
-    - `second_line`: a ``numpy`` array which contains the second line of the 
+    - `second_line`: a ``numpy`` array which contains the second line of the
       `CSV` file
+    - `sample_lines`: the maximum number of lines scanned for finding out the
+      itemsizes of string columns. By default the whole file is scanned
+    - `first_line_role`: a callable that tells if the first line is a header
+      when all fields are strings. By default the user is asked
     """
 
     # Find out if the table has a header or not.
     has_header = False
-    fldn = first_line.dtype.name
-    sldn = second_line.dtype.name
-    if sldn.startswith('str') or sldn.startswith('bytes'):
-        answer = askForHelp(first_line)
+    is_string = second_line.dtype.kind in ('S', 'U')
+    if is_string:
+        if first_line_role is None:
+            first_line_role = askForHelp
+        answer = first_line_role(first_line)
         if answer == 'Header':
             has_header = True
-    elif fldn.startswith('str') or fldn.startswith('bytes'):
+    elif first_line.dtype.kind in ('S', 'U'):
         has_header = True
 
-    input_handler.seek(0)
-    if has_header:
-        # Skip the header
-        input_handler.readline()
-
-    # If the fields of the table are strings then find out the biggest itemsize
-    if sldn.startswith('str') or sldn.startswith('bytes'):
-        itemsize = 0
-        buf_size = 1024 * 1024
-        buf = input_handler.readlines(buf_size)
-        if not buf:
-            # If the CSV file contains just one line
-            itemsize = first_line.dtype.itemsize
-        while buf:
-            idata = getArray(buf)
-            itemsize = max(itemsize, idata.dtype.itemsize)
-            del idata
-            buf = input_handler.readlines(buf_size)
-
     # Iterate over the data fields and make the table description
     # If the CSV file contains just one field then first_line is a
     # scalar array and cannot be iterated so we reshape it
@@ -220,25 +255,29 @@ def homogeneousTableInfo(input_handler, first_line, second_line):
         first_line = first_line.reshape(1,)
     indices = list(range(0, first_line.shape[0]))
 
+    # If the fields of the table are strings then find out the biggest
+    # itemsize
+    if is_string:
+        itemsizes, nrows = \
+            scanStrings(input_handler, indices, has_header, sample_lines)
+        itemsize = max(itemsizes.values())
+    else:
+        itemsizes, nrows = \
+            scanStrings(input_handler, [], has_header, NROWS_SAMPLE_LINES)
+
     if has_header:
-        if sldn.startswith('str') or sldn.startswith('bytes'):
-            descr = dict([(first_line[i].decode('UTF-8'),
-                           tables.StringCol(itemsize, pos=i))
-                          for i in indices])
-        else:
-            descr = dict([(first_line[i].decode('UTF-8'),
-                           tables.Col.from_dtype(second_line.dtype, pos=i))
-                          for i in indices])
+        names = [fieldName(first_line[i]) for i in indices]
+    else:
+        names = ['f{0}'.format(field) for field in indices]
+    if is_string:
+        descr = dict([(names[i], tables.StringCol(itemsize, pos=i))
+                      for i in indices])
     else:
-        if sldn.startswith('str') or sldn.startswith('bytes'):
-            descr = dict([('f{0}'.format(field), tables.StringCol(itemsize))
-                          for field in indices])
-        else:
-            descr = dict([('f{0}'.format(field),
-                           tables.Col.from_dtype(second_line.dtype))
-                          for field in indices])
+        descr = dict([(names[i],
+                       tables.Col.from_dtype(second_line.dtype, pos=i))
+                      for i in indices])
 
-    return descr, has_header
+    return nrows, descr, has_header
 
 
 def askForHelp(first_line):
@@ -270,10 +309,45 @@ def askForHelp(first_line):
     return vitables.utils.questionBox(title, text, itext, dtext, buttons)
 
 
-def earrayInfo(input_handler):
+def widenColumn(descr, overflow):
+    """Widen the string column of a table description that overflowed.
+
+    The itemsize is (at least) doubled so a sampled inspection of the file
+    doesn't lead to a restart per new longer string.
+
+    :Parameters:
+
+    - `descr`: the table description, a dictionary of `tables.Col` instances
+    - `overflow`: the `vitables.csv.csvparser.ColumnOverflow` exception
+    """
+
+    for (name, col) in descr.items():
+        if col._v_pos == overflow.column:
+            itemsize = max(overflow.width, 2 * col.itemsize)
+            descr[name] = tables.StringCol(itemsize, pos=col._v_pos)
+    return descr
+
+
+def widenAtom(atom, overflow):
+    """Return a string atom wide enough for an overflowed array.
+
+    :Parameters:
+
+    - `atom`: the `tables.StringAtom` of the array
+    - `overflow`: the `vitables.csv.csvparser.ColumnOverflow` exception
+    """
+
+    return tables.StringAtom(max(overflow.width, 2 * atom.itemsize))
+
+
+def earrayInfo(input_handler, sample_lines=None):
     """Return useful information about the `tables.EArray` being created.
 
-    :Parameter input_handler: the file handler of the inspected file
+    :Parameters:
+
+    - `input_handler`: the file handler of the inspected file
+    - `sample_lines`: the maximum number of lines scanned for finding out the
+      itemsize of string arrays. By default the whole file is scanned
     """
 
     # Inspect the CSV file reading its first line
@@ -281,25 +355,15 @@ def earrayInfo(input_handler):
     # Multidimensional columns will have string datatype
     first_line = getArray(input_handler.readline())
 
-    # Estimate the number of rows of the file
-    filesize = os.path.getsize(input_handler.name)
-    record_size = first_line.size * first_line.itemsize
-    nrows = filesize / record_size
-
-    if first_line.dtype.name.startswith('str') or \
-            first_line.dtype.name.startswith('bytes'):
+    if first_line.dtype.kind in ('S', 'U'):
         # Find out the biggest itemsize
-        itemsize = 0
-        buf_size = 1024 * 1024
-        input_handler.seek(0)
-        buf = input_handler.readlines(buf_size)
-        while buf:
-            idata = getArray(buf)
-            itemsize = max(itemsize, idata.dtype.itemsize)
-            del idata
-            buf = input_handler.readlines(buf_size)
-        atom = tables.StringAtom(itemsize)
+        itemsizes, nrows = scanStrings(
+            input_handler, list(range(first_line.size)), False, sample_lines)
+        atom = tables.StringAtom(max(itemsizes.values()))
     else:
+        # Estimate the number of rows of the file
+        itemsizes, nrows = \
+            scanStrings(input_handler, [], False, NROWS_SAMPLE_LINES)
         # With compound dtypes this will raise a ValueError
         atom = tables.Atom.from_dtype(first_line.dtype)
 
@@ -319,10 +383,18 @@ def earrayInfo(input_handler):
     return nrows, atom, array_shape
 
 
-def carrayInfo(input_handler):
+def carrayInfo(input_handler, sample_lines=None):
     """Return useful information about the `tables.CArray` being created.
 
-    :Parameter input_handler: the file handler of the inspected file
+    The number of rows of a `tables.CArray` must be known in advance so the
+    whole file is always read. But, if `sample_lines` is given, only the
+    sampled lines are parsed, the rest of lines are just counted.
+
+    :Parameters:
+
+    - `input_handler`: the file handler of the inspected file
+    - `sample_lines`: the maximum number of lines scanned for finding out the
+      itemsize of string arrays. By default the whole file is scanned
     """
 
     # Inspect the CSV file reading its first line
@@ -331,33 +403,16 @@ def carrayInfo(input_handler):
     input_handler.seek(0)
     first_line = getArray(input_handler.readline())
 
-    # This counting algorithm is faster than looping over lines with
-    # fh.readline and incrementing a counter at every step
-    lines = 0
-    itemsize = 0
-    buf_size = 1024 * 1024
-    input_handler.seek(0)
-
-    if first_line.dtype.name.startswith('str') or \
-            first_line.dtype.name.startswith('bytes'):
+    if first_line.dtype.kind in ('S', 'U'):
         # Count lines and find out the biggest itemsize
-        buf = input_handler.readlines(buf_size)
-        while buf:
-            idata = getArray(buf)
-            itemsize = max(itemsize, idata.dtype.itemsize)
-            del idata
-            lines += len(buf)
-            buf = input_handler.readlines(buf_size)
+        itemsizes, lines = scanStrings(
+            input_handler, list(range(first_line.size)), False, sample_lines,
+            count_rows=True)
+        atom = tables.StringAtom(max(itemsizes.values()))
     else:
         # Count lines
-        buf = input_handler.readlines(buf_size)
-        while buf:
-            lines += len(buf)
-            buf = input_handler.readlines(buf_size)
-
-    if itemsize:
-        atom = tables.StringAtom(itemsize)
-    else:
+        itemsizes, lines = \
+            scanStrings(input_handler, [], False, 0, count_rows=True)
         atom = tables.Atom.from_dtype(first_line.dtype)
 
     # Get the data shape
@@ -377,6 +432,83 @@ def carrayInfo(input_handler):
     return atom, array_shape
 
 
+def createDataset(h5file, kind, description, shape, settings, title='',
+                  expectedrows=None):
+    """Create the dataset where a `CSV` file is imported.
+
+    :Parameters:
+
+    - `h5file`: the `tables.File` where the dataset is created
+    - `kind`: the kind of dataset, `Table`, `EArray` or `CArray`
+    - `description`: the description of tables or the atom of arrays
+    - `shape`: the shape of arrays
+    - `settings`: a dictionary with the `filters` and the `chunkshape` (None
+      means automatic) of the dataset
+    - `title`: the title of the dataset
+    - `expectedrows`: the estimated number of rows of tables and `EArrays`
+    """
+
+    kwargs = {'title': title, 'filters': settings['filters'],
+              'chunkshape': settings['chunkshape']}
+    if (expectedrows is not None) and (kind != 'CArray'):
+        kwargs['expectedrows'] = max(1, int(expectedrows))
+    name = 'imported_{0}'.format(kind)
+    if kind == 'Table':
+        return h5file.create_table('/', name, description, **kwargs)
+    elif kind == 'EArray':
+        return h5file.create_earray('/', name, description, shape, **kwargs)
+    return h5file.create_carray('/', name, description, shape, **kwargs)
+
+
+def fillDataset(h5file, kind, description, shape, settings, parse, title='',
+                expectedrows=None):
+    """Create the dataset where a `CSV` file is imported and fill it.
+
+    If a string wider than its column shows up while the file is parsed then
+    the dataset is removed and created again with a wider column.
+
+    :Parameters:
+
+    - `h5file`: the `tables.File` where the dataset is created
+    - `kind`: the kind of dataset, `Table`, `EArray` or `CArray`
+    - `description`: the description of tables or the atom of arrays
+    - `shape`: the shape of arrays
+    - `settings`: the storage settings (see :func:`createDataset`)
+    - `parse`: a callable that is given the dtype of the rows and the number
+      of columns of 2-dimensional arrays (or None) and returns the blocks of
+      rows of the file (see :func:`vitables.csv.csvparser.parseFile`)
+    - `title`: the title of the dataset
+    - `expectedrows`: the estimated number of rows of tables and `EArrays`
+
+    :Returns: the filled dataset
+    """
+
+    ncols = shape[1] if (shape is not None) and len(shape) > 1 else None
+    while True:
+        dataset = createDataset(h5file, kind, description, shape, settings,
+                                title, expectedrows)
+        # Fill the dataset in a memory efficient way
+        start = 0
+        try:
+            for block in parse(dataset.dtype, ncols):
+                if kind == 'CArray':
+                    stop = start + block.shape[0]
+                    dataset[start:stop] = block
+                    start = stop
+                else:
+                    dataset.append(block)
+        except csvparser.ColumnOverflow as overflow:
+            # A string wider than the sampled ones has been found.
+            # Start again with a wider column
+            if kind == 'Table':
+                description = widenColumn(description, overflow)
+            else:
+                description = widenAtom(description, overflow)
+            dataset._f_remove()
+            continue
+        return dataset
+
+
 def isValidFilepath(filepath):
     """Check the filepath of the destination file.
 
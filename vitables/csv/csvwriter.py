@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#       Copyright (C) 2008-2017 Vicent Mas. All rights reserved
+#
+#       This program is free software: you can redistribute it and/or modify
+#       it under the terms of the GNU General Public License as published by
+#       the Free Software Foundation, either version 3 of the License, or
+#       (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#       MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#       GNU General Public License for more details.
+#
+#       You should have received a copy of the GNU General Public License
+#       along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#       Author:  Vicent Mas - vmas@vitables.org
+
+"""Vectorised writer of `CSV` files.
+
+Datasets are exported block by block. Every block is formatted column by
+column with ``numpy`` string operations (no Python code runs per element)
+and written to the `CSV` file as a single chunk of bytes.
+
+A range of rows (start, stop and step) and a subset of columns can be
+exported. Columns are the (scalar) columns of tables, given by their
+pathnames, and the columns of 2-dimensional arrays, given by their indices.
+
+Strings are written UTF-8 encoded, as the import machinery expects them.
+
+``pandas`` frames are written chunk by chunk with `DataFrame.to_csv` (see
+:func:`writeFrameRows`).
+
+Beware that this module doesn't import ``Qt`` so it can be used by worker
+processes.
+"""
+
+__docformat__ = 'restructuredtext'
+
+import numpy
+import tables
+
+# The number of rows of the blocks read from the exported dataset
+BLOCK_ROWS = 100000
+
+
+def tableColumns(table):
+    """Return the pathnames of the columns of a table that can be exported.
+
+    Multidimensional columns cannot be written in a single `CSV` field so
+    they are left out.
+
+    :Parameter table: a `tables.Table` instance
+    """
+
+    return [colpath for colpath in table.colpathnames
+            if table.coldescrs[colpath].shape == ()]
+
+
+def isExportable(leaf):
+    """Return True if a dataset can be exported to a `CSV` file.
+
+    Empty datasets, scalar arrays, arrays with more than 3 dimensions,
+    `VLArrays` and tables without scalar columns cannot be exported.
+
+    :Parameter leaf: a `tables.Leaf` instance
+    """
+
+    if isinstance(leaf, tables.Table):
+        return (leaf.nrows > 0) and bool(tableColumns(leaf))
+    if not isinstance(leaf, tables.Array):
+        return False
+    return (0 < len(leaf.shape) <= 3) and (leaf.nrows > 0)
+
+
+def rowsRange(leaf, start=0, stop=None, step=1):
+    """Return the exported range of rows of a dataset as a `range`.
+
+    :Parameters:
+
+    - `leaf`: the exported dataset
+    - `start`: the first exported row
+    - `stop`: the last exported row (not included). By default the last row
+      of the dataset
+    - `step`: the distance between exported rows
+    """
+
+    return range(*slice(start, stop, step).indices(leaf.nrows))
+
+
+def formatColumn(values):
+    """Format the fields of a column.
+
+    :Parameter values: a 1-dimensional array with the values of the column
+
+    :Returns: an array of UTF-8 encoded fields (dtype ``S``)
+    """
+
+    kind = values.dtype.kind
+    if kind == 'S':
+        return values
+    elif kind == 'U':
+        return numpy.char.encode(values, 'utf-8')
+    elif kind == 'O':
+        return numpy.char.encode(values.astype(str), 'utf-8')
+    return values.astype('S')
+
+
+def blockColumns(leaf, block, columns=None):
+    """Split a block of rows of a dataset into the exported columns.
+
+    :Parameters:
+
+    - `leaf`: the exported dataset
+    - `block`: a block of rows read from the dataset
+    - `columns`: the exported columns. By default all columns
+
+    :Returns: a list of 1-dimensional arrays
+    """
+
+    if isinstance(leaf, tables.Table):
+        if columns is None:
+            columns = tableColumns(leaf)
+        values = []
+        for colpath in columns:
+            column = block
+            for field in colpath.split('/'):
+                column = column[field]
+            values.append(column)
+        return values
+
+    if block.ndim == 1:
+        return [block]
+    # Dimensions beyond the second one are flattened
+    block = block.reshape(block.shape[0], -1)
+    if columns is None:
+        columns = range(block.shape[1])
+    return [block[:, column] for column in columns]
+
+
+def formatBlock(columns):
+    """Format a block of rows as lines of a `CSV` file.
+
+    :Parameter columns: the columns of the block (see :func:`blockColumns`)
+
+    :Returns: the lines of the block, as bytes
+    """
+
+    lines = formatColumn(columns[0])
+    for values in columns[1:]:
+        lines = numpy.char.add(numpy.char.add(lines, b','),
+                               formatColumn(values))
+    return b'\n'.join(lines.tolist()) + b'\n'
+
+
+def header(leaf, columns=None):
+    """Return the header line of an exported table.
+
+    :Parameters:
+
+    - `leaf`: the exported table
+    - `columns`: the exported columns. By default all columns
+    """
+
+    if columns is None:
+        columns = tableColumns(leaf)
+    return (','.join(columns) + '\n').encode('utf-8')
+
+
+def writeRows(out_handler, leaf, start=0, stop=None, step=1, columns=None,
+              add_header=False, block_rows=BLOCK_ROWS):
+    """Write a range of rows of a dataset to a `CSV` file.
+
+    This is a generator. It yields the number of rows written so far after
+    every block so callers can report progress or stop the export.
+
+    :Parameters:
+
+    - `out_handler`: the `CSV` file, opened in binary mode
+    - `leaf`: the exported dataset
+    - `start`: the first exported row
+    - `stop`: the last exported row (not included). By default the last row
+      of the dataset
+    - `step`: the distance between exported rows
+    - `columns`: the exported columns, pathnames for tables and indices for
+      arrays. By default all columns
+    - `add_header`: True if a header with the column names is written. Only
+      tables have headers
+    - `block_rows`: the maximum number of rows of every block
+    """
+
+    if add_header and isinstance(leaf, tables.Table):
+        out_handler.write(header(leaf, columns))
+    rows = rowsRange(leaf, start, stop, step)
+    written = 0
+    for first in range(0, len(rows), block_rows):
+        block_range = rows[first:first + block_rows]
+        block = leaf.read(block_range[0], block_range[-1] + 1,
+                          block_range.step)
+        out_handler.write(formatBlock(blockColumns(leaf, block, columns)))
+        written += len(block_range)
+        yield written
+
+
+def frameRows(hstore, key, coordinates=None):
+    """Return the number of rows of an exported ``pandas`` frame.
+
+    :Parameters:
+
+    - `hstore`: the `pandas.HDFStore` of the file
+    - `key`: the path of the frame
+    - `coordinates`: the coordinates of the exported rows. By default all
+      rows are exported
+    """
+
+    if coordinates is not None:
+        return len(coordinates)
+    storer = hstore.get_storer(key)
+    if storer.is_table:
+        return int(storer.nrows)
+    return int(storer.shape[0])
+
+
+def frameChunks(hstore, key, coordinates=None, chunk_rows=BLOCK_ROWS):
+    """Read a ``pandas`` frame in chunks.
+
+    Frames stored in fixed format cannot be read in chunks so they are read
+    at once.
+
+    :Parameters:
+
+    - `hstore`: the `pandas.HDFStore` of the file
+    - `key`: the path of the frame
+    - `coordinates`: the coordinates of the exported rows. By default all
+      rows are exported
+    - `chunk_rows`: the maximum number of rows of every chunk
+    """
+
+    if coordinates is not None:
+        for start in range(0, len(coordinates), chunk_rows):
+            yield hstore.select(
+                key, where=coordinates[start:start + chunk_rows])
+    elif hstore.get_storer(key).is_table:
+        for chunk in hstore.select(key, iterator=True,
+                                   chunksize=chunk_rows):
+            yield chunk
+    else:
+        yield hstore.select(key)
+
+
+def writeFrameRows(out_handler, hstore, key, coordinates=None,
+                   add_header=False, chunk_rows=BLOCK_ROWS):
+    """Write the rows of a ``pandas`` frame to a `CSV` file.
+
+    This is a generator. It yields the number of rows written so far after
+    every chunk.
+
+    :Parameters:
+
+    - `out_handler`: the `CSV` file, opened in binary mode
+    - `hstore`: the `pandas.HDFStore` of the file
+    - `key`: the path of the frame
+    - `coordinates`: the coordinates of the exported rows. By default all
+      rows are exported
+    - `add_header`: True if a header with the column names is written
+    - `chunk_rows`: the maximum number of rows of every chunk
+    """
+
+    written = 0
+    for chunk in frameChunks(hstore, key, coordinates, chunk_rows):
+        chunk.to_csv(out_handler, header=add_header and not written,
+                     encoding='utf-8')
+        written += len(chunk)
+        yield written
@@ -19,25 +19,45 @@
 
 When exporting tables, a header with the field names can be inserted.
 
-In general, tables/arrays with Ndimensional fields are not exported because they
-are not written by np.savetxt() in a way compliant with the CSV format in which
-each line of the file is a data record.
+The `Export View to CSV` action exports the rows displayed by the active
+view instead of the whole dataset. Views of filtered ``pandas`` frames
+export their rows streaming the coordinates of the view in blocks.
+
+A range of rows and a subset of the columns of tables and 2-dimensional
+arrays can be exported. Blocks of rows are formatted with vectorised
+``numpy`` string operations by the :mod:`vitables.csv.csvwriter` module.
+
+Multidimensional fields of tables are not exported because they cannot be
+written in a way compliant with the CSV format in which each line of the file
+is a data record. The dimensions of arrays beyond the second one are
+flattened.
 
 Neither numpy scalar arrays are exported.
+
+Exports run in worker processes (see :mod:`vitables.csv.exportworker`) that
+open the exported file in read-only mode on their own, so the GUI keeps
+responsive. A progress dialog reports the rows and bytes written and the
+throughput of every export, and can cancel it (the partially written file
+is removed).
 """
 
 
 import logging
 import os
+import time
 
-import numpy
 import tables
 from qtpy import QtCore
 from qtpy import QtGui
 from qtpy import QtWidgets
 
 import vitables.csv.csvutils as csvutils
+import vitables.csv.csvwriter as csvwriter
+import vitables.csv.exportdlg as exportdlg
+import vitables.csv.exportworker as exportworker
 import vitables.utils
+import vitables.workerutils
+from vitables.vttables import df_model
 
 __docformat__ = 'restructuredtext'
 
@@ -45,6 +65,132 @@ translate = QtWidgets.QApplication.translate
 
 log = logging.getLogger(__name__)
 
+# Arrays with more columns than this cannot be exported column by column
+MAX_LISTED_COLUMNS = 1000
+
+# Interval (in milliseconds) between two consecutive reads of the pipe
+# connected to an export worker process
+POLL_INTERVAL = 100
+
+# Resolution of the export progress bars (datasets can have more rows than
+# the maximum value of a progress bar)
+PROGRESS_STEPS = 1000
+
+
+class ExportJob(QtCore.QObject):
+    """An export of a dataset running in a worker process.
+
+    The progress sent by the worker process is read periodically (using a
+    timer) by the GUI process.
+
+    :Parameters:
+
+    - `filepath`: the full path of the file where the dataset lives
+    - `nodepath`: the path of the dataset within its file
+    - `csv_filepath`: the full path of the `CSV` file
+    - `options`: the export options (see
+      :func:`vitables.csv.exportworker.exportDataset`)
+    - `rows_total`: the number of rows being exported
+    """
+
+    # Rows written, bytes written and throughput (rows/s) of the export
+    export_progress = QtCore.Signal(object, object, float,
+                                    name="exportProgress")
+    export_completed = QtCore.Signal(bool, str, name="exportCompleted")
+
+    def __init__(self, filepath, nodepath, csv_filepath, options,
+                 rows_total):
+        """Initialise the export."""
+
+        super(ExportJob, self).__init__()
+
+        self.filepath = filepath
+        self.nodepath = nodepath
+        self.csv_filepath = csv_filepath
+        self.options = options
+        self.rows_total = rows_total
+        self.rows_written = 0
+        self.bytes_written = 0
+        self.start_time = None
+        self.cancelled = False
+
+        # The worker process and the receiving end of the pipe connected to
+        # it
+        self.worker = None
+        self.conn = None
+
+        self.timer = QtCore.QTimer(self)
+        self.timer.timeout.connect(self.readProgress)
+
+    def run(self):
+        """Launch the worker process that exports the dataset."""
+
+        self.start_time = time.time()
+        self.worker, self.conn = vitables.workerutils.startWorker(
+            exportworker.exportDataset,
+            (self.filepath, self.nodepath, self.csv_filepath, self.options))
+        self.timer.start(POLL_INTERVAL)
+
+    def elapsed(self):
+        """Return the time (in seconds) elapsed since the export started."""
+        return time.time() - self.start_time
+
+    def readProgress(self):
+        """Read the messages sent by the worker process.
+
+        This is a slot called periodically by the export timer.
+        """
+
+        try:
+            while self.conn.poll():
+                kind, content = self.conn.recv()
+                if kind == 'progress':
+                    (self.rows_written, self.bytes_written) = content
+                elif kind == 'done':
+                    (self.rows_written, self.bytes_written) = content
+                    self.finish(True)
+                    return
+                else:
+                    log.error(content)
+                    self.finish(False)
+                    return
+        except (EOFError, OSError):
+            # The worker process died unexpectedly
+            vitables.utils.formatExceptionInfo()
+            self.finish(False)
+            return
+
+        elapsed = self.elapsed()
+        throughput = self.rows_written / elapsed if elapsed > 0 else 0.0
+        self.export_progress.emit(self.rows_written, self.bytes_written,
+                                  throughput)
+
+    def cancel(self):
+        """Stop the export and remove the partially written file.
+
+        This is a slot called when the user cancels the export. Calls done
+        after the export has finished are ignored.
+        """
+
+        if not self.timer.isActive():
+            return
+        self.cancelled = True
+        self.worker.terminate()
+        self.finish(False)
+
+    def finish(self, completed):
+        """Release the worker process.
+
+        :Parameter completed: whether the export has been succesful or not
+        """
+
+        self.timer.stop()
+        self.conn.close()
+        self.worker.join()
+        if (not completed) and os.path.exists(self.csv_filepath):
+            os.remove(self.csv_filepath)
+        self.export_completed.emit(completed, self.csv_filepath)
+
 
 class ExportToCSV(QtCore.QObject):
     """Provides `CSV` export capabilities for arrays.
@@ -56,6 +202,10 @@ class ExportToCSV(QtCore.QObject):
 
         super(ExportToCSV, self).__init__()
 
+        # The running exports and their progress dialogs, keyed by the path
+        # of the CSV file
+        self.jobs = {}
+
         # Get a reference to the application instance
         self.vtapp = vitables.utils.getVTApp()
         if self.vtapp is None:
@@ -87,8 +237,25 @@ class ExportToCSV(QtCore.QObject):
                 "Status bar text for the Dataset -> Export to CSV... action"))
         self.export_csv_action.setObjectName('export_csv')
 
-        # Add the action to the Dataset menu
-        vitables.utils.addToMenu(self.vtgui.dataset_menu, self.export_csv_action)
+        self.export_view_action = QtWidgets.QAction(
+            translate('ExportToCSV', "Export &View to CSV...",
+                      "Save the rows of the active view as CSV"),
+            self,
+            shortcut=QtGui.QKeySequence.UnknownKey,
+            triggered=self.exportView,
+            icon=vitables.utils.getIcons()['document-export'],
+            statusTip=translate(
+                'ExportToCSV',
+                "Save the rows displayed by the active view as a plain text "
+                "with CSV format",
+                "Status bar text for the Dataset -> Export View to CSV... "
+                "action"))
+        self.export_view_action.setObjectName('export_view_csv')
+
+        # Add the actions to the Dataset menu
+        vitables.utils.addToMenu(self.vtgui.dataset_menu,
+                                 [self.export_csv_action,
+                                  self.export_view_action])
 
         # Add the action to the leaf context menu
         vitables.utils.addToLeafContextMenu(self.export_csv_action)
@@ -107,6 +274,14 @@ class ExportToCSV(QtCore.QObject):
                 enabled = False
 
         self.export_csv_action.setEnabled(enabled)
+        self.export_view_action.setEnabled(self.activeModel() is not None)
+
+    def activeModel(self):
+        """Return the model of the active view or None if there is no view.
+        """
+
+        subwindow = self.vtgui.workspace.activeSubWindow()
+        return getattr(subwindow, 'leaf_model', None)
 
     def getExportInfo(self, is_table):
         """Get info about the file where dataset will be stored.
@@ -187,24 +362,161 @@ class ExportToCSV(QtCore.QObject):
 
         return filepath, add_header
 
-    # def _try_exporting_dataframe(self, leaf):
-    #     ## FIXME: Hack to export to csv.
-    #     #
-    #     from ...vttables import df_model
-    #
-    #     leaf_model = df_model.try_opening_as_dataframe(leaf)
-    #     if not leaf_model:
-    #         return
-    #
-    #     export_info = self.getExportInfo(is_table=True)
-    #     if export_info is None:
-    #         return
-    #
-    #     leaf_model.to_csv(*export_info)
-    #     return True
+    def exportOptions(self, leaf):
+        """Ask the user for the rows and columns of the exported dataset.
+
+        :Parameter leaf: the exported dataset
+
+        :Returns: a dictionary with the `start`, `stop`, `step` and `columns`
+          arguments of :func:`vitables.csv.csvwriter.writeRows` or None if
+          the export is cancelled
+        """
+
+        if isinstance(leaf, tables.Table):
+            columns = csvwriter.tableColumns(leaf)
+            labels = columns
+        elif (len(leaf.shape) == 2) and \
+                (leaf.shape[1] <= MAX_LISTED_COLUMNS):
+            columns = list(range(leaf.shape[1]))
+            labels = [str(column) for column in columns]
+        else:
+            columns = labels = []
+
+        dialog = exportdlg.ExportDlg(leaf._v_name, leaf.nrows, labels)
+        try:
+            dialog.exec_()
+            options = dialog.options
+        finally:
+            del dialog
+        if (options is not None) and (options['columns'] is not None):
+            options['columns'] = [columns[i] for i in options['columns']]
+        return options
+
+    def _try_exporting_dataframe(self, leaf):
+        """Export the ``pandas`` frame a leaf belongs to.
+
+        :Parameter leaf: the selected leaf
+
+        :Returns: False if the leaf is not part of a frame (or ``pandas`` is
+          not available) so it has to be exported as a regular dataset
+        """
+
+        if df_model.get_pandas_type(leaf) not in ('frame', 'frame_table'):
+            return False
+        hstore = df_model.open_hdfstore(leaf._v_file)
+        if hstore is None:
+            return False
+
+        key = leaf._v_parent._v_pathname
+        export_info = self.getExportInfo(is_table=True)
+        if export_info is not None:
+            filepath, add_header = export_info
+            self.startExport(leaf, filepath,
+                             {'frame_key': key, 'add_header': add_header},
+                             csvwriter.frameRows(hstore, key))
+        return True
+
+    def startExport(self, leaf, csv_filepath, options, rows_total):
+        """Launch an export in a worker process and show its progress.
+
+        :Parameters:
+
+        - `leaf`: the exported dataset
+        - `csv_filepath`: the full path of the `CSV` file
+        - `options`: the export options (see
+          :func:`vitables.csv.exportworker.exportDataset`)
+        - `rows_total`: the number of rows being exported
+        """
+
+        h5file = leaf._v_file
+        if h5file.mode != 'r':
+            # Make sure that the worker process sees the current content of
+            # the dataset
+            h5file.flush()
+        job = ExportJob(h5file.filename, leaf._v_pathname, csv_filepath,
+                        options, rows_total)
+        job.export_completed.connect(self.exportCompleted)
+        self.jobs[csv_filepath] = (job,
+                                   self.createProgressDialog(job,
+                                                             leaf._v_name))
+        job.run()
+
+    def createProgressDialog(self, job, name):
+        """Create a dialog that reports the progress of an export.
+
+        The dialog shows the rows and bytes written and the throughput of
+        the export. Its `Cancel` button stops the export.
+
+        :Parameters:
+
+        - `job`: the `ExportJob` instance being monitored
+        - `name`: the name of the exported dataset
+        """
+
+        dialog = QtWidgets.QProgressDialog(self.vtgui)
+        dialog.setWindowTitle(
+            translate('ExportToCSV', 'Exporting {0}',
+                      'Caption of the export progress dialog').format(name))
+        dialog.setLabelText(
+            translate('ExportToCSV', 'Starting the export...',
+                      'Label of the export progress dialog'))
+        dialog.setCancelButtonText(
+            translate('ExportToCSV', 'Cancel', 'Button text'))
+        dialog.setRange(0, PROGRESS_STEPS)
+        dialog.setAutoClose(False)
+        dialog.setAutoReset(False)
+        dialog.setMinimumDuration(500)
+        dialog.setValue(0)
+
+        def updateProgress(rows_written, bytes_written, throughput):
+            """Update the dialog with the progress of the export."""
+            if job.rows_total > 0:
+                dialog.setValue(
+                    rows_written * PROGRESS_STEPS // job.rows_total)
+            dialog.setLabelText(
+                translate('ExportToCSV',
+                          'Rows written: {0} of {1}\n'
+                          'Bytes written: {2}\n'
+                          'Throughput: {3:.0f} rows/s',
+                          'Label of the export progress dialog').format(
+                              rows_written, job.rows_total, bytes_written,
+                              throughput))
+
+        job.export_progress.connect(updateProgress)
+        dialog.canceled.connect(job.cancel)
+        return dialog
+
+    def exportCompleted(self, completed, csv_filepath):
+        """Release a finished export and report its result.
+
+        This is a slot connected to the `export_completed` signal of the
+        export jobs.
+
+        :Parameters:
+
+        - `completed`: whether the export has been succesful or not
+        - `csv_filepath`: the full path of the `CSV` file
+        """
+
+        job, dialog = self.jobs.pop(csv_filepath)
+        dialog.close()
+        dialog.deleteLater()
+        if completed:
+            log.info(translate(
+                'ExportToCSV',
+                '{0} rows ({1} bytes) exported to {2} in {3:.1f} s.',
+                'Info log message').format(
+                    job.rows_written, job.bytes_written, csv_filepath,
+                    job.elapsed()))
+        elif job.cancelled:
+            log.info(translate(
+                'ExportToCSV',
+                'Export to {0} cancelled. The file has been removed.',
+                'Info log message').format(csv_filepath))
+        job.deleteLater()
 
     def export(self):
-        """Export a given dataset to a `CSV` file.
+        """Export the dataset selected in the databases tree to a `CSV` file.
 
         This method is a slot connected to the `export` QAction. See the
         :meth:`addEntry` method for details.
@@ -213,6 +525,43 @@ class ExportToCSV(QtCore.QObject):
         # The PyTables node tied to the current leaf of the databases tree
         current = self.vtgui.dbs_tree_view.currentIndex()
         leaf = self.vtgui.dbs_tree_model.nodeFromIndex(current).node
+        self.exportLeaf(leaf)
+
+    def exportView(self):
+        """Export the rows displayed by the active view to a `CSV` file.
+
+        Views of filtered frames export only their rows, in the order of the
+        view. Other views display whole datasets so they are exported like
+        the selected dataset.
+
+        This method is a slot connected to the `export_view` QAction. See
+        the :meth:`addEntry` method for details.
+        """
+
+        model = self.activeModel()
+        if model is None:
+            return
+        if not isinstance(model, df_model.DataFrameModel):
+            self.exportLeaf(model.leaf)
+            return
+
+        export_info = self.getExportInfo(is_table=True)
+        if export_info is None:
+            return
+        filepath, add_header = export_info
+        self.startExport(model.leaf, filepath,
+                         model.csv_export_options(add_header),
+                         model.leaf_numrows)
+
+    def exportLeaf(self, leaf):
+        """Export a given dataset to a `CSV` file.
+
+        :Parameter leaf: the exported dataset
+        """
+
+        # Leaves written by pandas are exported as data frames
+        if self._try_exporting_dataframe(leaf):
+            return
 
         # Empty datasets aren't saved as CSV files
         if leaf.nrows == 0:
@@ -241,20 +590,19 @@ class ExportToCSV(QtCore.QObject):
                 'I can\'t export it to CSV format.'))
             return
 
-        # Tables with Ndimensional fields aren't saved as CSV files
+        # Ndimensional fields of tables aren't saved as CSV files
         is_table = isinstance(leaf, tables.Table)
-        if is_table:
-            if self._try_exporting_dataframe(leaf):
-                return
-
-            first_row = leaf[0]
-            for item in first_row:
-                if item.shape != ():
-                    log.info(translate(
-                        'ExportToCSV',
-                        'Some fields aren\'t scalars. '
-                        'I can\'t export the table to CSV format.'))
-                    return
+        if is_table and not csvwriter.tableColumns(leaf):
+            log.info(translate(
+                'ExportToCSV',
+                'No field is a scalar. '
+                'I can\'t export the table to CSV format.'))
+            return
+
+        # Get the rows and columns being exported
+        options = self.exportOptions(leaf)
+        if options is None:
+            return
 
         # Get the required info for exporting the dataset
         export_info = self.getExportInfo(is_table)
@@ -263,33 +611,7 @@ class ExportToCSV(QtCore.QObject):
         else:
             filepath, add_header = export_info
 
-        try:
-            QtWidgets.qApp.setOverrideCursor(QtCore.Qt.WaitCursor)
-            with open(filepath, 'ab') as out_handler:
-                if add_header:
-                    from functools import reduce
-                    header = reduce(lambda x, y: '{0}, {1}'.format(x, y),
-                                    leaf.colnames)
-                    # To be consistent with numpy.savetxt use \n line breaks
-                    out_handler.write(bytearray(header + '\n', 'UTF-8'))
-                chunk_size = 10000
-                nrows = leaf.nrows
-                if chunk_size > nrows:
-                    chunk_size = nrows
-                # Behavior of np.divide in Python 2 and Python 3 is different so
-                # we must explicitly ensure we get an integer
-                nchunks = numpy.floor_divide(nrows, chunk_size)
-                for i in numpy.arange(0, nchunks + 1):
-                    QtWidgets.qApp.processEvents()
-                    cstart = chunk_size * i
-                    if cstart >= nrows:
-                        break
-                    cstop = cstart + chunk_size
-                    if cstop > nrows:
-                        cstop = nrows
-                    numpy.savetxt(out_handler, leaf.read(cstart, cstop, 1),
-                                  fmt='%s', delimiter=',')
-        except OSError:
-            vitables.utils.formatExceptionInfo()
-        finally:
-            QtWidgets.qApp.restoreOverrideCursor()
+        rows_total = len(csvwriter.rowsRange(
+            leaf, options['start'], options['stop'], options['step']))
+        options['add_header'] = add_header
+        self.startExport(leaf, filepath, options, rows_total)
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#       Copyright (C) 2008-2017 Vicent Mas. All rights reserved
+#
+#       This program is free software: you can redistribute it and/or modify
+#       it under the terms of the GNU General Public License as published by
+#       the Free Software Foundation, either version 3 of the License, or
+#       (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#       MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#       GNU General Public License for more details.
+#
+#       You should have received a copy of the GNU General Public License
+#       along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#       Author:  Vicent Mas - vmas@vitables.org
+
+"""
+This module provides a dialog for choosing what is exported to a `CSV` file.
+
+The user chooses the range of exported rows (start, stop and step) and the
+exported columns.
+"""
+
+__docformat__ = 'restructuredtext'
+
+import logging
+
+from qtpy import QtCore
+from qtpy import QtWidgets
+
+translate = QtWidgets.QApplication.translate
+
+log = logging.getLogger(__name__)
+
+# The biggest value of the range spinboxes
+MAX_SPINBOX_VALUE = 2**31 - 1
+
+
+class ExportDlg(QtWidgets.QDialog):
+    """
+    A dialog for choosing the rows and columns exported to a `CSV` file.
+
+    The dialog layout is a form with start, stop and step spinboxes and a
+    list of checkable columns.
+
+    :Parameters:
+
+    - `name`: the name of the exported dataset
+    - `nrows`: the number of rows of the exported dataset
+    - `columns`: the labels of the columns that can be exported (an empty
+      list if the dataset has no selectable columns)
+    """
+
+    def __init__(self, name, nrows, columns):
+        """Initialise the dialog."""
+
+        super(ExportDlg, self).__init__(QtWidgets.qApp.activeWindow())
+
+        self.columns = columns
+        # If the dialog is cancelled this value will be returned to the caller
+        self.options = None
+
+        self.setWindowTitle(
+            translate('ExportDlg', 'Export to CSV: {0}',
+                      'A dialog caption').format(name))
+        form = QtWidgets.QFormLayout(self)
+
+        nrows = min(nrows, MAX_SPINBOX_VALUE)
+        self.startSB = QtWidgets.QSpinBox(self)
+        self.startSB.setRange(0, max(0, nrows - 1))
+        form.addRow(translate('ExportDlg', 'St&art:', 'A form label'),
+                    self.startSB)
+        self.stopSB = QtWidgets.QSpinBox(self)
+        self.stopSB.setRange(1, max(1, nrows))
+        self.stopSB.setValue(nrows)
+        form.addRow(translate('ExportDlg', 'St&op:', 'A form label'),
+                    self.stopSB)
+        self.stepSB = QtWidgets.QSpinBox(self)
+        self.stepSB.setRange(1, max(1, nrows))
+        form.addRow(translate('ExportDlg', 'St&ep:', 'A form label'),
+                    self.stepSB)
+
+        self.columnsLW = None
+        if columns:
+            self.columnsLW = QtWidgets.QListWidget(self)
+            for label in columns:
+                item = QtWidgets.QListWidgetItem(label, self.columnsLW)
+                item.setFlags(item.flags() | QtCore.Qt.ItemIsUserCheckable)
+                item.setCheckState(QtCore.Qt.Checked)
+            form.addRow(translate('ExportDlg', '&Columns:', 'A form label'),
+                        self.columnsLW)
+            self.columnsLW.itemChanged.connect(self.updateOKState)
+
+        self.buttonBox = QtWidgets.QDialogButtonBox(
+            QtWidgets.QDialogButtonBox.Ok | QtWidgets.QDialogButtonBox.Cancel,
+            parent=self)
+        form.addRow(self.buttonBox)
+
+        self.buttonBox.accepted.connect(self.composeOptions)
+        self.buttonBox.rejected.connect(self.reject)
+        self.startSB.valueChanged.connect(self.updateOKState)
+        self.stopSB.valueChanged.connect(self.updateOKState)
+
+    def selectedColumns(self):
+        """Return the indices of the checked columns."""
+
+        if self.columnsLW is None:
+            return []
+        return [row for row in range(self.columnsLW.count())
+                if self.columnsLW.item(row).checkState() ==
+                QtCore.Qt.Checked]
+
+    def updateOKState(self):
+        """Enable the `OK` button if some rows and columns are exported."""
+
+        status_ok = self.startSB.value() < self.stopSB.value()
+        if self.columnsLW is not None:
+            status_ok = status_ok and bool(self.selectedColumns())
+        self.buttonBox.button(QtWidgets.QDialogButtonBox.Ok).setEnabled(
+            status_ok)
+
+    def composeOptions(self):
+        """Slot for composing the export options and accept the dialog.
+
+        The exported columns are given by their indices in the `columns`
+        list, or None if all columns are exported. A stop of None means the
+        end of the dataset.
+        """
+
+        selected = self.selectedColumns()
+        if len(selected) == len(self.columns):
+            selected = None
+        # The last row of datasets too big for the spinboxes is reachable
+        stop = self.stopSB.value()
+        if stop == self.stopSB.maximum():
+            stop = None
+        self.options = {
+            'start': self.startSB.value(),
+            'stop': stop,
+            'step': self.stepSB.value(),
+            'columns': selected,
+        }
+        self.accept()
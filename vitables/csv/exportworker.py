@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#       Copyright (C) 2008-2017 Vicent Mas. All rights reserved
+#
+#       This program is free software: you can redistribute it and/or modify
+#       it under the terms of the GNU General Public License as published by
+#       the Free Software Foundation, either version 3 of the License, or
+#       (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#       MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#       GNU General Public License for more details.
+#
+#       You should have received a copy of the GNU General Public License
+#       along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#       Author:  Vicent Mas - vmas@vitables.org
+
+"""
+This module exports datasets to `CSV` files in a worker process.
+
+The worker opens the `PyTables` file in read-only mode on its own and sends
+messages to the GUI process through a pipe. Messages are tuples
+``(kind, content)`` where `kind` is one of:
+
+- 'progress': `content` is a tuple (rows written, bytes written)
+- 'done': `content` is a tuple (rows written, bytes written). It is the last
+  message of a successful export
+- 'error': `content` is the traceback of the exception that stopped the
+  export. The partially written `CSV` file has already been removed
+
+Beware that this module doesn't import ``Qt`` so it can be safely imported
+by the worker processes.
+"""
+
+__docformat__ = 'restructuredtext'
+
+import os
+import traceback
+
+import tables
+
+import vitables.csv.csvwriter as csvwriter
+
+
+def exportDataset(conn, filepath, nodepath, csv_filepath, options):
+    """Export a dataset to a `CSV` file.
+
+    This is the function run by the export worker processes.
+
+    :Parameters:
+
+    - `conn`: the sending end of the pipe connected to the GUI process
+    - `filepath`: the full path of the file where the dataset lives
+    - `nodepath`: the path of the dataset within its file
+    - `csv_filepath`: the full path of the `CSV` file
+    - `options`: a dictionary with the keyword arguments of
+      :func:`vitables.csv.csvwriter.writeRows`. ``pandas`` frames are
+      exported if it has a `frame_key` item (the path of the frame) instead;
+      then the optional `coordinates` and `add_header` items are used
+    """
+
+    options = dict(options)
+    try:
+        with open(csv_filepath, 'wb') as out_handler:
+            if 'frame_key' in options:
+                import pandas
+                with pandas.HDFStore(filepath, mode='r') as hstore:
+                    blocks = csvwriter.writeFrameRows(
+                        out_handler, hstore, options.pop('frame_key'),
+                        **options)
+                    written = sendProgress(conn, out_handler, blocks)
+            else:
+                with tables.open_file(filepath, 'r') as h5file:
+                    blocks = csvwriter.writeRows(
+                        out_handler, h5file.get_node(nodepath), **options)
+                    written = sendProgress(conn, out_handler, blocks)
+            nbytes = out_handler.tell()
+    except Exception:
+        if os.path.exists(csv_filepath):
+            os.remove(csv_filepath)
+        conn.send(('error', traceback.format_exc()))
+    else:
+        conn.send(('done', (written, nbytes)))
+    finally:
+        conn.close()
+
+
+def sendProgress(conn, out_handler, blocks):
+    """Write the blocks of an export and report the progress after each one.
+
+    :Parameters:
+
+    - `conn`: the sending end of the pipe connected to the GUI process
+    - `out_handler`: the `CSV` file
+    - `blocks`: a generator that writes the blocks of the export and yields
+      the number of rows written so far
+
+    :Returns: the number of rows written
+    """
+
+    written = 0
+    for written in blocks:
+        conn.send(('progress', (written, out_handler.tell())))
+    return written
@@ -25,8 +25,16 @@ The pipeline for importing a `CSV` file is::
 
     CSV file --> numpy array --> tables.Leaf
 
-The ``numpy`` array is created via `numpy.genfromtxt`. The `tables.Leaf`
-instance is created using the appropriate constructors.
+The file is first inspected with `numpy.genfromtxt` in order to find out the
+description of the dataset. The user chooses the compression and chunkshape of
+the dataset (and can benchmark them on a sample of the file). Then the
+`tables.Leaf` instance is created using
+the appropriate constructors and it is filled with blocks of rows parsed
+straight into typed ``numpy`` arrays by the :mod:`vitables.csv.csvparser`
+module (there are no intermediate files). Big files are split into ranges
+of lines that are parsed in parallel by a pool of worker processes while the
+GUI process appends the parsed blocks to the dataset in the order of the
+file.
 
 Beware that importing big files is a slow process because the whole file
 has to be read from disk, transformed and write back to disk again so
@@ -43,17 +51,27 @@ Other aspects to take into account:
     argument of the `tables.CArray` constructor).
 
   - there is a penalty performance when string dtypes are involved. The reason
-    is that string fields use to have variable length so, before the ``numpy``
-    array is created, we need to find out the minimum itemsize required for
-    storing those string fields with no lose of data. This step requires an
-    additional parsing of the whole `CSV` file.
+    is that string fields use to have variable length so, before the dataset
+    is created, we need to find out the minimum itemsize required for
+    storing those string fields with no lose of data. All the string columns
+    are measured in a single pass over a sample of lines of the `CSV` file.
+    If a wider string shows up later then the dataset is recreated with a
+    wider column and filled again.
 
   - `CSV` files containing N-dimensional fields are always imported with `str`
     dtype. This is a limitation of `numpy.genfromtxt`.
+
+  - `CSV` files compressed with ``gzip``, ``bzip2`` or ``xz`` are decompressed
+    on the fly (the format is found out by the magic bytes of the file). They
+    are always parsed sequentially.
 """
 
+import functools
+import io
+import itertools
 import logging
 import os
+import time
 import traceback
 
 import numpy
@@ -62,7 +80,9 @@ from qtpy import QtCore
 from qtpy import QtGui
 from qtpy import QtWidgets
 
+import vitables.csv.csvparser as csvparser
 import vitables.csv.csvutils as csvutils
+import vitables.csv.importdlg as importdlg
 import vitables.utils
 
 __docformat__ = 'restructuredtext'
@@ -74,6 +94,14 @@ TYPE_ERROR = translate(
 
 log = logging.getLogger(__name__)
 
+# The number of lines scanned for finding out the itemsizes of string
+# columns. Strings wider than the sampled ones are handled by widening the
+# dataset and importing the file again
+SCHEMA_SAMPLE_LINES = 100000
+
+# The number of lines written when benchmarking the storage settings
+BENCHMARK_LINES = 10000
+
 
 class ImportCSV(QtCore.QObject):
     """Provides CSV import capabilities for tables and arrays.
@@ -88,6 +116,9 @@ class ImportCSV(QtCore.QObject):
 
         super(ImportCSV, self).__init__()
 
+        # The storage settings of the last import
+        self.settings = importdlg.defaultSettings()
+
         # Get a reference to the application instance
         self.vtapp = vitables.utils.getVTApp()
         if self.vtapp is None:
@@ -192,6 +223,7 @@ class ImportCSV(QtCore.QObject):
         dbdoc = None
         try:
             dirname, filename = os.path.split(filepath)
+            filename = csvparser.stripCompressionExtension(filename)
             root = os.path.splitext(filename)[0]
             dest_filepath = vitables.utils.forwardPath(os.path.join(dirname,
                                                                     '{0}.h5'.format(root)))
@@ -217,8 +249,8 @@ class ImportCSV(QtCore.QObject):
             self.vtgui, translate(
                 'ImportCSV', 'Importing CSV file into {0}',
                 'Caption of the Import from CSV dialog').format(leaf_kind),
-            dfilter=translate('ImportCSV', """CSV Files (*.csv);;"""
-                              """All Files (*)""",
+            dfilter=translate('ImportCSV', """CSV Files (*.csv *.csv.gz """
+                              """*.csv.bz2 *.csv.xz);;All Files (*)""",
                               'Filter for the Import from CSV dialog'),
             settings={'accept_mode': QtWidgets.QFileDialog.AcceptOpen,
                       'file_mode': QtWidgets.QFileDialog.ExistingFile,
@@ -255,6 +287,96 @@ class ImportCSV(QtCore.QObject):
                 self.dbt_model.lazyAddChildren(index)
                 self.dbt_view.setCurrentIndex(index)
 
+    def storageSettings(self, kind, filepath, nrows, rank, benchmark):
+        """Ask the user for the storage settings of the imported dataset.
+
+        The settings chosen for the last import are proposed.
+
+        :Parameters:
+
+        - `kind`: the kind of the imported dataset
+        - `filepath`: the path of the `CSV` file
+        - `nrows`: the estimated number of rows of the dataset
+        - `rank`: the number of dimensions of the dataset
+        - `benchmark`: a callable that writes a sample of the file with some
+          settings (see :meth:`benchmark`)
+
+        :Returns: the settings or None if the import is cancelled
+        """
+
+        QtWidgets.qApp.restoreOverrideCursor()
+        try:
+            dialog = importdlg.ImportDlg(kind, os.path.basename(filepath),
+                                         nrows, rank, benchmark,
+                                         self.settings)
+            dialog.exec_()
+            settings = dialog.settings
+            del dialog
+        finally:
+            QtWidgets.qApp.setOverrideCursor(QtCore.Qt.WaitCursor)
+        if settings is not None:
+            self.settings = settings
+        return settings
+
+    def benchmark(self, input_handler, has_header, kind, description, shape,
+                  filters, chunkshape):
+        """Write a sample of the `CSV` file with some storage settings.
+
+        The sample is parsed first so only the time spent writing (and
+        compressing) it is measured. It is written to an in-memory file.
+
+        :Parameters:
+
+        - `input_handler`: the file handler of the `CSV` file
+        - `has_header`: True if the first line of the file is a header
+        - `kind`: the kind of the imported dataset
+        - `description`: the description of tables or the atom of arrays
+        - `shape`: the shape of arrays
+        - `filters`: the benchmarked `tables.Filters` instance
+        - `chunkshape`: the benchmarked chunkshape or None
+
+        :Returns: a tuple (number of rows, seconds, uncompressed size,
+          compressed size)
+        """
+
+        input_handler.seek(0)
+        if has_header:
+            input_handler.readline()
+        sample = io.StringIO(''.join(itertools.islice(input_handler,
+                                                      BENCHMARK_LINES)))
+        if kind == 'Table':
+            dtype = tables.description.dtype_from_descr(description)
+        else:
+            dtype = description.dtype
+        ncols = shape[1] if (shape is not None) and len(shape) > 1 else None
+        blocks = [block.copy()
+                  for block in csvparser.readBlocks(sample, dtype, ncols)]
+        nrows = sum(block.shape[0] for block in blocks)
+        if kind == 'CArray':
+            shape = (nrows, ) + tuple(shape[1:])
+
+        settings = {'filters': filters, 'chunkshape': chunkshape}
+        h5file = tables.open_file('benchmark.h5', 'w', driver='H5FD_CORE',
+                                  driver_core_backing_store=0)
+        try:
+            started = time.time()
+            dataset = csvutils.createDataset(h5file, kind, description,
+                                             shape, settings,
+                                             expectedrows=nrows)
+            start = 0
+            for block in blocks:
+                if kind == 'CArray':
+                    dataset[start:start + block.shape[0]] = block
+                    start += block.shape[0]
+                else:
+                    dataset.append(block)
+            h5file.flush()
+            seconds = time.time() - started
+            return (nrows, seconds, dataset.size_in_memory,
+                    dataset.size_on_disk)
+        finally:
+            h5file.close()
+
     def csv2Table(self):
         """Import a plain `CSV` file into a `tables.Array` object.
         """
@@ -268,39 +390,32 @@ class ImportCSV(QtCore.QObject):
         try:
             QtWidgets.qApp.processEvents()
             QtWidgets.qApp.setOverrideCursor(QtCore.Qt.WaitCursor)
-            input_handler = open(filepath, 'r+')
+            input_handler = csvparser.openFile(filepath)
             try:
-                (nrows, descr, has_header) = csvutils.tableInfo(input_handler)
+                (nrows, descr, has_header) = csvutils.tableInfo(
+                    input_handler, SCHEMA_SAMPLE_LINES)
             except Exception as inst:
                 print(traceback.format_exc())
 
+            # Choose the storage settings of the dataset
+            settings = self.storageSettings(
+                kind, filepath, nrows, 1,
+                functools.partial(self.benchmark, input_handler, has_header,
+                                  kind, descr, None))
+            if settings is None:
+                return
+
             # Create the dataset
             dbdoc = self.createDestFile(filepath)
             if dbdoc is None:
                 return
-            io_filters = tables.Filters(complevel=9, complib='lzo')
-            dataset_name = "imported_{0}".format(kind)
             atitle = \
                 'Source CSV file {0}'.format(os.path.basename(filepath))
-            dataset = dbdoc.h5file.create_table(
-                '/', dataset_name, descr, title=atitle, filters=io_filters,
-                expectedrows=nrows)
-            # Fill the dataset in a memory efficient way
-            input_handler.seek(0)
-            if has_header:
-                # Skip the header line
-                input_handler.readline()
-            chunk_size = 10000
-            buf_size = chunk_size * dataset.rowsize
-            read_fh = input_handler.readlines
-            buf = read_fh(buf_size)
-            while buf:
-                idata = csvutils.getArray(buf)
-                # Append data to the dataset
-                dataset.append(idata)
-                dataset.flush()
-                del idata
-                buf = read_fh(buf_size)
+            csvutils.fillDataset(
+                dbdoc.h5file, kind, descr, None, settings,
+                functools.partial(csvparser.parseFile, input_handler,
+                                  has_header),
+                atitle, nrows)
             dbdoc.h5file.flush()
             self.updateTree(dbdoc.filepath)
         except:
@@ -324,34 +439,27 @@ class ImportCSV(QtCore.QObject):
         try:
             QtWidgets.qApp.processEvents()
             QtWidgets.qApp.setOverrideCursor(QtCore.Qt.WaitCursor)
-            chunk_size = 10000
-            input_handler = open(filepath, 'r+')
-            (nrows, atom, array_shape) = csvutils.earrayInfo(input_handler)
+            input_handler = csvparser.openFile(filepath)
+            (nrows, atom, array_shape) = csvutils.earrayInfo(
+                input_handler, SCHEMA_SAMPLE_LINES)
+
+            # Choose the storage settings of the dataset
+            settings = self.storageSettings(
+                kind, filepath, nrows, len(array_shape),
+                functools.partial(self.benchmark, input_handler, False,
+                                  kind, atom, array_shape))
+            if settings is None:
+                return
 
             # Create the dataset
             dbdoc = self.createDestFile(filepath)
             if dbdoc is None:
                 return
-            io_filters = tables.Filters(complevel=9, complib='lzo')
-            dataset_name = "imported_{0}".format(kind)
             atitle = 'Source CSV file {0}'.format(os.path.basename(filepath))
-            dataset = dbdoc.h5file.create_earray(
-                '/', dataset_name, atom, array_shape, title=atitle,
-                filters=io_filters, expectedrows=nrows)
-
-            # Fill the dataset in a memory effcient way
-            input_handler.seek(0)
-            chunk_size = 10000
-            buf_size = chunk_size * dataset.rowsize
-            read_fh = input_handler.readlines
-            buf = read_fh(buf_size)
-            while buf:
-                idata = csvutils.getArray(buf)
-                # Append data to the dataset
-                dataset.append(idata)
-                dataset.flush()
-                del idata
-                buf = read_fh(buf_size)
+            csvutils.fillDataset(
+                dbdoc.h5file, kind, atom, array_shape, settings,
+                functools.partial(csvparser.parseFile, input_handler, False),
+                atitle, nrows)
             dbdoc.h5file.flush()
             self.updateTree(dbdoc.filepath)
         except ValueError:
@@ -377,37 +485,27 @@ class ImportCSV(QtCore.QObject):
         try:
             QtWidgets.qApp.processEvents()
             QtWidgets.qApp.setOverrideCursor(QtCore.Qt.WaitCursor)
-            chunk_size = 10000
-            input_handler = open(filepath, 'r+')
-            (atom, array_shape) = csvutils.carrayInfo(input_handler)
+            input_handler = csvparser.openFile(filepath)
+            (atom, array_shape) = csvutils.carrayInfo(input_handler,
+                                                      SCHEMA_SAMPLE_LINES)
+
+            # Choose the storage settings of the dataset
+            settings = self.storageSettings(
+                kind, filepath, array_shape[0], len(array_shape),
+                functools.partial(self.benchmark, input_handler, False,
+                                  kind, atom, array_shape))
+            if settings is None:
+                return
 
             # Create the dataset
             dbdoc = self.createDestFile(filepath)
             if dbdoc is None:
                 return
-            io_filters = tables.Filters(complevel=9, complib='lzo')
-            dataset_name = "imported_{0}".format(kind)
             atitle = 'Source CSV file {0}'.format(os.path.basename(filepath))
-            dataset = dbdoc.h5file.create_carray(
-                '/', dataset_name, atom, array_shape, title=atitle,
-                filters=io_filters)
-
-            # Fill the dataset in a memory effcient way
-            input_handler.seek(0)
-            chunk_size = 10000
-            buf_size = chunk_size * dataset.rowsize
-            read_fh = input_handler.readlines
-            buf = read_fh(buf_size)
-            start = 0
-            while buf:
-                idata = csvutils.getArray(buf)
-                stop = start + idata.shape[0]
-                # Append data to the dataset
-                dataset[start:stop] = idata
-                dataset.flush()
-                del idata
-                start = stop
-                buf = read_fh(buf_size)
+            csvutils.fillDataset(
+                dbdoc.h5file, kind, atom, array_shape, settings,
+                functools.partial(csvparser.parseFile, input_handler, False),
+                atitle)
             dbdoc.h5file.flush()
             self.updateTree(dbdoc.filepath)
         except ValueError:
@@ -435,7 +533,9 @@ class ImportCSV(QtCore.QObject):
             QtWidgets.qApp.setOverrideCursor(QtCore.Qt.WaitCursor)
             # The dtypes are determined by the contents of each column
             # Multidimensional columns will have string datatype
-            data = numpy.genfromtxt(filepath, delimiter=',', dtype=None)
+            with csvparser.openFile(filepath) as input_handler:
+                data = numpy.genfromtxt(input_handler, delimiter=',',
+                                        dtype=None)
         except TypeError:
             data = None
             dbdoc = None
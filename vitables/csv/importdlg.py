@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#       Copyright (C) 2008-2017 Vicent Mas. All rights reserved
+#
+#       This program is free software: you can redistribute it and/or modify
+#       it under the terms of the GNU General Public License as published by
+#       the Free Software Foundation, either version 3 of the License, or
+#       (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#       MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#       GNU General Public License for more details.
+#
+#       You should have received a copy of the GNU General Public License
+#       along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#       Author:  Vicent Mas - vmas@vitables.org
+
+"""
+This module provides a dialog for setting up the storage of imported datasets.
+
+The user chooses the compression library, level and shuffling of the dataset
+and, optionally, its chunkshape. The chosen settings can be benchmarked on a
+sample of the `CSV` file before importing the whole file.
+"""
+
+__docformat__ = 'restructuredtext'
+
+import logging
+
+import tables
+from qtpy import QtCore
+from qtpy import QtWidgets
+
+translate = QtWidgets.QApplication.translate
+
+log = logging.getLogger(__name__)
+
+# The compression used by default (if the library is available)
+DEFAULT_COMPLIB = 'blosc:lz4'
+DEFAULT_COMPLEVEL = 5
+
+
+def availableComplibs():
+    """Return the compression libraries available in this `PyTables`."""
+
+    complibs = []
+    for complib in tables.filters.all_complibs:
+        try:
+            if tables.which_lib_version(complib) is not None:
+                complibs.append(complib)
+        except ValueError:
+            pass
+    return complibs
+
+
+def defaultSettings():
+    """Return the default storage settings of imported datasets."""
+
+    complibs = availableComplibs()
+    complib = DEFAULT_COMPLIB if DEFAULT_COMPLIB in complibs else 'zlib'
+    return {
+        'filters': tables.Filters(complevel=DEFAULT_COMPLEVEL,
+                                  complib=complib, shuffle=True),
+        'chunkshape': None,
+    }
+
+
+def parseChunkshape(text, rank):
+    """Parse a chunkshape typed by the user.
+
+    :Parameters:
+
+    - `text`: a comma separated list of dimensions. An empty text means an
+      automatic chunkshape
+    - `rank`: the number of dimensions of the dataset
+
+    :Returns: a tuple of positive integers or None
+    """
+
+    text = text.strip()
+    if not text:
+        return None
+    chunkshape = tuple(int(dim) for dim in text.split(','))
+    if (len(chunkshape) != rank) or (min(chunkshape) < 1):
+        raise ValueError(text)
+    return chunkshape
+
+
+class ImportDlg(QtWidgets.QDialog):
+    """
+    A dialog for setting up the storage of an imported dataset.
+
+    The dialog layout is a form with a compression library combobox, a
+    compression level spinbox, a shuffle checkbox, a chunkshape line edit,
+    the estimated number of rows of the dataset and a button for
+    benchmarking the settings.
+
+    The `benchmark` callable is called with a `tables.Filters` instance and a
+    chunkshape, and returns a tuple (number of rows, seconds, uncompressed
+    size, compressed size).
+
+    :Parameters:
+
+    - `kind`: the kind of the imported dataset
+    - `filename`: the name of the `CSV` file
+    - `nrows`: the estimated number of rows of the dataset
+    - `rank`: the number of dimensions of the dataset
+    - `benchmark`: a callable that writes a sample of the file
+    - `settings`: the initial settings (see :func:`defaultSettings`)
+    """
+
+    def __init__(self, kind, filename, nrows, rank, benchmark, settings):
+        """Initialise the dialog."""
+
+        super(ImportDlg, self).__init__(QtWidgets.qApp.activeWindow())
+
+        self.rank = rank
+        self.benchmark = benchmark
+        # If the dialog is cancelled this value will be returned to the caller
+        self.settings = None
+
+        self.setWindowTitle(
+            translate('ImportDlg', 'Import {0} from {1}',
+                      'A dialog caption').format(kind, filename))
+        form = QtWidgets.QFormLayout(self)
+
+        filters = settings['filters']
+        self.complibCB = QtWidgets.QComboBox(self)
+        self.complibCB.addItems(availableComplibs())
+        self.complibCB.setCurrentIndex(
+            max(0, self.complibCB.findText(filters.complib)))
+        form.addRow(translate('ImportDlg', 'Compression &library:',
+                              'A form label'), self.complibCB)
+
+        self.complevelSB = QtWidgets.QSpinBox(self)
+        self.complevelSB.setRange(0, 9)
+        self.complevelSB.setValue(filters.complevel)
+        self.complevelSB.setToolTip(
+            translate('ImportDlg', '0 means no compression',
+                      'A tooltip'))
+        form.addRow(translate('ImportDlg', 'Compression l&evel:',
+                              'A form label'), self.complevelSB)
+
+        self.shuffleCB = QtWidgets.QCheckBox(
+            translate('ImportDlg', '&Shuffle bytes before compressing',
+                      'A check box text'), self)
+        self.shuffleCB.setChecked(filters.shuffle)
+        form.addRow(self.shuffleCB)
+
+        self.chunkshapeLE = QtWidgets.QLineEdit(self)
+        if settings['chunkshape'] and \
+                len(settings['chunkshape']) == self.rank:
+            self.chunkshapeLE.setText(
+                ', '.join(str(dim) for dim in settings['chunkshape']))
+        self.chunkshapeLE.setPlaceholderText(
+            translate('ImportDlg', 'automatic', 'A line edit placeholder'))
+        form.addRow(translate('ImportDlg', '&Chunkshape:', 'A form label'),
+                    self.chunkshapeLE)
+
+        form.addRow(translate('ImportDlg', 'Expected rows:', 'A form label'),
+                    QtWidgets.QLabel(
+                        translate('ImportDlg', '{0} (estimated from a sample '
+                                  'of the file)',
+                                  'A label text').format(nrows), self))
+
+        self.benchmarkPB = QtWidgets.QPushButton(
+            translate('ImportDlg', '&Benchmark', 'A button text'), self)
+        self.benchmarkLabel = QtWidgets.QLabel(self)
+        self.benchmarkLabel.setWordWrap(True)
+        form.addRow(self.benchmarkPB, self.benchmarkLabel)
+
+        self.buttonBox = QtWidgets.QDialogButtonBox(
+            QtWidgets.QDialogButtonBox.Ok | QtWidgets.QDialogButtonBox.Cancel,
+            parent=self)
+        form.addRow(self.buttonBox)
+
+        self.buttonBox.accepted.connect(self.composeSettings)
+        self.buttonBox.rejected.connect(self.reject)
+        self.benchmarkPB.clicked.connect(self.runBenchmark)
+
+    def readSettings(self):
+        """Return the settings of the dialog or None if they are invalid."""
+
+        try:
+            chunkshape = parseChunkshape(self.chunkshapeLE.text(), self.rank)
+        except ValueError:
+            log.error(
+                translate('ImportDlg',
+                          'The chunkshape must be a comma separated list of '
+                          '{0} positive integers.',
+                          'A logger error message').format(self.rank))
+            return None
+        filters = tables.Filters(complevel=self.complevelSB.value(),
+                                 complib=self.complibCB.currentText(),
+                                 shuffle=self.shuffleCB.isChecked())
+        return {'filters': filters, 'chunkshape': chunkshape}
+
+    def runBenchmark(self):
+        """Slot for benchmarking the current settings on a sample."""
+
+        settings = self.readSettings()
+        if settings is None:
+            return
+        QtWidgets.qApp.setOverrideCursor(QtCore.Qt.WaitCursor)
+        try:
+            (nrows, seconds, raw_size, stored_size) = \
+                self.benchmark(settings['filters'], settings['chunkshape'])
+        except Exception as inst:
+            self.benchmarkLabel.setText(str(inst))
+            return
+        finally:
+            QtWidgets.qApp.restoreOverrideCursor()
+        speed = raw_size / seconds / 2**20 if seconds > 0 else 0.0
+        ratio = raw_size / stored_size if stored_size else 1.0
+        self.benchmarkLabel.setText(
+            translate('ImportDlg', '{0} rows written in {1:.3f} s '
+                      '({2:.1f} MB/s), compression ratio {3:.2f}',
+                      'A label text').format(nrows, seconds, speed, ratio))
+
+    def composeSettings(self):
+        """Slot for composing the settings and accept the dialog."""
+
+        settings = self.readSettings()
+        if settings is None:
+            return
+        self.settings = settings
+        self.accept()
@@ -25,6 +25,9 @@ This module displays in a dialog tables.Leaf information collected by the
 
 Users' attributes can be edited if the database has been opened in read-write
 mode. Otherwise all shown information is read-only.
+
+Filtered tables store the profile of the query that created them. It is shown
+in its own, read-only, page.
 """
 
 __docformat__ = 'restructuredtext'
@@ -34,6 +37,7 @@ from qtpy import QtWidgets
 
 from vitables.nodeprops import attrpropdlg
 from vitables.nodeprops import leafproppage
+import vitables.queries.queryworker as queryworker
 
 translate = QtWidgets.QApplication.translate
 
@@ -50,7 +54,8 @@ class LeafPropDlg(attrpropdlg.AttrPropDlg):
     This class displays a tabbed dialog that shows some properties of
     the selected node. First tab, General, shows general properties like
     name, path, type etc. The second and third tabs show the system and
-    user attributes in a tabular way.
+    user attributes in a tabular way. Filtered tables have an extra tab,
+    Query profile, that shows how the query was executed.
 
     Beware that data types shown in the General page are `PyTables` data
     types so we can deal with `enum`, `time64` and `pseudoatoms` (none of them
@@ -80,5 +85,63 @@ class LeafPropDlg(attrpropdlg.AttrPropDlg):
                 'Dlg caption'))
             general_page.arrayPage()
 
+        prefix = queryworker.PROFILE_PREFIX
+        profile = dict((name[len(prefix):], value)
+                       for (name, value) in info.user_attrs.items()
+                       if name.startswith(prefix))
+        if profile:
+            self.tabw.addTab(self.profilePage(profile),
+                             translate('LeafPropDlg', 'Query profile',
+                                       'Tab label'))
+
         self.show()
 
+
+    def profilePage(self, profile):
+        """Return a read-only page with the profile of a query.
+
+        :Parameter profile: a dictionary with the profile of the query that
+          created the filtered table
+        """
+
+        labels = [
+            ('total_time', translate('LeafPropDlg', 'Total time (s):',
+                                     'A form label')),
+            ('select_time', translate('LeafPropDlg', 'Selection time (s):',
+                                      'A form label')),
+            ('append_time', translate('LeafPropDlg', 'Append time (s):',
+                                      'A form label')),
+            ('flush_time', translate('LeafPropDlg', 'Flush time (s):',
+                                     'A form label')),
+            ('chunks', translate('LeafPropDlg', 'Chunks read:',
+                                 'A form label')),
+            ('bytes_read', translate('LeafPropDlg', 'Bytes read (approx.):',
+                                     'A form label')),
+            ('rows_scanned', translate('LeafPropDlg', 'Rows scanned:',
+                                       'A form label')),
+            ('rows_matched', translate('LeafPropDlg', 'Rows matched:',
+                                       'A form label')),
+            ('selectivity', translate('LeafPropDlg', 'Selectivity:',
+                                      'A form label')),
+            ('uses_index', translate('LeafPropDlg', 'Uses indexes:',
+                                     'A form label')),
+            ]
+        page = QtWidgets.QWidget(self.tabw)
+        form = QtWidgets.QFormLayout(page)
+        for (name, label) in labels:
+            if name not in profile:
+                continue
+            value = profile[name]
+            if name.endswith('_time'):
+                text = '{0:.3f}'.format(float(value))
+            elif name == 'selectivity':
+                text = '{0:.2%}'.format(float(value))
+            elif name == 'uses_index':
+                text = str(bool(value))
+            else:
+                text = '{0:,}'.format(int(value))
+            line_edit = QtWidgets.QLineEdit(text, page)
+            line_edit.setReadOnly(True)
+            form.addRow(label, line_edit)
+        return page
+
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#       Copyright (C) 2008-2017 Vicent Mas. All rights reserved
+#
+#       This program is free software: you can redistribute it and/or modify
+#       it under the terms of the GNU General Public License as published by
+#       the Free Software Foundation, either version 3 of the License, or
+#       (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#       MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#       GNU General Public License for more details.
+#
+#       You should have received a copy of the GNU General Public License
+#       along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#       Author:  Vicent Mas - vmas@vitables.org
+
+"""Module that provides export of `PyTables` datasets to `.npy` files.
+
+The exported dataset is copied block by block into a preallocated, memory
+mapped `.npy` file (see :mod:`vitables.npy.npyutils`) so datasets bigger than
+the available memory can be exported. Tables are exported as arrays with a
+structured dtype. `VLArrays` cannot be exported.
+"""
+
+__docformat__ = 'restructuredtext'
+
+import logging
+import os
+
+import tables
+from qtpy import QtCore
+from qtpy import QtGui
+from qtpy import QtWidgets
+
+import vitables.npy.npyutils as npyutils
+import vitables.utils
+
+translate = QtWidgets.QApplication.translate
+
+log = logging.getLogger(__name__)
+
+
+class ExportToNPY(QtCore.QObject):
+    """Provides `.npy` export capabilities for tables and arrays.
+    """
+
+    def __init__(self):
+        """The class constructor.
+        """
+
+        super(ExportToNPY, self).__init__()
+
+        # Get a reference to the application instance
+        self.vtapp = vitables.utils.getVTApp()
+        if self.vtapp is None:
+            return
+
+        self.vtgui = vitables.utils.getGui()
+
+        # Add an entry under the Dataset menu
+        self.addEntry()
+
+        # Connect signals to slots
+        self.vtgui.dataset_menu.aboutToShow.connect(self.updateDatasetMenu)
+        self.vtgui.leaf_node_cm.aboutToShow.connect(self.updateDatasetMenu)
+
+    def addEntry(self):
+        """Add the `Export to .npy...` entry to `Dataset` menu.
+        """
+
+        self.export_npy_action = QtWidgets.QAction(
+            translate('ExportToNPY', "Export to .&npy...",
+                      "Save dataset as .npy"),
+            self,
+            shortcut=QtGui.QKeySequence.UnknownKey, triggered=self.export,
+            icon=vitables.utils.getIcons()['document-export'],
+            statusTip=translate(
+                'ExportToNPY',
+                "Save the dataset as a binary NumPy file",
+                "Status bar text for the Dataset -> Export to .npy... action"))
+        self.export_npy_action.setObjectName('export_npy')
+
+        # Add the action to the Dataset menu
+        vitables.utils.addToMenu(self.vtgui.dataset_menu,
+                                 self.export_npy_action)
+
+        # Add the action to the leaf context menu
+        vitables.utils.addToLeafContextMenu(self.export_npy_action)
+
+    def updateDatasetMenu(self):
+        """Update the `export` QAction when the Dataset menu is pulled down.
+
+        This method is a slot. See class ctor for details.
+        """
+
+        enabled = True
+        current = self.vtgui.dbs_tree_view.currentIndex()
+        if current:
+            leaf = self.vtgui.dbs_tree_model.nodeFromIndex(current)
+            if leaf.node_kind in ('group', 'root group', 'vlarray'):
+                enabled = False
+
+        self.export_npy_action.setEnabled(enabled)
+
+    def getFilepath(self):
+        """Get the path of the `.npy` file where the dataset will be stored.
+
+        A `.npy` extension is added to file names without extension.
+        """
+
+        filepath, working_dir = vitables.utils.getFilepath(
+            self.vtgui,
+            translate('ExportToNPY', 'Exporting dataset to .npy format',
+                      'Caption of the Export to .npy dialog'),
+            dfilter=translate('ExportToNPY', """NumPy Files (*.npy);;"""
+                              """All Files (*)""",
+                              'Filter for the Export to .npy dialog'),
+            settings={'accept_mode': QtWidgets.QFileDialog.AcceptSave,
+                      'file_mode': QtWidgets.QFileDialog.AnyFile,
+                      'history': self.vtapp.file_selector_history,
+                      'label': translate('ExportToNPY', 'Export',
+                                         'Accept button text for QFileDialog')}
+        )
+
+        if not filepath:
+            # The user has canceled the dialog
+            return
+
+        # Update the history of the file selector widget
+        self.vtapp.updateFSHistory(working_dir)
+
+        if not os.path.splitext(filepath)[1]:
+            filepath = filepath + '.npy'
+        return filepath
+
+    def export(self):
+        """Export a given dataset to a `.npy` file.
+
+        This method is a slot connected to the `export` QAction. See the
+        :meth:`addEntry` method for details.
+        """
+
+        # The PyTables node tied to the current leaf of the databases tree
+        current = self.vtgui.dbs_tree_view.currentIndex()
+        leaf = self.vtgui.dbs_tree_model.nodeFromIndex(current).node
+
+        # Variable lenght arrays aren't saved as .npy files
+        if isinstance(leaf, tables.VLArray):
+            log.info(translate(
+                'ExportToNPY', 'The selected node is a VLArray. '
+                'I can\'t export it to .npy format.'))
+            return
+
+        filepath = self.getFilepath()
+        if filepath is None:
+            return
+
+        try:
+            QtWidgets.qApp.setOverrideCursor(QtCore.Qt.WaitCursor)
+            for written in npyutils.exportRows(leaf, filepath):
+                QtWidgets.qApp.processEvents()
+            log.info(translate(
+                'ExportToNPY', 'Dataset {0} exported to {1}.',
+                'Info log message').format(leaf._v_pathname, filepath))
+        except:
+            vitables.utils.formatExceptionInfo()
+        finally:
+            QtWidgets.qApp.restoreOverrideCursor()
@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#       Copyright (C) 2008-2017 Vicent Mas. All rights reserved
+#
+#       This program is free software: you can redistribute it and/or modify
+#       it under the terms of the GNU General Public License as published by
+#       the Free Software Foundation, either version 3 of the License, or
+#       (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#       MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#       GNU General Public License for more details.
+#
+#       You should have received a copy of the GNU General Public License
+#       along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#       Author:  Vicent Mas - vmas@vitables.org
+
+"""Module that provides import of binary ``numpy`` files into `PyTables`.
+
+The imported `.npy` file is memory mapped and copied into a new
+`tables.Table`, `tables.CArray` or `tables.EArray` in slices of whole chunks
+(see :mod:`vitables.npy.npyutils`), so files bigger than the available
+memory can be imported. The user chooses the compression and chunkshape of
+the dataset with the same dialog used for importing `CSV` files.
+"""
+
+__docformat__ = 'restructuredtext'
+
+import functools
+import logging
+import os
+
+from qtpy import QtCore
+from qtpy import QtGui
+from qtpy import QtWidgets
+
+import vitables.csv.importdlg as importdlg
+import vitables.npy.npyutils as npyutils
+import vitables.utils
+
+translate = QtWidgets.QApplication.translate
+
+log = logging.getLogger(__name__)
+
+
+class ImportNPY(QtCore.QObject):
+    """Provides `.npy` import capabilities for tables and arrays.
+    """
+
+    def __init__(self):
+        """The class constructor.
+        """
+
+        super(ImportNPY, self).__init__()
+
+        # The storage settings of the last import
+        self.settings = importdlg.defaultSettings()
+
+        # Get a reference to the application instance
+        self.vtapp = vitables.utils.getVTApp()
+        if self.vtapp is None:
+            return
+
+        self.vtgui = vitables.utils.getGui()
+        self.dbt_model = self.vtgui.dbs_tree_model
+        self.dbt_view = self.vtgui.dbs_tree_view
+
+        # Add an entry under the File menu
+        self.icons_dictionary = vitables.utils.getIcons()
+        self.addEntry()
+
+    def addEntry(self):
+        """Add the `Import from .npy...` entry to the `File` menu.
+        """
+
+        self.import_npy_submenu = QtWidgets.QMenu(
+            translate('ImportNPY', 'Import from .&npy...',
+                      'File -> Import from .npy'))
+        self.import_npy_submenu.setIcon(
+            self.icons_dictionary['document-import'])
+        self.import_npy_submenu.setObjectName('import_npy_submenu')
+
+        # Create the actions
+        actions = {}
+        actions['import_npy_table'] = QtWidgets.QAction(
+            translate('ImportNPY', "Import &Table...",
+                      "Import table from .npy file"),
+            self,
+            shortcut=QtGui.QKeySequence.UnknownKey,
+            triggered=self.npy2Table,
+            statusTip=translate(
+                'ImportNPY',
+                "Import Table from a .npy file with a structured dtype",
+                "Status bar text for File -> Import from .npy... -> "
+                "Import Table"))
+        actions['import_npy_table'].setObjectName('import_npy_table')
+
+        actions['import_npy_carray'] = QtWidgets.QAction(
+            translate('ImportNPY', "Import &CArray...",
+                      "Import carray from .npy file"),
+            self,
+            shortcut=QtGui.QKeySequence.UnknownKey,
+            triggered=self.npy2CArray,
+            statusTip=translate(
+                'ImportNPY',
+                "Import CArray from a .npy file",
+                "Status bar text for File -> Import from .npy... -> "
+                "Import CArray"))
+        actions['import_npy_carray'].setObjectName('import_npy_carray')
+
+        actions['import_npy_earray'] = QtWidgets.QAction(
+            translate('ImportNPY', "Import &EArray...",
+                      "Import earray from .npy file"),
+            self,
+            shortcut=QtGui.QKeySequence.UnknownKey,
+            triggered=self.npy2EArray,
+            statusTip=translate(
+                'ImportNPY',
+                "Import EArray from a .npy file",
+                "Status bar text for File -> Import from .npy... -> "
+                "Import EArray"))
+        actions['import_npy_earray'].setObjectName('import_npy_earray')
+
+        # Add actions to the Import submenu
+        keys = ('import_npy_table', 'import_npy_carray', 'import_npy_earray')
+        vitables.utils.addActions(self.import_npy_submenu, keys, actions)
+
+        # Add submenu to file menu and to the file context menu before the
+        # Close File action
+        vitables.utils.insertInMenu(
+            self.vtgui.file_menu, self.import_npy_submenu, 'fileClose')
+        vitables.utils.insertInMenu(self.vtgui.view_cm,
+                                    self.import_npy_submenu, 'fileClose')
+
+    def npyFilepath(self, leaf_kind):
+        """Get the filepath of the source `.npy` file.
+
+        :Parameter leaf_kind: the kind of container where data will be stored
+        """
+
+        filepath, working_dir = vitables.utils.getFilepath(
+            self.vtgui, translate(
+                'ImportNPY', 'Importing .npy file into {0}',
+                'Caption of the Import from .npy dialog').format(leaf_kind),
+            dfilter=translate('ImportNPY', """NumPy Files (*.npy);;"""
+                              """All Files (*)""",
+                              'Filter for the Import from .npy dialog'),
+            settings={'accept_mode': QtWidgets.QFileDialog.AcceptOpen,
+                      'file_mode': QtWidgets.QFileDialog.ExistingFile,
+                      'history': self.vtapp.file_selector_history,
+                      'label': translate('ImportNPY', 'Import',
+                                         'Accept button text for QFileDialog')}
+        )
+
+        if not filepath:
+            # The user has canceled the dialog
+            return
+
+        # Update the history of the file selector widget
+        self.vtapp.updateFSHistory(working_dir)
+
+        return filepath
+
+    def createDestFile(self, filepath):
+        """Create the `PyTables` file where the `.npy` file will be imported.
+
+        The file lives in the directory of the `.npy` file and has the same
+        name, with a `.h5` extension.
+
+        :Parameter filepath: the `.npy` file filepath
+        """
+
+        root = os.path.splitext(filepath)[0]
+        dest_filepath = vitables.utils.forwardPath('{0}.h5'.format(root))
+        if os.path.exists(dest_filepath):
+            log.error(translate(
+                'ImportNPY',
+                'Import failed because destination file {0} already exists.',
+                'A file creation error').format(dest_filepath))
+            return None
+        return self.dbt_model.createDBDoc(dest_filepath)
+
+    def updateTree(self, filepath):
+        """Update the databases tree once the `.npy` file has been imported.
+
+        The root node of the imported file is selected so that users can
+        locate it immediately.
+
+        :Parameter filepath: the filepath of the destination h5 file
+        """
+
+        for row, child in enumerate(self.dbt_model.root.children):
+            if child.filepath == filepath:
+                index = self.dbt_model.index(row, 0, QtCore.QModelIndex())
+                self.dbt_model.lazyAddChildren(index)
+                self.dbt_view.setCurrentIndex(index)
+
+    def storageSettings(self, kind, filepath, source):
+        """Ask the user for the storage settings of the imported dataset.
+
+        The settings chosen for the last import are proposed.
+
+        :Parameters:
+
+        - `kind`: the kind of the imported dataset
+        - `filepath`: the path of the `.npy` file
+        - `source`: the memory mapped `.npy` file
+
+        :Returns: the settings or None if the import is cancelled
+        """
+
+        rank = 1 if kind == 'Table' else source.ndim
+        dialog = importdlg.ImportDlg(
+            kind, os.path.basename(filepath), source.shape[0], rank,
+            functools.partial(npyutils.benchmark, source, kind),
+            self.settings)
+        dialog.exec_()
+        settings = dialog.settings
+        del dialog
+        if settings is not None:
+            self.settings = settings
+        return settings
+
+    def importFile(self, kind):
+        """Import a `.npy` file into a new dataset.
+
+        :Parameter kind: the kind of the dataset, `Table`, `CArray` or
+          `EArray`
+        """
+
+        filepath = self.npyFilepath(kind)
+        if filepath is None:
+            return
+
+        try:
+            source = npyutils.openSource(filepath)
+            npyutils.checkSource(source, kind)
+        except (OSError, ValueError) as inst:
+            log.error(translate(
+                'ImportNPY', 'The file {0} cannot be imported: {1}',
+                'A logger error message').format(filepath, inst))
+            return
+
+        settings = self.storageSettings(kind, filepath, source)
+        if settings is None:
+            return
+
+        dbdoc = self.createDestFile(filepath)
+        if dbdoc is None:
+            return
+        try:
+            QtWidgets.qApp.setOverrideCursor(QtCore.Qt.WaitCursor)
+            title = 'Source .npy file {0}'.format(os.path.basename(filepath))
+            dataset = npyutils.createDataset(dbdoc.h5file, kind, source,
+                                             settings, title)
+            for written in npyutils.importRows(dataset, source):
+                QtWidgets.qApp.processEvents()
+            dbdoc.h5file.flush()
+            self.updateTree(dbdoc.filepath)
+        except:
+            vitables.utils.formatExceptionInfo()
+        finally:
+            QtWidgets.qApp.restoreOverrideCursor()
+            del source
+
+    def npy2Table(self):
+        """Import a `.npy` file into a `tables.Table` object.
+
+        This is a slot method. See :meth:`addEntry` method for details.
+        """
+        self.importFile('Table')
+
+    def npy2CArray(self):
+        """Import a `.npy` file into a `tables.CArray` object.
+
+        This is a slot method. See :meth:`addEntry` method for details.
+        """
+        self.importFile('CArray')
+
+    def npy2EArray(self):
+        """Import a `.npy` file into a `tables.EArray` object.
+
+        This is a slot method. See :meth:`addEntry` method for details.
+        """
+        self.importFile('EArray')
@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#       Copyright (C) 2008-2017 Vicent Mas. All rights reserved
+#
+#       This program is free software: you can redistribute it and/or modify
+#       it under the terms of the GNU General Public License as published by
+#       the Free Software Foundation, either version 3 of the License, or
+#       (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#       MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#       GNU General Public License for more details.
+#
+#       You should have received a copy of the GNU General Public License
+#       along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#       Author:  Vicent Mas - vmas@vitables.org
+
+"""Conversion between binary ``numpy`` (`.npy`) files and `PyTables` datasets.
+
+Files are never loaded in memory. Imported files are memory mapped (with
+`numpy.load`) and copied to the dataset in slices of whole chunks. Exported
+datasets are copied, in blocks of rows, straight into a `.npy` file that is
+preallocated and memory mapped (with `numpy.lib.format.open_memmap`).
+
+Files with a structured dtype can be imported into tables. Other files can be
+imported into `CArrays` and `EArrays`. All datasets but `VLArrays` can be
+exported.
+
+Beware that this module doesn't import ``Qt`` so it can be used by worker
+processes.
+"""
+
+__docformat__ = 'restructuredtext'
+
+import os
+import time
+
+import numpy
+import numpy.lib.format
+import tables
+
+# The approximate size (in bytes) of the blocks copied between files
+BLOCK_BYTES = 16 * 1024 * 1024
+
+# The number of rows written when benchmarking the storage settings
+BENCHMARK_ROWS = 100000
+
+
+def openSource(filepath):
+    """Memory map an imported `.npy` file.
+
+    :Parameter filepath: the path of the `.npy` file
+
+    :Returns: a read-only `numpy.memmap` instance
+    """
+
+    source = numpy.load(filepath, mmap_mode='r')
+    if not isinstance(source, numpy.ndarray):
+        raise ValueError('{0} is not a .npy file'.format(filepath))
+    return source
+
+
+def checkSource(source, kind):
+    """Check that a `.npy` file can be imported into a kind of dataset.
+
+    :Parameters:
+
+    - `source`: the memory mapped `.npy` file
+    - `kind`: the kind of dataset, `Table`, `EArray` or `CArray`
+
+    :Raises: a `ValueError` if the file cannot be imported
+    """
+
+    if source.shape == ():
+        raise ValueError('scalar arrays cannot be imported')
+    if kind == 'Table':
+        if source.dtype.names is None:
+            raise ValueError('only arrays with a structured dtype can be '
+                             'imported into tables')
+        if source.ndim != 1:
+            raise ValueError('only 1-dimensional structured arrays can be '
+                             'imported into tables')
+    elif source.dtype.names is not None:
+        raise ValueError('arrays with a structured dtype can only be '
+                         'imported into tables')
+
+
+def blockRows(dtype, shape, chunkshape=None, maindim=0):
+    """Return the number of rows of the blocks copied between files.
+
+    Blocks are about `BLOCK_BYTES` long and, if the dataset is chunked, span
+    whole chunks along the main dimension.
+
+    :Parameters:
+
+    - `dtype`: the dtype of the dataset
+    - `shape`: the shape of the dataset
+    - `chunkshape`: the chunkshape of the dataset or None
+    - `maindim`: the main dimension of the dataset, along which rows are read
+    """
+
+    row_shape = shape[:maindim] + shape[maindim + 1:]
+    row_bytes = max(1, dtype.itemsize * int(numpy.prod(row_shape)))
+    rows = max(1, BLOCK_BYTES // row_bytes)
+    if chunkshape:
+        rows = max(chunkshape[maindim],
+                   rows - rows % chunkshape[maindim])
+    return rows
+
+
+def createDataset(h5file, kind, source, settings, title='', where='/',
+                  name=None):
+    """Create the dataset where a `.npy` file is imported.
+
+    :Parameters:
+
+    - `h5file`: the `tables.File` where the dataset is created
+    - `kind`: the kind of dataset, `Table`, `EArray` or `CArray`
+    - `source`: the memory mapped `.npy` file
+    - `settings`: a dictionary with the `filters` and the `chunkshape` (None
+      means automatic) of the dataset
+    - `title`: the title of the dataset
+    - `where`: the parent group of the dataset
+    - `name`: the name of the dataset. By default `imported_<kind>`
+    """
+
+    checkSource(source, kind)
+    if name is None:
+        name = 'imported_{0}'.format(kind)
+    kwargs = {'title': title, 'filters': settings['filters'],
+              'chunkshape': settings['chunkshape']}
+    if kind == 'Table':
+        return h5file.create_table(where, name, source.dtype,
+                                   expectedrows=max(1, source.shape[0]),
+                                   **kwargs)
+    atom = tables.Atom.from_dtype(source.dtype)
+    if kind == 'EArray':
+        return h5file.create_earray(where, name, atom,
+                                    (0, ) + source.shape[1:],
+                                    expectedrows=max(1, source.shape[0]),
+                                    **kwargs)
+    return h5file.create_carray(where, name, atom, source.shape, **kwargs)
+
+
+def importRows(dataset, source):
+    """Copy the rows of a memory mapped `.npy` file to a dataset.
+
+    This is a generator. It yields the number of rows copied so far after
+    every block so callers can report progress or stop the import.
+
+    :Parameters:
+
+    - `dataset`: the dataset created by :func:`createDataset`
+    - `source`: the memory mapped `.npy` file
+    """
+
+    nrows = source.shape[0]
+    step = blockRows(source.dtype, source.shape, dataset.chunkshape)
+    for start in range(0, nrows, step):
+        stop = min(start + step, nrows)
+        if isinstance(dataset, tables.CArray) and \
+                not isinstance(dataset, tables.EArray):
+            dataset[start:stop] = source[start:stop]
+        else:
+            dataset.append(source[start:stop])
+        yield stop
+
+
+def exportRows(leaf, filepath):
+    """Copy the rows of a dataset to a preallocated `.npy` file.
+
+    This is a generator. It yields the number of rows copied so far after
+    every block. If the export fails (or it is stopped before finishing)
+    then the `.npy` file is removed.
+
+    :Parameters:
+
+    - `leaf`: the exported dataset, a table or an array
+    - `filepath`: the path of the `.npy` file
+    """
+
+    if isinstance(leaf, tables.VLArray):
+        raise ValueError('VLArrays cannot be exported to .npy files')
+    if leaf.shape == ():
+        numpy.save(filepath, leaf.read())
+        return
+
+    completed = False
+    shape = tuple(int(dim) for dim in leaf.shape)
+    target = numpy.lib.format.open_memmap(filepath, mode='w+',
+                                          dtype=leaf.dtype, shape=shape)
+    try:
+        # Rows are read along the main dimension of the dataset
+        maindim = leaf.maindim
+        index = [slice(None)] * len(shape)
+        step = blockRows(leaf.dtype, shape, leaf.chunkshape, maindim)
+        for start in range(0, leaf.nrows, step):
+            stop = min(start + step, leaf.nrows)
+            index[maindim] = slice(start, stop)
+            target[tuple(index)] = leaf.read(start, stop)
+            yield stop
+        target.flush()
+        completed = True
+    finally:
+        del target
+        if not completed:
+            os.remove(filepath)
+
+
+def benchmark(source, kind, filters, chunkshape, nrows=BENCHMARK_ROWS):
+    """Write the first rows of a `.npy` file with some storage settings.
+
+    The rows are written to an in-memory file. See
+    :class:`vitables.csv.importdlg.ImportDlg`.
+
+    :Parameters:
+
+    - `source`: the memory mapped `.npy` file
+    - `kind`: the kind of dataset, `Table`, `EArray` or `CArray`
+    - `filters`: the benchmarked `tables.Filters` instance
+    - `chunkshape`: the benchmarked chunkshape or None
+    - `nrows`: the maximum number of rows written
+
+    :Returns: a tuple (number of rows, seconds, uncompressed size,
+      compressed size)
+    """
+
+    sample = numpy.asarray(source[:nrows])
+    h5file = tables.open_file('benchmark.h5', 'w', driver='H5FD_CORE',
+                              driver_core_backing_store=0)
+    try:
+        started = time.time()
+        dataset = createDataset(h5file, kind, sample,
+                                {'filters': filters,
+                                 'chunkshape': chunkshape})
+        for written in importRows(dataset, sample):
+            pass
+        h5file.flush()
+        seconds = time.time() - started
+        return (sample.shape[0], seconds, dataset.size_in_memory,
+                dataset.size_on_disk)
+    finally:
+        h5file.close()
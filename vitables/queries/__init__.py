@@ -17,4 +17,6 @@
 #
 #       Author:  Vicent Mas - vmas@vitables.org
 
-__all__ = ["query", "querydlg", "querymgr"]
+__all__ = ["aggregate", "aggregatedlg", "batchquery", "indexmgr", "join",
+           "joindlg", "query", "querydlg", "querymgr", "queryworker",
+           "tablecondition"]
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#       Copyright (C) 2008-2017 Vicent Mas. All rights reserved
+#
+#       This program is free software: you can redistribute it and/or modify
+#       it under the terms of the GNU General Public License as published by
+#       the Free Software Foundation, either version 3 of the License, or
+#       (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#       MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#       GNU General Public License for more details.
+#
+#       You should have received a copy of the GNU General Public License
+#       along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#       Author:  Vicent Mas - vmas@vitables.org
+
+"""
+This module executes aggregation (group by) queries at low level.
+
+An aggregation query groups the rows of a table by the values of a key column
+and computes the number of rows of every group and the sum, minimum, maximum
+and mean of other columns. The query can have a condition, in which case only
+the rows that fulfill it are aggregated. The result is a small table stored in
+the temporary database, next to the filtered tables.
+"""
+
+__docformat__ = 'restructuredtext'
+
+import tables
+
+import vitables.queries.query as query
+import vitables.queries.queryworker as queryworker
+
+# The aggregate functions, in the order their columns are added to results
+FUNCTIONS = ('sum', 'min', 'max', 'mean')
+
+
+def resultField(colpath, function):
+    """Return the name of the result field of an aggregate.
+
+    :Parameters:
+
+    - `colpath`: the pathname of the aggregated column
+    - `function`: the aggregate function
+    """
+
+    return '{0}_{1}'.format(colpath.replace('/', '_'), function)
+
+
+def resultDescription(table, group_by, aggregates):
+    """Return the description of the result table of an aggregation query.
+
+    :Parameters:
+
+    - `table`: the queried table
+    - `group_by`: the pathname of the grouping column
+    - `aggregates`: a sequence of tuples (column pathname, function, result
+      field)
+    """
+
+    ft_dict = {
+        group_by.replace('/', '_'):
+            tables.Col.from_dtype(table.coldtypes[group_by], pos=0),
+        'count': tables.Int64Col(pos=1)}
+    for (pos, (colpath, function, field)) in enumerate(aggregates, 2):
+        dtype = table.coldtypes[colpath]
+        if function == 'sum':
+            dtype = queryworker.sumDtype(dtype)
+        elif function == 'mean':
+            dtype = tables.Float64Col().dtype
+        ft_dict[field] = tables.Col.from_dtype(dtype, pos=pos)
+    return ft_dict
+
+
+class AggregateQuery(query.Query):
+    """Class implementing an aggregation query.
+
+    Aggregation queries are run in a worker process like filtering queries.
+    The worker sends the aggregates of all groups when the whole range of
+    rows has been scanned.
+
+    The query description has the usual items plus `group_by` (the pathname
+    of the grouping column), `key_field` (the name of the result column with
+    the keys of the groups) and `aggregates` (a list of tuples with the
+    aggregated column pathname, the aggregate function and the name of the
+    result column).
+
+    :Parameters:
+
+    - `tmp_h5file`: the temporary database
+    - `table_uid`: UID of the tables.Table instance being queried
+    - `table`: the table being queried
+    - `qdescr`: dictionary description of the query
+    """
+
+    def workerTarget(self):
+        """Return the function run by the worker process."""
+        return queryworker.aggregateTable
+
+
+    def tableDescription(self):
+        """Return the description of the table of aggregates."""
+        return resultDescription(self.table, self.qdescr['group_by'],
+                                 self.qdescr['aggregates'])
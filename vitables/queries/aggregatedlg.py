@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#       Copyright (C) 2008-2017 Vicent Mas. All rights reserved
+#
+#       This program is free software: you can redistribute it and/or modify
+#       it under the terms of the GNU General Public License as published by
+#       the Free Software Foundation, either version 3 of the License, or
+#       (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#       MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#       GNU General Public License for more details.
+#
+#       You should have received a copy of the GNU General Public License
+#       along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#       Author:  Vicent Mas - vmas@vitables.org
+
+"""
+This module provides a dialog for describing aggregation queries.
+
+The user chooses the grouping column, the aggregated columns, the aggregate
+functions, an optional condition and the name of the result table.
+"""
+
+__docformat__ = 'restructuredtext'
+
+import logging
+
+import numpy
+from qtpy import QtCore
+from qtpy import QtWidgets
+
+import vitables.utils
+import vitables.queries.aggregate as aggregate
+import vitables.queries.tablecondition as tablecondition
+
+translate = QtWidgets.QApplication.translate
+
+log = logging.getLogger(__name__)
+
+
+def groupableColumns(table):
+    """Return the sorted pathnames of the columns that can be grouped by.
+
+    :Parameter table: the queried table
+    """
+
+    return sorted(colpath for (colpath, col) in table.coldescrs.items()
+                  if (col.shape == ()) and
+                  (table.coldtypes[colpath].kind != 'c'))
+
+
+def aggregableColumns(table):
+    """Return the sorted pathnames of the columns that can be aggregated.
+
+    :Parameter table: the queried table
+    """
+
+    return sorted(colpath for (colpath, col) in table.coldescrs.items()
+                  if (col.shape == ()) and
+                  (table.coldtypes[colpath].kind in 'biuf'))
+
+
+class AggregateDlg(QtWidgets.QDialog):
+    """
+    A dialog for describing aggregation queries on `tables.Table` nodes.
+
+    The dialog layout is a form with a name line edit, a grouping column
+    combobox, a checkable list of aggregated columns, a checkbox per
+    aggregate function and a condition line edit. The number of rows of
+    every group is always computed.
+
+    :Parameters:
+
+    - `info`: a dictionary with information about the table being queried
+    - `ft_names`: the list of filtered tables names currently in use
+    - `counter`: a counter used to give a unique ID to the query
+    - `table`: the table being queried
+    """
+
+    def __init__(self, info, ft_names, counter, table):
+        """Initialise the dialog."""
+
+        super(AggregateDlg, self).__init__(QtWidgets.qApp.activeWindow())
+
+        self.used_names = ft_names
+        self.condvars = info['condvars']
+        self.source_table = table
+
+        # If the dialog is cancelled these initial values will be returned to
+        # the caller
+        self.query_info = {}
+        self.query_info['condition'] = ''
+        self.query_info['condvars'] = self.condvars
+        self.query_info['rows_range'] = ()
+        self.query_info['ft_name'] = ''
+        self.query_info['indices_field_name'] = ''
+        self.query_info['src_filepath'] = info['src_filepath']
+        self.query_info['src_path'] = info['src_path']
+        self.query_info['group_by'] = ''
+        self.query_info['key_field'] = ''
+        self.query_info['aggregates'] = []
+
+        self.setWindowTitle(
+            translate('AggregateDlg', 'Aggregate table: {0}',
+                      'A dialog caption').format(info['name']))
+        form = QtWidgets.QFormLayout(self)
+
+        self.nameLE = QtWidgets.QLineEdit(
+            'Aggregate_{0}'.format(counter), self)
+        form.addRow(translate('AggregateDlg', '&Result name:',
+                              'A form label'), self.nameLE)
+
+        self.groupByCB = QtWidgets.QComboBox(self)
+        self.groupByCB.addItems(groupableColumns(table))
+        form.addRow(translate('AggregateDlg', '&Group by:', 'A form label'),
+                    self.groupByCB)
+
+        self.columnsLW = QtWidgets.QListWidget(self)
+        for colpath in aggregableColumns(table):
+            item = QtWidgets.QListWidgetItem(colpath, self.columnsLW)
+            item.setFlags(item.flags() | QtCore.Qt.ItemIsUserCheckable)
+            item.setCheckState(QtCore.Qt.Unchecked)
+        form.addRow(translate('AggregateDlg', '&Columns:', 'A form label'),
+                    self.columnsLW)
+
+        functions_layout = QtWidgets.QHBoxLayout()
+        self.functionsCB = {}
+        for function in aggregate.FUNCTIONS:
+            checkbox = QtWidgets.QCheckBox(function, self)
+            checkbox.setChecked(function == 'sum')
+            functions_layout.addWidget(checkbox)
+            self.functionsCB[function] = checkbox
+        form.addRow(translate('AggregateDlg', 'Functions:', 'A form label'),
+                    functions_layout)
+
+        self.conditionLE = QtWidgets.QLineEdit(self)
+        self.conditionLE.setToolTip(
+            translate('AggregateDlg',
+                      'Only rows that fulfill this condition are aggregated. '
+                      'Leave it empty for aggregating all rows.',
+                      'A tooltip'))
+        form.addRow(translate('AggregateDlg', '&Where:', 'A form label'),
+                    self.conditionLE)
+
+        self.buttonBox = QtWidgets.QDialogButtonBox(
+            QtWidgets.QDialogButtonBox.Ok | QtWidgets.QDialogButtonBox.Cancel,
+            parent=self)
+        form.addRow(self.buttonBox)
+
+        self.buttonBox.accepted.connect(self.composeQuery)
+        self.buttonBox.rejected.connect(self.reject)
+        self.nameLE.textChanged.connect(self.updateOKState)
+        self.updateOKState()
+
+    def updateOKState(self):
+        """Enable the `OK` button if the result name is valid."""
+
+        ft_name = self.nameLE.text()
+        status_ok = bool(ft_name) and (self.groupByCB.count() > 0)
+        if ft_name in self.used_names:
+            status_ok = False
+            log.error(
+                translate('AggregateDlg',
+                          """The chosen name is already in use. Please,"""
+                          """ choose another one.""",
+                          'A logger info message'))
+        self.buttonBox.button(QtWidgets.QDialogButtonBox.Ok).setEnabled(
+            status_ok)
+
+    def composeQuery(self):
+        """Slot for composing the query and accept the dialog."""
+
+        condition = self.conditionLE.text().strip()
+        if condition:
+            try:
+                tablecondition.checkCondition(
+                    self.source_table, condition,
+                    dict((name, col.pathname)
+                         for (name, col) in self.condvars.items()))
+            except Exception:
+                vitables.utils.formatExceptionInfo()
+                return
+
+        group_by = self.groupByCB.currentText()
+        aggregates = []
+        for row in range(self.columnsLW.count()):
+            item = self.columnsLW.item(row)
+            if item.checkState() != QtCore.Qt.Checked:
+                continue
+            for function in aggregate.FUNCTIONS:
+                if self.functionsCB[function].isChecked():
+                    aggregates.append(
+                        (item.text(), function,
+                         aggregate.resultField(item.text(), function)))
+
+        key_field = group_by.replace('/', '_')
+        if key_field in ['count'] + [field for (colpath, function, field)
+                                     in aggregates]:
+            log.error(
+                translate('AggregateDlg',
+                          'The grouping column {0} clashes with the columns '
+                          'of aggregates.',
+                          'A logger error message').format(group_by))
+            return
+
+        self.query_info['condition'] = condition
+        self.query_info['ft_name'] = self.nameLE.text()
+        self.query_info['group_by'] = group_by
+        self.query_info['key_field'] = key_field
+        self.query_info['aggregates'] = aggregates
+        self.query_info['rows_range'] = (
+            numpy.int64(0), numpy.int64(self.source_table.nrows),
+            numpy.int64(1))
+        self.accept()
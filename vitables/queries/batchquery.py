@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#       Copyright (C) 2008-2017 Vicent Mas. All rights reserved
+#
+#       This program is free software: you can redistribute it and/or modify
+#       it under the terms of the GNU General Public License as published by
+#       the Free Software Foundation, either version 3 of the License, or
+#       (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#       MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#       GNU General Public License for more details.
+#
+#       You should have received a copy of the GNU General Public License
+#       along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#       Author:  Vicent Mas - vmas@vitables.org
+
+"""
+This module executes a query on the tables of several files at low level.
+
+The same condition is applied to the table with a given path in every file.
+Files are queried in parallel by a pool of worker processes (one file per
+worker at a time) and the results are concatenated in a single filtered table
+that has a column with the path of the file where every selected row comes
+from.
+"""
+
+__docformat__ = 'restructuredtext'
+
+import logging
+import multiprocessing
+import time
+
+import tables
+
+from qtpy import QtWidgets
+
+import vitables.utils
+import vitables.workerutils
+import vitables.queries.query as query
+import vitables.queries.queryworker as queryworker
+
+translate = QtWidgets.QApplication.translate
+
+log = logging.getLogger(__name__)
+
+# The default name of the column with the path of the source files
+SOURCE_FIELD_NAME = 'source_file'
+
+
+class BatchQuery(query.Query):
+    """Class implementing a query on the tables of several files.
+
+    The query is described (condition, range, names...) in terms of a
+    template table, which is the table selected in the tree of databases
+    when the query is requested. Tables of the other files must have the
+    same description than the template table. Files whose tables don't
+    fulfill this requirement are skipped.
+
+    Progress is given in files: `rows_total` is the number of queried files
+    and `rows_scanned` is the number of files already queried.
+
+    :Parameters:
+
+    - `tmp_h5file`: the temporary database
+    - `table_uid`: UID of the template table
+    - `table`: the template table
+    - `qdescr`: dictionary description of the query
+    - `filepaths`: the full paths of the queried files
+    """
+
+    def __init__(self, tmp_h5file, table_uid, table, qdescr, filepaths):
+        """Initialises the query."""
+
+        super(BatchQuery, self).__init__(tmp_h5file, table_uid, table,
+                                         qdescr)
+
+        self.filepaths = list(filepaths)
+        self.rows_total = len(self.filepaths)
+        # The pool of worker processes and the iterator over its results
+        self.pool = None
+        self.results = None
+
+        # The column with the paths of the queried files cannot clash with
+        # the columns of the template table
+        self.source_field = SOURCE_FIELD_NAME
+        while self.source_field in self.table.colnames or \
+                self.source_field == qdescr['indices_field_name']:
+            self.source_field = '_' + self.source_field
+
+
+    def run(self):
+        """
+        Launch the pool of worker processes that query the files.
+
+        Every worker returns the rows selected in a whole file. They are
+        added to the temporary database as they arrive.
+        """
+
+        try:
+            self.f_table = self.createFilteredTable()
+        except tables.NodeError:
+            vitables.utils.formatExceptionInfo()
+            self.query_completed.emit(self.completed, self.table_uid)
+            return
+
+        # Columns cannot be sent to the worker processes so condition
+        # variables are replaced by the pathnames of the columns. A stop
+        # equal to the number of rows of the template table means the end
+        # of every queried table
+        (start, stop, step) = self.qdescr['rows_range']
+        if stop == self.table.nrows:
+            stop = None
+        else:
+            stop = int(stop)
+        worker_qdescr = dict(self.qdescr)
+        worker_qdescr['condvars'] = dict(
+            (name, col.pathname)
+            for (name, col) in self.qdescr['condvars'].items())
+        worker_qdescr['rows_range'] = (int(start), stop, int(step))
+        tasks = [(dict(worker_qdescr, src_filepath=filepath),
+                  self.table.dtype, self.f_table.dtype, self.source_field)
+                 for filepath in self.filepaths]
+
+        self.start_time = time.time()
+        self.pool = vitables.workerutils.startPool(len(tasks))
+        self.results = self.pool.imap_unordered(queryworker.queryFile, tasks)
+        self.timer.start(query.POLL_INTERVAL)
+
+
+    def tableDescription(self):
+        """Return the description of the filtered table.
+
+        The first column of the table contains the paths of the queried
+        files.
+        """
+
+        ft_dict = super(BatchQuery, self).tableDescription()
+        ft_dict = dict(ft_dict)
+        itemsize = max(len(filepath.encode('utf-8'))
+                       for filepath in self.filepaths)
+        ft_dict[self.source_field] = tables.StringCol(itemsize, pos=-2)
+        return ft_dict
+
+
+    def readResults(self):
+        """Append to the filtered table the rows selected by the workers.
+
+        This is a slot called periodically by the query timer. The progress
+        of the query is reported once per call.
+        """
+
+        deadline = time.time() + query.APPEND_TIME_SLICE
+        while time.time() < deadline:
+            try:
+                (filepath, rows, profile, error) = \
+                    self.results.next(timeout=0)
+            except multiprocessing.TimeoutError:
+                break
+            except StopIteration:
+                self.finish(True)
+                return
+            self.rows_scanned += 1
+            # The query profile adds up the profiles of all files
+            for name in ('select_time', 'chunks', 'bytes_read',
+                         'rows_scanned'):
+                self.profile[name] += profile[name]
+            self.profile['uses_index'] |= profile['uses_index']
+            if error is not None:
+                log.warning(
+                    translate('BatchQuery',
+                              'File {0} has been skipped by the query:\n{1}',
+                              'A batch query warning').format(filepath,
+                                                              error))
+            elif rows.shape != (0, ):
+                started = time.time()
+                self.f_table.append(rows)
+                self.append_time += time.time() - started
+                self.rows_matched += rows.shape[0]
+
+        elapsed = time.time() - self.start_time
+        throughput = self.profile['rows_scanned'] / elapsed if elapsed > 0 \
+            else 0.0
+        self.query_progress.emit(self.rows_scanned, self.rows_matched,
+                                 throughput)
+
+
+    def cancel(self):
+        """Stop the query and remove the partially filled table.
+
+        This is a slot called when the user cancels the query. Calls done
+        after the query has finished are ignored.
+        """
+
+        if not self.timer.isActive():
+            return
+        self.cancelled = True
+        self.pool.terminate()
+        self.finish(False)
+
+
+    def releaseWorker(self):
+        """Release the pool of worker processes."""
+
+        self.pool.terminate()
+        self.pool.join()
@@ -0,0 +1,336 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#       Copyright (C) 2008-2017 Vicent Mas. All rights reserved
+#
+#       This program is free software: you can redistribute it and/or modify
+#       it under the terms of the GNU General Public License as published by
+#       the Free Software Foundation, either version 3 of the License, or
+#       (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#       MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#       GNU General Public License for more details.
+#
+#       You should have received a copy of the GNU General Public License
+#       along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#       Author:  Vicent Mas - vmas@vitables.org
+
+"""
+This module implements a controller for managing the indexes of table columns.
+
+Indexes make queries much faster. The manager adds a `Column Index` submenu
+to the `Dataset` menu (and to the leaf context menu) with entries for creating
+(completely sorted indexes), rebuilding and removing the index of a column.
+
+Indexing a large column takes long so it is done in a worker process. The
+worker writes to the file where the table lives, and `PyTables` doesn't
+support concurrent writers, so the file is closed in ``ViTables`` while the
+worker is running and it is reopened (at the same position of the tree of
+databases) when the worker finishes.
+"""
+
+__docformat__ = 'restructuredtext'
+
+import logging
+import time
+
+from qtpy import QtCore
+from qtpy import QtGui
+from qtpy import QtWidgets
+
+import vitables.utils
+import vitables.workerutils
+import vitables.queries.queryworker as queryworker
+
+translate = QtWidgets.QApplication.translate
+
+log = logging.getLogger(__name__)
+
+
+def indexableColumns(table):
+    """Return a mapping of indexable column pathnames to their index state.
+
+    Only scalar columns whose type is not complex can be indexed.
+
+    :Parameter table: the `tables.Table` instance being inspected
+    """
+
+    columns = {}
+    for (colpath, is_indexed) in table.colindexed.items():
+        if (table.coldescrs[colpath].shape == ()) and \
+                not table.coltypes[colpath].count('complex'):
+            columns[colpath] = is_indexed
+    return columns
+
+
+class IndexesManager(QtCore.QObject):
+    """This is the class in charge of creating and removing column indexes.
+
+    No more than one index operation can be made at the same time on a given
+    file. Operations in progress are tracked in a dictionary keyed by the
+    file path.
+
+    :Parameter parent: the parent of the `IndexesManager` object
+    """
+
+    def __init__(self, parent=None):
+        """Setup the indexes manager."""
+
+        super(IndexesManager, self).__init__(parent)
+
+        # The index operations currently running, keyed by file path
+        self.jobs = {}
+
+        self.vtapp = vitables.utils.getVTApp()
+        self.vtgui = self.vtapp.gui
+        self.dbt_view = self.vtgui.dbs_tree_view
+        self.dbt_model = self.vtgui.dbs_tree_model
+
+        # Add entries to the Dataset menu and to the leaf context menu
+        self.icons_dictionary = vitables.utils.getIcons()
+        self.addEntry()
+
+        # Connect signals to slots
+        self.vtgui.dataset_menu.aboutToShow.connect(self.updateIndexActions)
+        self.vtgui.leaf_node_cm.aboutToShow.connect(self.updateIndexActions)
+
+    def addEntry(self):
+        """Add the `Column Index` submenu to the `Dataset` menu."""
+
+        self.index_submenu = QtWidgets.QMenu(
+            translate('IndexesManager', 'Column &Index',
+                      'Dataset -> Column Index'))
+        self.index_submenu.setObjectName('index_submenu')
+
+        self.actions = {}
+        self.actions['indexCreate'] = QtWidgets.QAction(
+            translate('IndexesManager', '&Create...',
+                      'Dataset -> Column Index -> Create'),
+            self,
+            shortcut=QtGui.QKeySequence.UnknownKey,
+            triggered=self.createIndex,
+            statusTip=translate(
+                'IndexesManager',
+                'Create a completely sorted index for a table column',
+                'Status bar text for the Dataset -> Column Index -> Create '
+                'action'))
+        self.actions['indexCreate'].setObjectName('indexCreate')
+
+        self.actions['indexReindex'] = QtWidgets.QAction(
+            translate('IndexesManager', '&Reindex...',
+                      'Dataset -> Column Index -> Reindex'),
+            self,
+            shortcut=QtGui.QKeySequence.UnknownKey,
+            triggered=self.reindex,
+            statusTip=translate(
+                'IndexesManager',
+                'Rebuild the index of a table column',
+                'Status bar text for the Dataset -> Column Index -> Reindex '
+                'action'))
+        self.actions['indexReindex'].setObjectName('indexReindex')
+
+        self.actions['indexRemove'] = QtWidgets.QAction(
+            translate('IndexesManager', 'Re&move...',
+                      'Dataset -> Column Index -> Remove'),
+            self,
+            shortcut=QtGui.QKeySequence.UnknownKey,
+            triggered=self.removeIndex,
+            statusTip=translate(
+                'IndexesManager',
+                'Remove the index of a table column',
+                'Status bar text for the Dataset -> Column Index -> Remove '
+                'action'))
+        self.actions['indexRemove'].setObjectName('indexRemove')
+
+        keys = ('indexCreate', 'indexReindex', 'indexRemove')
+        vitables.utils.addActions(self.index_submenu, keys, self.actions)
+
+        # Add the submenu to the Dataset menu and to the leaf context menu
+        vitables.utils.addToMenu(self.vtgui.dataset_menu, self.index_submenu)
+        vitables.utils.addToLeafContextMenu(self.index_submenu)
+
+    def currentTable(self):
+        """Return the tree node of the selected table if it can be indexed.
+
+        Tables living in the temporary database or in files open in
+        read-only mode cannot be indexed. Neither tables living in files
+        that are being queried or indexed.
+        """
+
+        current = self.dbt_view.currentIndex()
+        node = self.dbt_model.nodeFromIndex(current)
+        if (node == self.dbt_model.root) or (node.node_kind != 'table'):
+            return None
+        if node.filepath == self.dbt_model.tmp_filepath:
+            return None
+        if self.dbt_model.getDBDoc(node.filepath).mode == 'r':
+            return None
+        if node.filepath in self.jobs:
+            return None
+        prefix = '{0}->'.format(node.filepath)
+        for table_uid in self.vtapp.queries_mgr.running_queries:
+            if table_uid.startswith(prefix):
+                return None
+        return node
+
+    def updateIndexActions(self):
+        """Update the index actions when the Dataset menu is pulled down.
+
+        This method is a slot. See class ctor for details.
+        """
+
+        enabled = set()
+        node = self.currentTable()
+        if node is not None:
+            columns = indexableColumns(node.node)
+            if not all(columns.values()):
+                enabled.add('indexCreate')
+            if any(columns.values()):
+                enabled = enabled.union(['indexReindex', 'indexRemove'])
+
+        self.index_submenu.setEnabled(bool(enabled))
+        for (name, action) in self.actions.items():
+            action.setEnabled(name in enabled)
+
+    def createIndex(self):
+        """Slot for indexing a column of the selected table."""
+        self.runIndexAction('create')
+
+    def reindex(self):
+        """Slot for rebuilding the index of a column of the selected table."""
+        self.runIndexAction('reindex')
+
+    def removeIndex(self):
+        """Slot for removing the index of a column of the selected table."""
+        self.runIndexAction('remove')
+
+    def selectColumn(self, table, action):
+        """Ask the user for the column whose index is being managed.
+
+        :Parameters:
+
+        - `table`: the `tables.Table` instance being indexed
+        - `action`: one of 'create', 'reindex' or 'remove'
+        """
+
+        columns = indexableColumns(table)
+        # Unindexed columns can be indexed, indexed columns can be
+        # reindexed or unindexed
+        candidates = sorted(colpath for (colpath, is_indexed)
+                            in columns.items()
+                            if is_indexed != (action == 'create'))
+        if not candidates:
+            return None
+        colpath, is_accepted = QtWidgets.QInputDialog.getItem(
+            self.vtgui,
+            translate('IndexesManager', 'Column index',
+                      'Caption of the column selector dialog'),
+            translate('IndexesManager', 'Column:',
+                      'Label of the column selector dialog'),
+            candidates, 0, False)
+        if not is_accepted:
+            return None
+        return colpath
+
+    def runIndexAction(self, action):
+        """Create, rebuild or remove the index of a column in the background.
+
+        The file where the table lives is closed before launching the worker
+        process and reopened when the worker finishes.
+
+        :Parameter action: one of 'create', 'reindex' or 'remove'
+        """
+
+        node = self.currentTable()
+        if node is None:
+            return
+        colpath = self.selectColumn(node.node, action)
+        if colpath is None:
+            return
+
+        filepath = node.filepath
+        nodepath = node.nodepath
+        mode = self.dbt_model.getDBDoc(filepath).mode
+        for (position, child) in enumerate(self.dbt_model.root.children):
+            if child.filepath == filepath:
+                break
+
+        # Release the file so the worker process can write to it
+        index = self.dbt_model.index(position, 0, QtCore.QModelIndex())
+        self.vtapp.fileClose(index)
+
+        worker, conn = vitables.workerutils.startWorker(
+            queryworker.manageIndex, (filepath, nodepath, colpath, action))
+
+        # Index creation cannot be monitored nor safely interrupted (the
+        # file could be corrupted) so the dialog is a busy indicator with
+        # no Cancel button
+        dialog = QtWidgets.QProgressDialog(self.vtgui)
+        dialog.setWindowTitle(
+            translate('IndexesManager', 'Column index',
+                      'Caption of the indexing progress dialog'))
+        dialog.setCancelButton(None)
+        dialog.setRange(0, 0)
+        dialog.setMinimumDuration(0)
+        dialog.setAutoClose(False)
+        dialog.setAutoReset(False)
+        dialog.show()
+
+        timer = QtCore.QTimer(self)
+        self.jobs[filepath] = {'worker': worker, 'conn': conn,
+                               'timer': timer, 'dialog': dialog,
+                               'mode': mode, 'position': position,
+                               'description': '{0} {1}/{2}'.format(
+                                   action, nodepath, colpath),
+                               'start_time': time.time()}
+        timer.timeout.connect(lambda: self.checkJob(filepath))
+        timer.start(200)
+        self.checkJob(filepath)
+
+    def checkJob(self, filepath):
+        """Update the progress dialog and finish the job if it is done.
+
+        This is a slot called periodically by the job timer.
+
+        :Parameter filepath: the full path of the file being indexed
+        """
+
+        job = self.jobs[filepath]
+        elapsed = time.time() - job['start_time']
+        job['dialog'].setLabelText(
+            translate('IndexesManager',
+                      'Index operation: {0}\nFile: {1}\n'
+                      'Elapsed time: {2:.0f} s\n\n'
+                      'The file will be reopened when the operation '
+                      'finishes.',
+                      'Label of the indexing progress dialog').format(
+                          job['description'], filepath, elapsed))
+
+        try:
+            if not job['conn'].poll():
+                return
+            kind, content = job['conn'].recv()
+        except (EOFError, OSError):
+            # The worker process died unexpectedly
+            kind, content = ('error', translate(
+                'IndexesManager', 'The index worker process died.',
+                'An index operation error'))
+
+        job['timer'].stop()
+        job['conn'].close()
+        job['worker'].join()
+        job['dialog'].close()
+        job['dialog'].deleteLater()
+        del self.jobs[filepath]
+
+        if kind == 'done':
+            log.info(
+                translate('IndexesManager',
+                          'Index operation finished: {0}',
+                          'Info log message').format(job['description']))
+        else:
+            log.error(content)
+        self.vtapp.fileOpen(filepath, job['mode'], job['position'])
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#       Copyright (C) 2008-2017 Vicent Mas. All rights reserved
+#
+#       This program is free software: you can redistribute it and/or modify
+#       it under the terms of the GNU General Public License as published by
+#       the Free Software Foundation, either version 3 of the License, or
+#       (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#       MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#       GNU General Public License for more details.
+#
+#       You should have received a copy of the GNU General Public License
+#       along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#       Author:  Vicent Mas - vmas@vitables.org
+
+"""
+This module executes join queries at low level.
+
+A join query matches the rows of two tables (that can live in different
+files) whose key columns have the same value. Every pair of matching rows
+becomes a row of the joined table, which has a `left` and a `right` nested
+column with the fields of the first and the second table respectively.
+
+The smaller table (the build side) is loaded in memory so joins are refused
+when it exceeds a memory budget.
+"""
+
+__docformat__ = 'restructuredtext'
+
+import numpy
+
+import vitables.queries.query as query
+import vitables.queries.queryworker as queryworker
+
+# Default memory budget (in MB) of the build side of joins
+MEMORY_BUDGET = 512
+
+
+def buildSide(left_table, right_table):
+    """Return the side of a join that is loaded in memory.
+
+    :Parameters:
+
+    - `left_table`: the first joined table
+    - `right_table`: the second joined table
+
+    :Returns: 'left' or 'right'
+    """
+
+    if queryworker.buildSideSize(right_table) <= \
+            queryworker.buildSideSize(left_table):
+        return 'right'
+    return 'left'
+
+
+def canJoin(left_table, left_key, right_table, right_key):
+    """Return True if two key columns can be compared.
+
+    Keys must be scalar and either both numeric or both strings.
+
+    :Parameters:
+
+    - `left_table`: the first joined table
+    - `left_key`: the pathname of the key column of the first table
+    - `right_table`: the second joined table
+    - `right_key`: the pathname of the key column of the second table
+    """
+
+    kinds = []
+    for (table, key) in ((left_table, left_key), (right_table, right_key)):
+        if table.coldescrs[key].shape != ():
+            return False
+        kind = table.coldtypes[key].kind
+        kinds.append('numeric' if kind in 'biuf' else kind)
+    return (kinds[0] == kinds[1]) and (kinds[0] in ('numeric', 'S'))
+
+
+class JoinQuery(query.Query):
+    """Class implementing a join query.
+
+    The query description has the usual items (the first table being the
+    queried table) plus `right_filepath` and `right_path` (the second
+    table), `left_key` and `right_key` (the pathnames of the key columns),
+    `build_side` and `memory_budget` (in bytes). The rows range is the
+    range of the probe side, i.e. the table streamed by the worker.
+
+    :Parameters:
+
+    - `tmp_h5file`: the temporary database
+    - `table_uid`: UID of the first table
+    - `table`: the first table
+    - `right_table`: the second table
+    - `qdescr`: dictionary description of the query
+    """
+
+    def __init__(self, tmp_h5file, table_uid, table, right_table, qdescr):
+        """Initialises the query."""
+
+        self.right_table = right_table
+        qdescr['build_side'] = buildSide(table, right_table)
+        probe_table = right_table if qdescr['build_side'] == 'left' \
+            else table
+        qdescr['rows_range'] = (numpy.int64(0),
+                                numpy.int64(probe_table.nrows),
+                                numpy.int64(1))
+        super(JoinQuery, self).__init__(tmp_h5file, table_uid, table, qdescr)
+
+
+    def run(self):
+        """Launch the worker process that joins the tables."""
+
+        # Make sure that the worker process sees the current content of the
+        # second table too
+        if self.right_table._v_file.mode != 'r':
+            self.right_table._v_file.flush()
+        super(JoinQuery, self).run()
+
+
+    def workerTarget(self):
+        """Return the function run by the worker process."""
+        return queryworker.joinTables
+
+
+    def tableDescription(self):
+        """Return the description of the joined table."""
+
+        return {'left': dict(self.table.description._v_colobjects),
+                'right': dict(self.right_table.description._v_colobjects)}
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#       Copyright (C) 2008-2017 Vicent Mas. All rights reserved
+#
+#       This program is free software: you can redistribute it and/or modify
+#       it under the terms of the GNU General Public License as published by
+#       the Free Software Foundation, either version 3 of the License, or
+#       (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#       MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#       GNU General Public License for more details.
+#
+#       You should have received a copy of the GNU General Public License
+#       along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#       Author:  Vicent Mas - vmas@vitables.org
+
+"""
+This module provides a dialog for describing join queries.
+
+The user chooses the second table (among the tables of the open files), the
+key columns of both tables, the memory budget of the join and the name of the
+joined table.
+"""
+
+__docformat__ = 'restructuredtext'
+
+import logging
+import os.path
+
+from qtpy import QtWidgets
+
+import vitables.queries.join as join
+
+translate = QtWidgets.QApplication.translate
+
+log = logging.getLogger(__name__)
+
+
+def keyColumns(table):
+    """Return the sorted pathnames of the columns that can be join keys.
+
+    :Parameter table: a joined table
+    """
+
+    return sorted(colpath for (colpath, col) in table.coldescrs.items()
+                  if (col.shape == ()) and
+                  (table.coldtypes[colpath].kind in 'biufS'))
+
+
+class JoinDlg(QtWidgets.QDialog):
+    """
+    A dialog for describing join queries on `tables.Table` nodes.
+
+    The dialog layout is a form with a name line edit, a key column
+    combobox for the selected table, a table combobox and a key column
+    combobox for the second table and a memory budget spinbox.
+
+    :Parameters:
+
+    - `info`: a dictionary with information about the first table
+    - `ft_names`: the list of filtered tables names currently in use
+    - `counter`: a counter used to give a unique ID to the query
+    - `table`: the first table
+    - `candidates`: a list of the tables that can be joined with the first
+      table
+    """
+
+    def __init__(self, info, ft_names, counter, table, candidates):
+        """Initialise the dialog."""
+
+        super(JoinDlg, self).__init__(QtWidgets.qApp.activeWindow())
+
+        self.used_names = ft_names
+        self.source_table = table
+        self.candidates = candidates
+        # The second table of the join, set when the dialog is accepted
+        self.right_table = None
+
+        # If the dialog is cancelled these initial values will be returned to
+        # the caller
+        self.query_info = {}
+        self.query_info['condition'] = ''
+        self.query_info['condvars'] = {}
+        self.query_info['ft_name'] = ''
+        self.query_info['indices_field_name'] = ''
+        self.query_info['src_filepath'] = info['src_filepath']
+        self.query_info['src_path'] = info['src_path']
+        self.query_info['right_filepath'] = ''
+        self.query_info['right_path'] = ''
+        self.query_info['left_key'] = ''
+        self.query_info['right_key'] = ''
+        self.query_info['memory_budget'] = 0
+
+        self.setWindowTitle(
+            translate('JoinDlg', 'Join table: {0}',
+                      'A dialog caption').format(info['name']))
+        form = QtWidgets.QFormLayout(self)
+
+        self.nameLE = QtWidgets.QLineEdit('Joined_{0}'.format(counter), self)
+        form.addRow(translate('JoinDlg', '&Result name:', 'A form label'),
+                    self.nameLE)
+
+        self.leftKeyCB = QtWidgets.QComboBox(self)
+        self.leftKeyCB.addItems(keyColumns(table))
+        form.addRow(translate('JoinDlg', '&Key column:', 'A form label'),
+                    self.leftKeyCB)
+
+        self.rightTableCB = QtWidgets.QComboBox(self)
+        for candidate in candidates:
+            self.rightTableCB.addItem('{0}: {1}'.format(
+                os.path.basename(candidate._v_file.filename),
+                candidate._v_pathname))
+        form.addRow(translate('JoinDlg', '&Join with:', 'A form label'),
+                    self.rightTableCB)
+
+        self.rightKeyCB = QtWidgets.QComboBox(self)
+        form.addRow(translate('JoinDlg', 'K&ey column:', 'A form label'),
+                    self.rightKeyCB)
+
+        self.budgetSB = QtWidgets.QSpinBox(self)
+        self.budgetSB.setRange(1, 1024 * 1024)
+        self.budgetSB.setSuffix(' MB')
+        self.budgetSB.setValue(join.MEMORY_BUDGET)
+        self.budgetSB.setToolTip(
+            translate('JoinDlg',
+                      'The smaller table is loaded in memory. The join is '
+                      'refused if it needs more memory than this.',
+                      'A tooltip'))
+        form.addRow(translate('JoinDlg', '&Memory budget:', 'A form label'),
+                    self.budgetSB)
+
+        self.buttonBox = QtWidgets.QDialogButtonBox(
+            QtWidgets.QDialogButtonBox.Ok | QtWidgets.QDialogButtonBox.Cancel,
+            parent=self)
+        form.addRow(self.buttonBox)
+
+        self.buttonBox.accepted.connect(self.composeQuery)
+        self.buttonBox.rejected.connect(self.reject)
+        self.rightTableCB.currentIndexChanged.connect(self.updateRightKeys)
+        self.nameLE.textChanged.connect(self.updateOKState)
+        self.updateRightKeys(self.rightTableCB.currentIndex())
+
+    def updateRightKeys(self, index):
+        """Fill the key column combobox of the second table.
+
+        :Parameter index: the index of the selected second table
+        """
+
+        self.rightKeyCB.clear()
+        if index >= 0:
+            self.rightKeyCB.addItems(keyColumns(self.candidates[index]))
+        self.updateOKState()
+
+    def updateOKState(self):
+        """Enable the `OK` button if the join is fully described."""
+
+        ft_name = self.nameLE.text()
+        status_ok = bool(ft_name) and (self.leftKeyCB.count() > 0) and \
+            (self.rightKeyCB.count() > 0)
+        if ft_name in self.used_names:
+            status_ok = False
+            log.error(
+                translate('JoinDlg',
+                          """The chosen name is already in use. Please,"""
+                          """ choose another one.""",
+                          'A logger info message'))
+        self.buttonBox.button(QtWidgets.QDialogButtonBox.Ok).setEnabled(
+            status_ok)
+
+    def composeQuery(self):
+        """Slot for composing the query and accept the dialog."""
+
+        right_table = self.candidates[self.rightTableCB.currentIndex()]
+        left_key = self.leftKeyCB.currentText()
+        right_key = self.rightKeyCB.currentText()
+        if not join.canJoin(self.source_table, left_key,
+                            right_table, right_key):
+            log.error(
+                translate('JoinDlg',
+                          'Columns {0} and {1} cannot be compared. Join keys '
+                          'must be both numbers or both strings.',
+                          'A logger error message').format(left_key,
+                                                           right_key))
+            return
+
+        self.right_table = right_table
+        self.query_info['ft_name'] = self.nameLE.text()
+        self.query_info['right_filepath'] = right_table._v_file.filename
+        self.query_info['right_path'] = right_table._v_pathname
+        self.query_info['left_key'] = left_key
+        self.query_info['right_key'] = right_key
+        self.query_info['memory_budget'] = self.budgetSB.value() * 2**20
+        self.accept()
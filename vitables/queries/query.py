@@ -20,34 +20,54 @@
 #       Author:  Vicent Mas - vmas@vitables.org
 
 """
-This module executes `tables.Table` queries at low level.
+This module executes `tables.Table` (and homogeneous array) queries at low
+level.
 
 It collects information from the `New Query` dialog, processes it and then
-executes the query.
+executes the query in a worker process.
+
+The profile of every completed query (where the time was spent, how much
+data was read...) is stored in the attributes of the filtered table, next to
+the attributes that describe the query.
 """
 
 __docformat__ = 'restructuredtext'
 
+import logging
+import time
+
 import tables
-import numpy
 
 from qtpy import QtCore
 from qtpy import QtGui
 from qtpy import QtWidgets
 
 import vitables.utils
+import vitables.workerutils
+import vitables.queries.queryworker as queryworker
 
 translate = QtWidgets.QApplication.translate
 
+log = logging.getLogger(__name__)
+
+# Interval (in milliseconds) between two consecutive reads of the pipe
+# connected to the worker process
+POLL_INTERVAL = 50
+# Maximum time (in seconds) spent appending rows in a single read of the pipe
+# so that the GUI keeps responsive
+APPEND_TIME_SLICE = 0.05
+
 
 class Query(QtCore.QObject):
     """Class implementing a tables.Table query.
 
-    Ideally queries SHOULD be sequentially executed in a secondary thread for
-    keeping the GUI responsive (i.e. not frozen) while a query (a potentially
-    long-running operation) is taking place. Unfortunately this goal has
-    proven difficult to achieve because `PyTables` is not thread-safe. So one
-    more task to the TO DO list :-)
+    `PyTables` is not thread-safe so queries cannot be executed in a
+    secondary thread. Instead, every query is executed in a worker process
+    that opens the source file in read-only mode on its own. The selected
+    rows are sent back through a pipe which is periodically read (using a
+    timer) by the GUI process. This way the GUI keeps responsive while a
+    query (a potentially long-running operation) is taking place and several
+    queries on different tables can run concurrently.
 
     The query is implemented in a clever way that doesn't interfer with the
     lazy population of the tree of databases view: the query results table is
@@ -60,6 +80,7 @@ class Query(QtCore.QObject):
 
     :Parameters:
 
+    - `tmp_h5file`: the temporary database
     - `table_uid`: UID of the tables.Table instance being queried
     - `table`: the table being queried
     - `qdescr`: dictionary description of the query
@@ -67,6 +88,9 @@ class Query(QtCore.QObject):
 
 
     query_completed = QtCore.Signal(bool, str, name="queryCompleted")
+    # Rows scanned, rows matched and throughput (rows/s) of the query
+    query_progress = QtCore.Signal(object, object, float,
+                                   name="queryProgress")
 
 
     def __init__(self, tmp_h5file, table_uid, table, qdescr):
@@ -75,19 +99,129 @@ class Query(QtCore.QObject):
         super(Query, self).__init__()
 
         self.completed = False
+        self.cancelled = False
         self.tmp_h5file = tmp_h5file
         self.table_uid = table_uid
         self.table = table
         self.qdescr = qdescr
 
+        # The filtered table, the worker process and the receiving end of
+        # the pipe connected to it
+        self.f_table = None
+        self.worker = None
+        self.conn = None
+
+        # Progress of the query
+        (start, stop, step) = qdescr['rows_range']
+        self.rows_total = int(stop - start)
+        self.rows_scanned = 0
+        self.rows_matched = 0
+        self.start_time = None
+        # Whether the query uses column indexes or not
+        self.uses_index = False
+        # The profile of the query as given by the worker and the time
+        # spent appending rows to the filtered table
+        self.profile = queryworker.newProfile()
+        self.append_time = 0.0
+
+        self.timer = QtCore.QTimer(self)
+        self.timer.timeout.connect(self.readResults)
+
 
     def run(self):
         """
-        Query a table and add a the result to the temporary database.
+        Launch the worker process that queries the table.
+
+        The result is added to the temporary database as it arrives.
         """
 
-        self.queryTable()
-        self.query_completed.emit(self.completed, self.table_uid)
+        try:
+            self.f_table = self.createFilteredTable()
+        except tables.NodeError:
+            vitables.utils.formatExceptionInfo()
+            self.query_completed.emit(self.completed, self.table_uid)
+            return
+
+        # Make sure that the worker process sees the current content of the
+        # source file
+        if self.table._v_file.mode != 'r':
+            self.table._v_file.flush()
+
+        # Columns cannot be sent to the worker process so condition
+        # variables are replaced by the pathnames of the columns
+        worker_qdescr = dict(self.qdescr)
+        worker_qdescr['condvars'] = dict(
+            (name, col.pathname)
+            for (name, col) in self.qdescr['condvars'].items())
+
+        self.start_time = time.time()
+        self.worker, self.conn = vitables.workerutils.startWorker(
+            self.workerTarget(), (worker_qdescr, self.f_table.dtype))
+        self.timer.start(POLL_INTERVAL)
+
+
+    def workerTarget(self):
+        """Return the function run by the worker process."""
+
+        if isinstance(self.table, tables.Table):
+            return queryworker.queryTable
+        return queryworker.queryArray
+
+
+    def createFilteredTable(self):
+        """Create the table where the query results are stored.
+
+        If an indices column has been requested it is the first column of the
+        table. Filtered arrays are tables with a column of coordinates and a
+        column of values.
+        """
+
+        if isinstance(self.table, tables.Table):
+            ft_dict = self.tableDescription()
+        else:
+            ft_dict = self.arrayDescription()
+        # The number of rows in the queried range is an upper bound of the
+        # size of the result. It gives a sensible chunkshape for big results
+        (start, stop, step) = self.qdescr['rows_range']
+        expectedrows = max(1, int((stop - start) // step))
+        return self.tmp_h5file.create_table(
+            '/_p_query_results',
+            self.qdescr['ft_name'],
+            ft_dict,
+            self.qdescr['title'],
+            expectedrows=expectedrows)
+
+
+    def tableDescription(self):
+        """Return the description of the filtered table of a table query."""
+
+        src_dict = self.table.description._v_colobjects
+        # Add an `indexes` column to the result table. Int64 values are
+        # necessary to keep full 64-bit indices
+        if self.qdescr['indices_field_name']:
+            ft_dict = {
+                self.qdescr['indices_field_name']: tables.Int64Col(pos=-1)}
+            ft_dict.update(src_dict)
+        # Do no add an `indexes` column to the result table
+        else:
+            ft_dict = src_dict
+        return ft_dict
+
+
+    def arrayDescription(self):
+        """Return the description of the filtered table of an array query.
+
+        The coordinates column has a cell per array dimension unless the
+        array is 1-dimensional.
+        """
+
+        ndim = len(self.table.shape)
+        coords_shape = (ndim, ) if ndim > 1 else ()
+        return {
+            self.qdescr['indices_field_name']:
+                tables.Int64Col(shape=coords_shape, pos=0),
+            queryworker.ARRAY_VARIABLE:
+                tables.Col.from_atom(self.table.atom, pos=1)}
 
 
     def flushTable(self, ftable):
@@ -98,132 +232,133 @@ class Query(QtCore.QObject):
         - `ftable`: the filtered table being flushed
         """
 
+        started = time.time()
         ftable.flush()
+        flush_time = time.time() - started
         # Set some user attributes that define this filtered table
         asi = ftable.attrs
         asi.query_path = self.qdescr['src_filepath']
         asi.query_table = self.qdescr['src_path']
         asi.query_condition = self.qdescr['title']
+        self.writeProfile(ftable, flush_time)
+
+
+    def writeProfile(self, ftable, flush_time):
+        """Store the profile of the query in the filtered table attributes.
 
+        :Parameters:
 
-    def queryWithIndex(self, src_dict):
-        """Do the query (`PyTables` level).
+        - `ftable`: the filtered table
+        - `flush_time`: the time spent flushing the filtered table
         """
 
-        # The query range is made of numpy scalars with dtype int64
-        (start, stop, step) = self.qdescr['rows_range']
-        chunk_size = 10000
-        div = int((stop - start) // chunk_size)
-
-        # Create the destination table: its first column will contain
-        # the indices of the rows selected in the source table so a new
-        # description dictionary is needed. Int64 values are necessary
-        # to keep full 64-bit indices
-        ft_dict = {self.qdescr['indices_field_name']: tables.Int64Col(pos=-1)}
-        ft_dict.update(src_dict)
-        f_table = self.tmp_h5file.create_table(
-            '/_p_query_results',
-            self.qdescr['ft_name'],
-            ft_dict,
-            self.qdescr['title'])
-
-        # Get the array of rows that fulfill the condition
-        # Selection is done in several steps. It saves a *huge*
-        # amount of memory when querying large tables
-        for i in numpy.arange(0, div+1):
-            QtWidgets.qApp.processEvents()
-            lstart = start + chunk_size*i
-            if lstart > stop:
-                lstart = stop
-            lstop = lstart + chunk_size
-            if lstop > stop:
-                lstop = stop
-            coordinates = self.table.get_where_list(
-                self.qdescr['condition'],
-                self.qdescr['condvars'],
-                start=lstart, stop=lstop, step=step)
-            selection = self.table.read_coordinates(coordinates)
-            if selection.shape == (0, ):
-                continue
-
-            coord_dtype = numpy.dtype(
-                [(str(self.qdescr['indices_field_name']), '<i8')])
-            new_dtype = numpy.dtype(
-                coord_dtype.descr + selection.dtype.descr)
-
-            new_buffer = numpy.empty(selection.shape, dtype=new_dtype)
-            for field in selection.dtype.fields:
-                new_buffer[field] = selection[field]
-            new_buffer[str(self.qdescr['indices_field_name'])] = \
-                coordinates
-            f_table.append(new_buffer)
-            self.flushTable(f_table)
-
-        # Move the intermediate table to its final destination
-        self.tmp_h5file.move_node(
-            '/_p_query_results/' + self.qdescr['ft_name'],
-            '/', newname=self.qdescr['ft_name'],
-            overwrite=True)
-        self.completed = True
-
-
-    def queryWithNoIndex(self, src_dict):
-        """Do the query (`PyTables` level).
+        rows_scanned = self.profile['rows_scanned']
+        profile = {
+            'total_time': time.time() - self.start_time,
+            'select_time': self.profile['select_time'],
+            'append_time': self.append_time,
+            'flush_time': flush_time,
+            'chunks': self.profile['chunks'],
+            'rows_scanned': rows_scanned,
+            'rows_matched': self.rows_matched,
+            'selectivity': (self.rows_matched / rows_scanned
+                            if rows_scanned else 0.0),
+            'bytes_read': self.profile['bytes_read'],
+            'uses_index': self.profile['uses_index']}
+        for (name, value) in profile.items():
+            ftable.attrs[queryworker.PROFILE_PREFIX + name] = value
+
+
+    def readResults(self):
+        """Append to the filtered table the rows sent by the worker process.
+
+        This is a slot called periodically by the query timer. In order to
+        keep the GUI responsive the pipe is read for a limited time. The
+        progress of the query is reported once per call.
         """
 
-        # The query range is made of numpy scalars with dtype int64
-        (start, stop, step) = self.qdescr['rows_range']
-        chunk_size = 10000
-        div = int((stop - start) // chunk_size)
+        deadline = time.time() + APPEND_TIME_SLICE
+        try:
+            while self.conn.poll() and (time.time() < deadline):
+                kind, content = self.conn.recv()
+                if kind == 'rows':
+                    # The table is flushed (and its attributes are
+                    # written) only once, when the query finishes
+                    started = time.time()
+                    self.f_table.append(content)
+                    self.append_time += time.time() - started
+                    self.rows_matched += content.shape[0]
+                elif kind == 'progress':
+                    self.rows_scanned = content
+                elif kind == 'indexed':
+                    self.uses_index = content
+                elif kind == 'info':
+                    log.info(content)
+                elif kind == 'profile':
+                    self.profile = content
+                elif kind == 'done':
+                    self.finish(True)
+                    return
+                else:
+                    log.error(content)
+                    self.finish(False)
+                    return
+        except (EOFError, OSError):
+            # The worker process died unexpectedly
+            vitables.utils.formatExceptionInfo()
+            self.finish(False)
+            return
 
-        # Create the destination table
-        f_table = self.tmp_h5file.create_table(
-            '/_p_query_results',
-            self.qdescr['ft_name'],
-            src_dict,
-            self.qdescr['title'])
-
-        # Get the array of rows that fulfill the condition
-        # Selection is done in several steps. It saves a *huge*
-        # amount of memory when querying large tables
-        for i in numpy.arange(0, div+1):
-            QtWidgets.qApp.processEvents()
-            lstart = start + chunk_size*i
-            if lstart > stop:
-                lstart = stop
-            lstop = lstart + chunk_size
-            if lstop > stop:
-                lstop = stop
-            selection = self.table.read_where(
-                self.qdescr['condition'],
-                self.qdescr['condvars'],
-                start=lstart, stop=lstop, step=step)
-            f_table.append(selection)
-            self.flushTable(f_table)
-
-        # Move the intermediate table to its final destination
-        self.tmp_h5file.move_node(
-            '/_p_query_results/' + self.qdescr['ft_name'],
-            '/', newname=self.qdescr['ft_name'],
-            overwrite=True)
-        self.completed = True
-
-
-    def queryTable(self):
-        """Do the query (`PyTables` level).
+        elapsed = time.time() - self.start_time
+        throughput = self.rows_scanned / elapsed if elapsed > 0 else 0.0
+        self.query_progress.emit(self.rows_scanned, self.rows_matched,
+                                 throughput)
+
+
+    def cancel(self):
+        """Stop the query and remove the partially filled table.
+
+        This is a slot called when the user cancels the query. Calls done
+        after the query has finished are ignored.
         """
 
+        if not self.timer.isActive():
+            return
+        self.cancelled = True
+        self.worker.terminate()
+        self.finish(False)
+
+
+    def releaseWorker(self):
+        """Release the worker process and the pipe connected to it."""
+
+        self.conn.close()
+        self.worker.join()
+
+
+    def finish(self, completed):
+        """Release the worker process and publish the filtered table.
+
+        :Parameter completed: whether the query has been succesful or not
+        """
+
+        self.timer.stop()
+        self.releaseWorker()
+
+        ft_path = '/_p_query_results/' + self.qdescr['ft_name']
         try:
-            src_dict = self.table.description._v_colobjects
-            # Add an `indexes` column to the result table
-            if self.qdescr['indices_field_name']:
-                self.queryWithIndex(src_dict)
-            # Do no add an `indexes` column to the result table
+            if completed:
+                self.flushTable(self.f_table)
+                # Move the intermediate table to its final destination
+                self.tmp_h5file.move_node(
+                    ft_path, '/', newname=self.qdescr['ft_name'],
+                    overwrite=True)
             else:
-                self.queryWithNoIndex(src_dict)
-        except KeyError:
-            vitables.utils.formatExceptionInfo()
-            self.tmp_h5file.remove_node(
-                '/_p_query_results/' + self.qdescr['ft_name'])
-        else:
+                self.tmp_h5file.remove_node(ft_path)
             self.tmp_h5file.flush()
+        except tables.NodeError:
+            vitables.utils.formatExceptionInfo()
+            completed = False
+
+        self.completed = completed
+        self.query_completed.emit(self.completed, self.table_uid)
@@ -24,6 +24,14 @@ This module provides a dialog for querying (filtering) `tables.Table` nodes.
 The result of the query is stored in other `tables.Table` node, referred as a
 filtered table, which will live in the temporary database (labeled as `Query
 results` in the databases tree).
+
+Homogeneous arrays can be queried too. Their elements are referred to by the
+`values` variable and the filtered table contains the coordinates and values
+of the selected elements.
+
+Table conditions can refer to nested columns by their dotted path and to the
+elements of multidimensional columns (see
+:mod:`vitables.queries.tablecondition`).
 """
 
 import logging
@@ -31,11 +39,15 @@ import os.path
 import vitables.utils
 
 import numpy
+import tables
 from qtpy import QtCore
 from qtpy import QtGui
 from qtpy import QtWidgets
 from qtpy.uic import loadUiType
 
+import vitables.queries.queryworker as queryworker
+import vitables.queries.tablecondition as tablecondition
+
 
 __docformat__ = 'restructuredtext'
 
@@ -136,7 +148,8 @@ class QueryDlg(QtWidgets.QDialog, Ui_QueryDialog):
         functions = ['where', 'sin', 'cos', 'tan', 'arcsin', 'arccos',
                      'arctan', 'arctan2', 'sinh', 'cosh', 'tanh',
                      'arcsinh', 'arccosh', 'arctanh', 'log', 'log10', 'log1p',
-                     'exp', 'expm1', 'sqrt', 'real', 'imag', 'complex']
+                     'exp', 'expm1', 'sqrt', 'real', 'imag', 'complex',
+                     'any', 'all']
         self.functionsComboBox.insertItems(0, functions)
         sorted_fields = [field for field in info['valid_fields']]
         sorted_fields.sort()
@@ -242,7 +255,9 @@ class QueryDlg(QtWidgets.QDialog, Ui_QueryDialog):
                      'sqrt': 'sqrt(F|C)',
                      'real': 'real(C)',
                      'imag': 'imag(C)',
-                     'complex': 'complex(F, F)'}
+                     'complex': 'complex(F, F)',
+                     'any': 'any(B)',
+                     'all': 'all(B)'}
         self.queryLE.insert(name2call[text])
 
     @QtCore.Slot("QString", name="on_nameLE_textChanged")
@@ -317,6 +332,7 @@ class QueryDlg(QtWidgets.QDialog, Ui_QueryDialog):
         condition = self.queryLE.text()
         if condition.isspace() or (condition in [None, '']):
             status_ok = False
+        self.updateIndexingInfo(condition)
 
         # Check the range values
         start_str = self.rstartLE.text()
@@ -348,6 +364,68 @@ class QueryDlg(QtWidgets.QDialog, Ui_QueryDialog):
         else:
             ok_button.setEnabled(0)
 
+    def updateIndexingInfo(self, condition):
+        """Tell the user if the query will use indexes or not.
+
+        Conditions are checked while they are being typed so incomplete
+        conditions are silently ignored.
+
+        :Parameter condition: the query condition used for filtering the table
+        """
+
+        if not isinstance(self.source_table, tables.Table):
+            self.indexingLabel.setText(
+                translate('QueryDlg',
+                          'Array queries are evaluated blockwise, they '
+                          'cannot use indexes.',
+                          'Indexing info of the query dialog'))
+            return
+
+        indexed_cols = [name for (name, is_indexed)
+                        in self.source_table.colindexed.items() if is_indexed]
+        info = ''
+        try:
+            tcond = self.parseCondition(condition)
+            if tcond.elementwise:
+                self.indexingLabel.setText(
+                    translate('QueryDlg',
+                              'Conditions on multidimensional columns are '
+                              'evaluated blockwise, they cannot use indexes.',
+                              'Indexing info of the query dialog'))
+                return
+            used_indexes = self.source_table.will_query_use_indexing(
+                tcond.expression, tcond.condvars)
+        except Exception:
+            used_indexes = None
+        if not indexed_cols:
+            info = translate('QueryDlg', 'The table has no indexed columns.',
+                             'Indexing info of the query dialog')
+        elif used_indexes:
+            info = translate('QueryDlg',
+                             'The query will use the indexes of columns: {0}',
+                             'Indexing info of the query dialog').format(
+                                 ', '.join(sorted(used_indexes)))
+        elif used_indexes is not None:
+            info = translate('QueryDlg',
+                             'The query cannot use the indexes of columns: '
+                             '{0}',
+                             'Indexing info of the query dialog').format(
+                                 ', '.join(sorted(indexed_cols)))
+        self.indexingLabel.setText(info)
+
+    def parseCondition(self, condition):
+        """Parse a table query condition.
+
+        :Parameter condition: the query condition used for filtering the table
+
+        :Returns: a `tablecondition.TableCondition` instance
+        """
+
+        return tablecondition.TableCondition(
+            self.source_table, condition,
+            dict((name, col.pathname)
+                 for (name, col) in self.condvars.items()))
+
     def checkConditionSyntax(self, condition):
         """Check the condition syntax.
 
@@ -356,7 +434,15 @@ class QueryDlg(QtWidgets.QDialog, Ui_QueryDialog):
 
         syntax_ok = True
         try:
-            self.source_table.will_query_use_indexing(condition, self.condvars)
+            if isinstance(self.source_table, tables.Table):
+                tablecondition.checkCondition(
+                    self.source_table, condition,
+                    dict((name, col.pathname)
+                         for (name, col) in self.condvars.items()))
+            else:
+                # Evaluate the condition over the first row of the array
+                queryworker.arrayMask(condition,
+                                      self.source_table.read(0, 1))
         except SyntaxError as error:
             syntax_ok = False
             log.error(error.__doc__)
@@ -24,28 +24,66 @@ This module implements a controller for managing the queries.
 
 The manager tracks the existing filtered tables and their names, launches the
 Query dialog and executes the queries at low level (i.e. `PyTables` level).
+Tables and homogeneous numeric arrays can be queried. The same table query
+can also be run on the tables with a given path in several files (a batch
+query). Aggregation (group by) and join queries on tables are supported too.
 It also keeps a description of the last executed query and tracks the tables
 currently being queried, in order to ensure that no more than 1 query at a time
-is executed on a given table.
+is executed on a given table. Queries on different tables can run
+concurrently because every query is executed in its own worker process.
+
+Finally, the manager remembers the results of the executed queries so that
+repeating a query on a source file that hasn't changed doesn't rescan the
+source table.
+
+Tables written by pandas in `frame_table` format are queried with pandas
+instead: the `where` predicate is evaluated by ``HDFStore`` (which uses the
+indexes of the data columns) and the selected rows are displayed in a view.
 """
 
 __docformat__ = 'restructuredtext'
 
+import glob
 import logging
+import os
+import uuid
+
+import tables
+
 import vitables.utils
 
 from qtpy import QtCore
 from qtpy import QtGui
 from qtpy import QtWidgets
 
+import vitables.queries.aggregate as aggregate
+import vitables.queries.aggregatedlg as aggregatedlg
+import vitables.queries.batchquery as batchquery
+import vitables.queries.join as join
+import vitables.queries.joindlg as joindlg
 import vitables.queries.query as query
 import vitables.queries.querydlg as querydlg
+import vitables.queries.queryworker as queryworker
+from vitables.vttables import datasheet
+from vitables.vttables import df_model
 
 
 translate = QtWidgets.QApplication.translate
 
 log = logging.getLogger(__name__)
 
+# Resolution of the query progress bars. Tables can have more rows than the
+# maximum value of a progress bar so progress is given in per mille
+PROGRESS_STEPS = 1000
+
+# The files of a folder that are queried by batch queries
+HDF5_PATTERNS = ('*.hdf', '*.h5', '*.hd5', '*.hdf5')
+
+# The attribute of filtered tables that identifies them in the cache of query
+# results. Unlike object IDs (addresses in the file) it cannot be reused by
+# another node once the filtered table is removed
+RESULT_ID_ATTR = 'query_result_id'
+
 
 def getTableInfo(table):
     """Retrieves table info required for querying it.
@@ -53,6 +91,7 @@ def getTableInfo(table):
     :Parameter table: the `tables.Table` instance being queried.
     """
     info = {}
+    info['kind'] = 'table'
     info['nrows'] = table.nrows
     info['src_filepath'] = table._v_file.filename
     info['src_path'] = table._v_pathname
@@ -74,19 +113,12 @@ def getTableInfo(table):
         return None
 
     # Find out the valid (i.e. searchable) fields and condition variables.
-    # First discard nested fields.
-    # Beware that order matters in binary operations that mix set instances
-    # with frozensets: set & frozenset returns a set but frozenset & set
-    # returns a frozenset
-    valid_fields = set(info['col_shapes'].keys()).intersection(
-        info['col_names'])
-    # info['col_names'].intersection(info['col_shapes'].keys())
-
-    # Then discard fields that aren't scalar and those that are complex
-    for name in valid_fields.copy():
-        if (info['col_shapes'][name] != ()) or \
-           info['col_types'][name].count('complex'):
-            valid_fields.remove(name)
+    # Fields that are complex are discarded. Nested fields are referred to
+    # by their dotted path (e.g. info.energy) and multidimensional fields
+    # are evaluated element-wise (see the tablecondition module)
+    valid_fields = set(colpath.replace('/', '.')
+                       for (colpath, coltype) in info['col_types'].items()
+                       if not coltype.count('complex'))
 
     # Among the remaining fields, those whose names contain blanks
     # cannot be used in conditions unless they are mapped to
@@ -97,7 +129,7 @@ def getTableInfo(table):
             while ('col{0}'.format(index)) in valid_fields:
                 index = index + 1
             info['condvars']['col{0}'.format(index)] = \
-                table.cols._f_col(name)
+                table.cols._f_col(name.replace('.', '/'))
             valid_fields.remove(name)
             valid_fields.add('col{0} ({1})'.format(index, name))
             index = index + 1
@@ -108,32 +140,117 @@ def getTableInfo(table):
         log.info(
             translate('QueriesManager',
                       """Table {0} has no columns suitable to be """
-                      """queried. All columns are nested, multidimensional """
-                      """or have a Complex data type.""",
+                      """queried. All columns have a Complex data type.""",
                       'Info when trying to query a table').format(
                           info['name']))
         return None
-    elif len(info['valid_fields']) != len(info['col_names']):
+    elif len(info['valid_fields']) != len(info['col_types']):
         # Log a message if non selectable fields exist
         log.warning(
             translate('QueriesManager',
-                      """Some table columns contain multidimensional, """
-                      """nested or Complex data. They cannot be queried so """
-                      """are not included in the Column selector of the """
-                      """query dialog.""", 'An informational note for users'))
+                      """Some table columns contain Complex data. They """
+                      """cannot be queried so are not included in the """
+                      """Column selector of the query dialog.""",
+                      'An informational note for users'))
+
+    return info
+
+
+def getArrayInfo(array):
+    """Retrieves array info required for querying it.
+
+    Array elements are referred to in query conditions by the
+    `queryworker.ARRAY_VARIABLE` variable. Rows are taken along the main
+    dimension of the array.
+
+    :Parameter array: the `tables.Array` instance being queried.
+    """
+
+    info = {}
+    info['kind'] = 'array'
+    info['nrows'] = array.nrows
+    info['src_filepath'] = array._v_file.filename
+    info['src_path'] = array._v_pathname
+    info['name'] = array._v_name
+    info['col_names'] = frozenset([queryworker.ARRAY_VARIABLE])
+    info['col_shapes'] = {queryworker.ARRAY_VARIABLE: ()}
+    info['col_types'] = {queryworker.ARRAY_VARIABLE: array.atom.type}
+    info['condvars'] = {}
+    info['valid_fields'] = set([queryworker.ARRAY_VARIABLE])
+
+    # Only numeric arrays with scalar atoms can be queried
+    if (array.shape == ()) or (array.atom.shape != ()) or \
+            (array.atom.kind not in ('bool', 'int', 'uint', 'float')):
+        log.info(
+            translate('QueriesManager',
+                      """Array {0} cannot be queried. Only arrays of """
+                      """scalar, non Complex, numbers can be queried.""",
+                      'Info when trying to query an array').format(
+                          info['name']))
+        return None
+
+    if info['nrows'] <= 0:
+        log.info(
+            translate('QueriesManager',
+                      "Array {0} is empty. Nothing to query.",
+                      'Info message for users').format(info['name']))
+        return None
 
     return info
 
 
+def getCacheKey(qdescr):
+    """Return the key of a query in the cache of query results.
+
+    The key identifies both the query and the state of the source file (its
+    modification time and size) so results of queries on modified files are
+    not reused.
+
+    :Parameter qdescr: dictionary description of the query
+    """
+
+    stat = os.stat(qdescr['src_filepath'])
+    condvars = tuple(sorted((name, col.pathname)
+                            for (name, col) in qdescr['condvars'].items()))
+    rows_range = tuple(int(value) for value in qdescr['rows_range'])
+    return (qdescr['src_filepath'], qdescr['src_path'],
+            stat.st_mtime, stat.st_size,
+            qdescr['condition'], condvars, rows_range,
+            qdescr['indices_field_name'])
+
+
+def copyCachedResult(h5file, nodepath, name):
+    """Copy a cached query result to a new filtered table.
+
+    The copy is a new result: it keeps neither the `RESULT_ID_ATTR` of the
+    cached table nor its query profile (no scan was run to get it).
+
+    :Parameters:
+
+    - `h5file`: the temporary database
+    - `nodepath`: the path of the cached filtered table
+    - `name`: the name of the new filtered table
+    """
+
+    copy = h5file.copy_node(nodepath, newparent='/', newname=name)
+    attrs = copy._v_attrs
+    for attr in attrs._f_list('user'):
+        if attr == RESULT_ID_ATTR or \
+                attr.startswith(queryworker.PROFILE_PREFIX):
+            del attrs[attr]
+    return copy
+
+
 class QueriesManager(QtCore.QObject):
     """This is the class in charge of the execution of queries.
 
-    `PyTables` doesn't support threaded queries. So when several queries are
-    requested to ``ViTables`` they will be executed sequentially.
+    `PyTables` doesn't support threaded queries. So every query requested to
+    ``ViTables`` is executed in a worker process and several queries can run
+    at the same time.
 
-    Also no more than one query can be made at the same time on a given table.
-    This goal is achieved in a very simple way: tracking the tables currently
-    being queried in a data structure (a dictionary at present).
+    However no more than one query can be made at the same time on a given
+    table. This goal is achieved in a very simple way: tracking the tables
+    currently being queried in a data structure (a dictionary at present).
 
     :Parameter parent: the parent of the `QueriesManager` object
     """
@@ -159,6 +276,15 @@ class QueriesManager(QtCore.QObject):
         self.counter = 0
         # The list of query names currently in use
         self.ft_names = []
+        # The queries currently running, keyed by the UID of the queried table
+        self.running_queries = {}
+        # The progress dialogs of the running queries
+        self.progress_dialogs = {}
+        # The results of the executed queries. Keys are given by getCacheKey
+        # and values are (node path, result ID) tuples of the filtered tables
+        self.results_cache = {}
+        # The cache keys of the running queries
+        self.cache_keys = {}
 
         self.vtapp = vitables.utils.getVTApp()
         self.vtgui = self.vtapp.gui
@@ -169,15 +295,33 @@ class QueriesManager(QtCore.QObject):
         """Process the query requests launched by users.
         """
 
-        # The VTApp.updateQueryActions method ensures that the current node is
-        # tied to a tables.Table instance so we can query it without
-        # further checking
+        # The VTGUI.updateActions method ensures that the current node is
+        # tied to a tables.Table or a homogeneous array instance so we can
+        # query it without further checking
         current = self.dbt_view.currentIndex()
         node = self.dbt_model.nodeFromIndex(current)
         table_uid = node.as_record
         table = node.node
 
-        table_info = getTableInfo(table)
+        if table_uid in self.running_queries:
+            log.info(
+                translate('QueriesManager',
+                          "Table {0} is already being queried. Please, wait "
+                          "until the running query finishes.",
+                          'Info message for users').format(node.name))
+            return
+
+        if isinstance(table, tables.Table) and \
+                (df_model.get_pandas_type(table) == 'frame_table'):
+            hstore = df_model.open_hdfstore(table._v_file)
+            if hstore is not None:
+                self.newFrameQuery(current, table, hstore)
+                return
+
+        if isinstance(table, tables.Table):
+            table_info = getTableInfo(table)
+        else:
+            table_info = getArrayInfo(table)
         if table_info is None:
             return
 
@@ -194,21 +338,451 @@ class QueriesManager(QtCore.QObject):
                            query_description['src_path'],
                            query_description['condition']]
 
-        # Run the query
+        # Reuse the result of a previous execution of the query (if any)
         tmp_h5file = self.dbt_model.tmp_dbdoc.h5file
+        if table._v_file.mode != 'r':
+            # Make sure that the state of the file on disk is up to date
+            table._v_file.flush()
+        cache_key = getCacheKey(query_description)
+        cached_path = self.getCachedResult(cache_key)
+        if cached_path is not None:
+            log.info(
+                translate('QueriesManager',
+                          'Reusing the result of a previous query: {0}',
+                          'Info message for users').format(cached_path))
+            copyCachedResult(tmp_h5file, cached_path,
+                             query_description['ft_name'])
+            tmp_h5file.flush()
+            self.addQueryResult(True, table_uid)
+            return
+
+        # Run the query
+        self.cache_keys[table_uid] = cache_key
         new_query = query.Query(tmp_h5file, table_uid, table,
                                 query_description)
-        new_query.query_completed.connect(self.addQueryResult)
+        self.startQuery(new_query, table_info['name'],
+                        translate('QueriesManager',
+                                  'Rows scanned: {0} of {1}\n'
+                                  'Rows matched: {2}\n'
+                                  'Throughput: {3:.0f} rows/s',
+                                  'Label of the query progress dialog'))
+
+    def newFrameQuery(self, index, table, hstore):
+        """Filter a pandas `frame_table` and display the selected rows.
+
+        Predicates on data columns are evaluated by pandas using their
+        indexes. Other predicates fall back to a full scan of the frame.
+
+        :Parameters:
+
+        - `index`: the index (in the tree of databases model) of the table
+        - `table`: the `tables.Table` where the frame is stored
+        - `hstore`: a pandas store of the file of the table
+        """
+
+        key = table._g_getparent()._v_pathname
+        filepath = table._v_file.filename
+        data_columns = ['index'] + list(
+            hstore.get_storer(key).data_columns or [])
+        initial_where = ''
+        if (self.last_query[0], self.last_query[1]) == (filepath, key):
+            initial_where = self.last_query[2]
+        where, accepted = QtWidgets.QInputDialog.getText(
+            self.vtgui,
+            translate('QueriesManager', 'New query on frame: {0}',
+                      'A dialog caption').format(key),
+            translate('QueriesManager',
+                      'Where (data columns: {0}):',
+                      'A dialog label').format(', '.join(data_columns)),
+            QtWidgets.QLineEdit.Normal, initial_where)
+        where = where.strip()
+        if not (accepted and where):
+            return
+        self.last_query = [filepath, key, where]
+
         QtWidgets.qApp.setOverrideCursor(QtCore.Qt.WaitCursor)
+        try:
+            coordinates, used_columns = df_model.select_coordinates(
+                hstore, key, where)
+        except Exception:
+            vitables.utils.formatExceptionInfo()
+            return
+        finally:
+            QtWidgets.qApp.restoreOverrideCursor()
+
+        if used_columns is None:
+            log.warning(
+                translate('QueriesManager',
+                          'The predicate {0} cannot be evaluated on the data '
+                          'columns of the frame. The frame has been fully '
+                          'scanned.',
+                          'A query warning').format(where))
+        else:
+            indexed = sorted(name for (name, is_indexed)
+                             in used_columns.items() if is_indexed)
+            scanned = sorted(name for (name, is_indexed)
+                             in used_columns.items() if not is_indexed)
+            if indexed:
+                log.info(
+                    translate('QueriesManager',
+                              'The query uses the indexes of columns: {0}',
+                              'Info message for users').format(
+                                  ', '.join(indexed)))
+            if scanned:
+                log.info(
+                    translate('QueriesManager',
+                              'Data columns {0} are not indexed, they have '
+                              'been scanned in-kernel.',
+                              'Info message for users').format(
+                                  ', '.join(scanned)))
+        if not len(coordinates):
+            log.info(
+                translate('QueriesManager',
+                          'No rows of frame {0} fulfill the predicate {1}.',
+                          'Info message for users').format(key, where))
+            return
+
+        model = df_model.DataFrameModel(table, hstore,
+                                        coordinates=coordinates)
+        subwindow = datasheet.DataSheet(index, model)
+        subwindow.setWindowTitle('{0}\twhere {1} ({2} rows)'.format(
+            key, where, len(coordinates)))
+        subwindow.show()
+        self.vtapp.leaf_model_created.emit(subwindow)
+
+    def newBatchQuery(self):
+        """Process the batch query requests launched by users.
+
+        The query is defined on the selected table and it is run on the
+        tables with the same path of all the open files or of the files of
+        a given folder.
+        """
+
+        current = self.dbt_view.currentIndex()
+        node = self.dbt_model.nodeFromIndex(current)
+        table_uid = node.as_record
+        table = node.node
+
+        if table_uid in self.running_queries:
+            log.info(
+                translate('QueriesManager',
+                          "Table {0} is already being queried. Please, wait "
+                          "until the running query finishes.",
+                          'Info message for users').format(node.name))
+            return
+
+        filepaths = self.selectBatchFiles()
+        if not filepaths:
+            return
+
+        table_info = getTableInfo(table)
+        if table_info is None:
+            return
+
+        # Update the suggested name sufix
+        self.counter = self.counter + 1
+        query_description = self.getQueryInfo(table_info, table)
+        if query_description is None:
+            self.counter = self.counter - 1
+            return
+
+        # Update the list of names in use for filtered tables
+        self.ft_names.append(query_description['ft_name'])
+        self.last_query = [query_description['src_filepath'],
+                           query_description['src_path'],
+                           query_description['condition']]
+
+        # Make sure that the workers see the current content of the open
+        # files
+        for child in self.dbt_model.root.children:
+            if child.filepath in filepaths:
+                dbdoc = self.dbt_model.getDBDoc(child.filepath)
+                if dbdoc.mode != 'r':
+                    dbdoc.h5file.flush()
+
+        # Run the query
+        tmp_h5file = self.dbt_model.tmp_dbdoc.h5file
+        new_query = batchquery.BatchQuery(tmp_h5file, table_uid, table,
+                                          query_description, filepaths)
+        self.startQuery(new_query, table_info['name'],
+                        translate('QueriesManager',
+                                  'Files queried: {0} of {1}\n'
+                                  'Rows matched: {2}\n'
+                                  'Throughput: {3:.0f} rows/s',
+                                  'Label of the batch query progress dialog'))
+
+    def newAggregateQuery(self):
+        """Process the aggregation query requests launched by users."""
+
+        current = self.dbt_view.currentIndex()
+        node = self.dbt_model.nodeFromIndex(current)
+        table_uid = node.as_record
+        table = node.node
+
+        if table_uid in self.running_queries:
+            log.info(
+                translate('QueriesManager',
+                          "Table {0} is already being queried. Please, wait "
+                          "until the running query finishes.",
+                          'Info message for users').format(node.name))
+            return
+
+        table_info = getTableInfo(table)
+        if table_info is None:
+            return
+
+        # Get the query description from the user
+        self.counter = self.counter + 1
+        aggregate_dlg = aggregatedlg.AggregateDlg(table_info, self.ft_names,
+                                                  self.counter, table)
+        try:
+            aggregate_dlg.exec_()
+        finally:
+            query_description = dict(aggregate_dlg.query_info)
+            del aggregate_dlg
+            QtWidgets.qApp.processEvents()
+        if not query_description['ft_name']:
+            self.counter = self.counter - 1
+            return
+        title = 'count by {0}'.format(query_description['group_by'])
+        if query_description['condition']:
+            title = '{0} where {1}'.format(title,
+                                           query_description['condition'])
+        query_description['title'] = title
+        self.ft_names.append(query_description['ft_name'])
+
+        # Run the query
+        tmp_h5file = self.dbt_model.tmp_dbdoc.h5file
+        new_query = aggregate.AggregateQuery(tmp_h5file, table_uid, table,
+                                             query_description)
+        self.startQuery(new_query, table_info['name'],
+                        translate('QueriesManager',
+                                  'Rows scanned: {0} of {1}\n'
+                                  'Throughput: {3:.0f} rows/s',
+                                  'Label of the aggregation progress dialog'))
+
+    def newJoinQuery(self):
+        """Process the join query requests launched by users.
+
+        The selected table is joined with a table of any open file.
+        """
+
+        current = self.dbt_view.currentIndex()
+        node = self.dbt_model.nodeFromIndex(current)
+        table_uid = node.as_record
+        table = node.node
+
+        if table_uid in self.running_queries:
+            log.info(
+                translate('QueriesManager',
+                          "Table {0} is already being queried. Please, wait "
+                          "until the running query finishes.",
+                          'Info message for users').format(node.name))
+            return
+
+        table_info = getTableInfo(table)
+        if table_info is None:
+            return
+
+        # The tables of the open files (but the temporary database)
+        candidates = []
+        for child in self.dbt_model.root.children:
+            if child.filepath == self.dbt_model.tmp_filepath:
+                continue
+            h5file = self.dbt_model.getDBDoc(child.filepath).h5file
+            candidates.extend(h5file.walk_nodes('/', classname='Table'))
+
+        # Get the query description from the user
+        self.counter = self.counter + 1
+        join_dlg = joindlg.JoinDlg(table_info, self.ft_names, self.counter,
+                                   table, candidates)
+        try:
+            join_dlg.exec_()
+        finally:
+            query_description = dict(join_dlg.query_info)
+            right_table = join_dlg.right_table
+            del join_dlg
+            QtWidgets.qApp.processEvents()
+        if right_table is None:
+            self.counter = self.counter - 1
+            return
+        query_description['title'] = '{0} = {1}:{2}/{3}'.format(
+            query_description['left_key'],
+            os.path.basename(query_description['right_filepath']),
+            query_description['right_path'],
+            query_description['right_key'])
+        self.ft_names.append(query_description['ft_name'])
+
+        # Run the query
+        tmp_h5file = self.dbt_model.tmp_dbdoc.h5file
+        new_query = join.JoinQuery(tmp_h5file, table_uid, table, right_table,
+                                   query_description)
+        self.startQuery(new_query, table_info['name'],
+                        translate('QueriesManager',
+                                  'Rows scanned: {0} of {1}\n'
+                                  'Rows joined: {2}\n'
+                                  'Throughput: {3:.0f} rows/s',
+                                  'Label of the join progress dialog'))
+
+    def selectBatchFiles(self):
+        """Ask the user for the files queried by a batch query.
+
+        :Returns: a sorted list with the full paths of the selected files
+        """
+
+        choices = [
+            translate('QueriesManager', 'All open files',
+                      'Files queried by a batch query'),
+            translate('QueriesManager', 'Files in a folder...',
+                      'Files queried by a batch query')]
+        choice, is_accepted = QtWidgets.QInputDialog.getItem(
+            self.vtgui,
+            translate('QueriesManager', 'Batch query',
+                      'Caption of the batch query files selector'),
+            translate('QueriesManager', 'Query the selected table in:',
+                      'Label of the batch query files selector'),
+            choices, 0, False)
+        if not is_accepted:
+            return []
+
+        if choice == choices[0]:
+            filepaths = [child.filepath
+                         for child in self.dbt_model.root.children
+                         if child.filepath != self.dbt_model.tmp_filepath]
+        else:
+            fs_args = {'accept_mode': QtWidgets.QFileDialog.AcceptOpen,
+                       'file_mode': QtWidgets.QFileDialog.Directory,
+                       'history': self.vtapp.file_selector_history,
+                       'label': translate('QueriesManager', 'Select',
+                                          'Accept button text for '
+                                          'QFileDialog')}
+            dirpath, working_dir = vitables.utils.getFilepath(
+                self.vtgui,
+                translate('QueriesManager', 'Select a folder...',
+                          'Caption of the batch query folder selector'),
+                dfilter='', settings=fs_args)
+            if not dirpath:
+                return []
+            self.vtapp.updateFSHistory(working_dir)
+            filepaths = set()
+            for pattern in HDF5_PATTERNS:
+                filepaths.update(
+                    vitables.utils.forwardPath(filepath) for filepath
+                    in glob.glob(os.path.join(dirpath, pattern)))
+            if not filepaths:
+                log.info(
+                    translate('QueriesManager',
+                              'There are no HDF5 files in folder {0}.',
+                              'Info message for users').format(dirpath))
+        return sorted(filepaths)
+
+    def startQuery(self, new_query, name, label):
+        """Register a query, setup its progress dialog and run it.
+
+        :Parameters:
+
+        - `new_query`: the `query.Query` instance being run
+        - `name`: the name of the queried table
+        - `label`: the label of the progress dialog. See
+          :meth:`createProgressDialog`
+        """
+
+        new_query.query_completed.connect(self.addQueryResult)
+        self.running_queries[new_query.table_uid] = new_query
+        self.progress_dialogs[new_query.table_uid] = \
+            self.createProgressDialog(new_query, name, label)
         new_query.run()
 
+    def createProgressDialog(self, new_query, name, label):
+        """Create a dialog that reports the progress of a query.
+
+        The dialog shows the progress of the query (rows or files scanned),
+        the number of rows matched and the query throughput. Its `Cancel`
+        button stops the query.
+
+        :Parameters:
+
+        - `new_query`: the `query.Query` instance being monitored
+        - `name`: the name of the queried table
+        - `label`: the label of the dialog. It is formatted with the
+          amount of work done, the total amount of work, the number of rows
+          matched and the throughput
+        """
+
+        dialog = QtWidgets.QProgressDialog(self.vtgui)
+        dialog.setWindowTitle(
+            translate('QueriesManager', 'Querying table {0}',
+                      'Caption of the query progress dialog').format(name))
+        dialog.setLabelText(
+            translate('QueriesManager', 'Starting the query...',
+                      'Label of the query progress dialog'))
+        dialog.setCancelButtonText(
+            translate('QueriesManager', 'Cancel', 'Button text'))
+        dialog.setRange(0, PROGRESS_STEPS)
+        dialog.setAutoClose(False)
+        dialog.setAutoReset(False)
+        dialog.setMinimumDuration(500)
+        dialog.setValue(0)
+
+        def updateProgress(rows_scanned, rows_matched, throughput):
+            """Update the dialog with the progress of the query."""
+            if new_query.rows_total > 0:
+                dialog.setValue(
+                    rows_scanned * PROGRESS_STEPS // new_query.rows_total)
+            dialog.setLabelText(label.format(
+                rows_scanned, new_query.rows_total, rows_matched,
+                throughput))
+
+        new_query.query_progress.connect(updateProgress)
+        dialog.canceled.connect(new_query.cancel)
+        return dialog
+
+    def getCachedResult(self, cache_key):
+        """Return the path of the filtered table that matches a cache key.
+
+        Stale entries (those whose source file has changed or whose filtered
+        table no longer exists) are evicted from the cache first. A node
+        that replaced the filtered table at its path is detected by its
+        `RESULT_ID_ATTR` attribute.
+
+        :Parameter cache_key: the key of the query being executed
+        """
+
+        tmp_h5file = self.dbt_model.tmp_dbdoc.h5file
+        for (key, (nodepath, result_id)) in list(self.results_cache.items()):
+            try:
+                stat = os.stat(key[0])
+                is_stale = (stat.st_mtime, stat.st_size) != key[2:4]
+                if not is_stale:
+                    node = tmp_h5file.get_node(nodepath)
+                    is_stale = getattr(node._v_attrs, RESULT_ID_ATTR,
+                                       None) != result_id
+            except (OSError, tables.NoSuchNodeError):
+                is_stale = True
+            if is_stale:
+                del self.results_cache[key]
+
+        if cache_key in self.results_cache:
+            return self.results_cache[cache_key][0]
+        return None
+
+    def removeCachedResult(self, nodepath):
+        """Remove a filtered table from the cache of query results.
+
+        :Parameter nodepath: the path of the filtered table being removed
+        """
+
+        for (key, (path, result_id)) in list(self.results_cache.items()):
+            if path == nodepath:
+                del self.results_cache[key]
+
     def getQueryInfo(self, info, table):
         """Retrieves useful info about the query.
 
         :Parameters:
 
         - `info`: dictionary with info about the queried table
-        - `table`: the tables.Table instance being queried
+        - `table`: the tables.Table (or tables.Array) instance being queried
         """
 
         # Information about table
@@ -236,6 +810,12 @@ class QueriesManager(QtCore.QObject):
         if not query_description['condition']:
             return None
 
+        # Filtered arrays always store the coordinates of the selected
+        # elements
+        if (info['kind'] == 'array') and \
+                not query_description['indices_field_name']:
+            query_description['indices_field_name'] = 'coordinates'
+
         # SET THE TITLE OF THE RESULT TABLE
         title = query_description['condition']
         for name in info['valid_fields']:
@@ -285,6 +865,7 @@ class QueriesManager(QtCore.QObject):
         # Reset the queries manager
         self.counter = 0
         self.ft_names = []
+        self.results_cache = {}
 
     def addQueryResult(self, completed, table_uid):
         """Update the GUI once the query has finished.
@@ -298,7 +879,26 @@ class QueriesManager(QtCore.QObject):
         - `table_uid`: the UID of the table just queried
         """
 
-        QtWidgets.qApp.restoreOverrideCursor()
+        finished_query = self.running_queries.pop(table_uid, None)
+        cache_key = self.cache_keys.pop(table_uid, None)
+        dialog = self.progress_dialogs.pop(table_uid, None)
+        if dialog is not None:
+            # Closing the dialog emits its canceled signal but the query
+            # ignores cancellations once it has finished
+            dialog.close()
+            dialog.deleteLater()
+        if (not completed) and (finished_query is not None):
+            # The partial filtered table has been removed so its name can be
+            # reused
+            ft_name = finished_query.qdescr['ft_name']
+            if ft_name in self.ft_names:
+                self.ft_names.remove(ft_name)
+        if (finished_query is not None) and finished_query.cancelled:
+            log.info(translate('QueriesManager',
+                               'Query on table {0} cancelled.',
+                               'Info log message about a cancelled '
+                               'query').format(table_uid))
+            return
         if not completed:
             log.error(translate('QueriesManager',
                                 'Query on table {0} failed!',
@@ -312,6 +912,14 @@ class QueriesManager(QtCore.QObject):
                                          QtCore.QModelIndex())
         self.dbt_model.lazyAddChildren(tmp_index)
 
+        # Remember the result of the query
+        if (finished_query is not None) and (cache_key is not None):
+            nodepath = '/' + finished_query.qdescr['ft_name']
+            node = self.dbt_model.tmp_dbdoc.h5file.get_node(nodepath)
+            result_id = uuid.uuid4().hex
+            node._v_attrs[RESULT_ID_ATTR] = result_id
+            self.results_cache[cache_key] = (nodepath, result_id)
+
         # The new filtered table is inserted in first position under
         # the Query results node and opened
         index = self.dbt_model.index(0, 0, tmp_index)
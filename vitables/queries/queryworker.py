@@ -0,0 +1,888 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#       Copyright (C) 2005-2007 Carabos Coop. V. All rights reserved
+#       Copyright (C) 2008-2017 Vicent Mas. All rights reserved
+#
+#       This program is free software: you can redistribute it and/or modify
+#       it under the terms of the GNU General Public License as published by
+#       the Free Software Foundation, either version 3 of the License, or
+#       (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#       MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#       GNU General Public License for more details.
+#
+#       You should have received a copy of the GNU General Public License
+#       along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#       Author:  Vicent Mas - vmas@vitables.org
+
+"""
+This module contains the code executed by query worker processes.
+
+Both tables and homogeneous arrays (`Array`, `CArray` and `EArray` nodes) can
+be queried. Table queries are evaluated in-kernel by `PyTables`, except
+conditions on multidimensional columns, which are evaluated blockwise with
+``numpy`` (see :mod:`vitables.queries.tablecondition`). Array conditions are
+evaluated blockwise with ``numexpr`` and the query result is a table with the
+coordinates and the values of the selected elements.
+
+Aggregation queries group the rows of a table by a key column and compute
+aggregates (count, sum, min, max and mean) of other columns. They are
+evaluated chunk by chunk and only the aggregates of every group are kept in
+memory.
+
+Join queries match the rows of two tables on a key column. The smaller table
+(the build side) is loaded in memory and indexed by key, then the larger
+table (the probe side) is streamed in blocks.
+
+`PyTables` is not thread-safe so queries cannot be run in a secondary thread
+of the GUI process. Instead every query is run in its own process, which opens
+the source file in read-only mode and sends the selected rows back to the GUI
+process through a pipe. The GUI process is the only one that writes to the
+temporary database.
+
+Messages sent through the pipe are ``(kind, content)`` tuples where `kind` is
+one of:
+
+- ``'rows'``: `content` is a ``numpy`` array of selected rows with the dtype
+  of the filtered table
+- ``'progress'``: `content` is the number of rows of the queried range
+  already scanned
+- ``'indexed'``: `content` is True if the query uses column indexes
+- ``'info'``: `content` is an informational message for the user
+- ``'profile'``: `content` is the profile of the query (see
+  :func:`newProfile`). It is sent just before the ``'done'`` message
+- ``'done'``: the query finished successfully, `content` is None
+- ``'error'``: the query failed, `content` is a formatted traceback
+
+Beware that this module is imported by the worker processes so it must not
+import ``Qt`` nor any ``ViTables`` module that requires a running
+application.
+"""
+
+__docformat__ = 'restructuredtext'
+
+import time
+import traceback
+
+import numexpr
+import numpy
+import tables
+
+import vitables.queries.tablecondition as tablecondition
+
+# Approximate amount of memory (in bytes) read from the queried table in
+# every scan
+SCAN_BUFFER_SIZE = 4 * 1024 * 1024
+
+# The name of the variable that refers to the array elements in array
+# query conditions
+ARRAY_VARIABLE = 'values'
+
+# The prefix of the names of the filtered table attributes that store the
+# query profile
+PROFILE_PREFIX = 'query_profile_'
+
+
+def newProfile(uses_index=False):
+    """Return an empty query execution profile.
+
+    A profile is a dictionary with the items:
+
+    - `select_time`: seconds spent selecting and reading rows (i.e. in
+      `get_where_list`, `read_where`, `read_coordinates`...)
+    - `chunks`: the number of blocks processed
+    - `bytes_read`: an estimation of the bytes of table data read. The bytes
+      of indexes read by indexed queries are not included
+    - `rows_scanned`: the number of rows of the queried range scanned
+    - `uses_index`: whether the query uses column indexes or not
+
+    :Parameter uses_index: whether the query uses column indexes or not
+    """
+
+    return {'select_time': 0.0, 'chunks': 0, 'bytes_read': 0,
+            'rows_scanned': 0, 'uses_index': bool(uses_index)}
+
+
+def parseCondition(table, qdescr):
+    """Parse the condition of a table query.
+
+    :Parameters:
+
+    - `table`: the `tables.Table` instance being queried
+    - `qdescr`: dictionary description of the query. Condition variables are
+      given as column pathnames
+
+    :Returns: a tuple (parsed condition, query profile). The parsed condition
+      is a `tablecondition.TableCondition` instance
+    """
+
+    tcond = tablecondition.TableCondition(table, qdescr['condition'],
+                                          qdescr['condvars'])
+    if tcond.elementwise:
+        return (tcond, newProfile())
+    return (tcond, newProfile(table.will_query_use_indexing(
+        tcond.expression, tcond.condvars)))
+
+
+def scanSize(table, step=1):
+    """Return the number of rows of the queried table read in every scan.
+
+    Scans are as large as the `PyTables` I/O buffer of the table or
+    `SCAN_BUFFER_SIZE` bytes, whatever is bigger. The size is rounded to a
+    multiple of the chunkshape of the table (so chunks are not decompressed
+    twice) and to a multiple of the step (so every scan selects rows with
+    the same stride as the whole range).
+
+    :Parameters:
+
+    - `table`: the `tables.Table` or `tables.Array` instance being queried.
+      Array rows are taken along its main dimension
+    - `step`: the step of the queried range
+    """
+
+    nrows = max(table.nrowsinbuf, SCAN_BUFFER_SIZE // max(1, table.rowsize))
+    chunkrows = int(table.chunkshape[table.maindim]) if table.chunkshape \
+        else 1
+    nrows = max(chunkrows, nrows // chunkrows * chunkrows)
+    return max(step, nrows // step * step)
+
+
+def rowsRange(start, stop, chunk_size):
+    """Split the range of rows being queried in slices.
+
+    Selection is done in several steps. It saves a *huge* amount of memory
+    when querying large tables.
+
+    :Parameters:
+
+    - `start`: the first row of the queried range
+    - `stop`: the last row (not included) of the queried range
+    - `chunk_size`: the number of rows of every slice
+    """
+
+    div = int((stop - start) // chunk_size)
+    for i in numpy.arange(0, div+1):
+        lstart = start + chunk_size*i
+        if lstart > stop:
+            lstart = stop
+        lstop = lstart + chunk_size
+        if lstop > stop:
+            lstop = stop
+        yield (lstart, lstop)
+
+
+def scannedSelection(table, qdescr, tcond, chunk_size, profile):
+    """Select the rows that fulfill the query condition, slice by slice.
+
+    The condition is evaluated in-kernel over consecutive slices of the
+    queried range. This is the way to go when the query cannot use indexes.
+
+    Yields tuples (coordinates, selected rows, last row scanned). If the
+    query has no indices column coordinates are None.
+
+    :Parameters:
+
+    - `table`: the `tables.Table` instance being queried
+    - `qdescr`: dictionary description of the query
+    - `tcond`: the parsed query condition
+    - `chunk_size`: the number of rows of every slice
+    - `profile`: the profile of the query, updated with every slice
+    """
+
+    (start, stop, step) = qdescr['rows_range']
+    for (lstart, lstop) in rowsRange(start, stop, chunk_size):
+        started = time.perf_counter()
+        if qdescr['indices_field_name']:
+            coordinates = table.get_where_list(
+                tcond.expression, tcond.condvars,
+                start=lstart, stop=lstop, step=step)
+            selection = table.read_coordinates(coordinates)
+        else:
+            coordinates = None
+            selection = table.read_where(
+                tcond.expression, tcond.condvars,
+                start=lstart, stop=lstop, step=step)
+        profile['select_time'] += time.perf_counter() - started
+        profile['bytes_read'] += int(lstop - lstart) * table.rowsize
+        profile['chunks'] += 1
+        yield (coordinates, selection, lstop)
+
+
+def elementwiseSelection(table, qdescr, tcond, chunk_size, profile):
+    """Select the rows that fulfill an element-wise condition, by slices.
+
+    Conditions on multidimensional columns cannot be evaluated in-kernel.
+    Instead, for every slice of the queried range, the columns used by the
+    condition are read and the condition is evaluated with ``numpy``. Then
+    the selected rows are read by coordinates.
+
+    Yields tuples (coordinates, selected rows, last row scanned).
+
+    :Parameters:
+
+    - `table`: the `tables.Table` instance being queried
+    - `qdescr`: dictionary description of the query
+    - `tcond`: the parsed query condition
+    - `chunk_size`: the number of rows of every slice
+    - `profile`: the profile of the query, updated with every slice
+    """
+
+    (start, stop, step) = qdescr['rows_range']
+    for (lstart, lstop) in rowsRange(start, stop, chunk_size):
+        started = time.perf_counter()
+        columns = tcond.readColumns(lstart, lstop, step)
+        coordinates = numpy.arange(lstart, lstop, step, dtype=numpy.int64)
+        coordinates = coordinates[tcond.mask(columns,
+                                             coordinates.shape[0])]
+        selection = table.read_coordinates(coordinates)
+        profile['select_time'] += time.perf_counter() - started
+        profile['bytes_read'] += selection.nbytes + \
+            sum(values.nbytes for values in columns.values())
+        profile['chunks'] += 1
+        yield (coordinates, selection, lstop)
+
+
+def indexedSelection(table, qdescr, tcond, chunk_size, profile):
+    """Select the rows that fulfill the query condition using indexes.
+
+    Splitting the queried range in slices would defeat the indexes, so the
+    coordinates of the selected rows are looked up for the whole range in
+    one call. Then rows are read in blocks of `chunk_size` coordinates.
+
+    Yields tuples (coordinates, selected rows, last row scanned).
+
+    :Parameters:
+
+    - `table`: the `tables.Table` instance being queried
+    - `qdescr`: dictionary description of the query
+    - `tcond`: the parsed query condition
+    - `chunk_size`: the number of coordinates of every block
+    - `profile`: the profile of the query, updated with every block
+    """
+
+    (start, stop, step) = qdescr['rows_range']
+    # Sorting keeps the selected rows in the same order than in the
+    # source table
+    started = time.perf_counter()
+    coordinates = table.get_where_list(
+        tcond.expression, tcond.condvars, start=start, stop=stop, step=step,
+        sort=True)
+    profile['select_time'] += time.perf_counter() - started
+    ncoords = coordinates.shape[0]
+    for cstart in range(0, max(ncoords, 1), chunk_size):
+        block_coords = coordinates[cstart:cstart + chunk_size]
+        if cstart + chunk_size >= ncoords:
+            scanned = stop
+        else:
+            scanned = block_coords[-1] + 1
+        started = time.perf_counter()
+        selection = table.read_coordinates(block_coords)
+        profile['select_time'] += time.perf_counter() - started
+        profile['bytes_read'] += selection.nbytes
+        profile['chunks'] += 1
+        yield (block_coords, selection, scanned)
+
+
+def selectRows(table, qdescr, tcond, ft_dtype, profile):
+    """Select the rows that fulfill the query condition, block by block.
+
+    Yields tuples (selected rows, number of rows of the queried range already
+    scanned). Selected rows are given with the dtype of the filtered table.
+    Beware that, in order to save memory allocations, the yielded blocks can
+    be views of a buffer that is overwritten by the next block.
+
+    :Parameters:
+
+    - `table`: the `tables.Table` instance being queried
+    - `qdescr`: dictionary description of the query
+    - `tcond`: the parsed query condition
+    - `ft_dtype`: the dtype of the filtered table
+    - `profile`: the profile of the query (see :func:`newProfile`). Its
+      `uses_index` item tells if the query can use column indexes
+    """
+
+    indices_field_name = str(qdescr['indices_field_name'])
+    # The query range is made of numpy scalars with dtype int64
+    (start, stop, step) = qdescr['rows_range']
+    chunk_size = scanSize(table, int(step))
+    is_copied = (ft_dtype != table.dtype)
+    if is_copied:
+        # The output buffer is allocated once and reused in every
+        # scan. A scan cannot select more than chunk_size rows
+        out_buffer = numpy.empty(chunk_size, dtype=ft_dtype)
+        src_fields = table.dtype.names
+    if tcond.elementwise:
+        blocks = elementwiseSelection(table, qdescr, tcond, chunk_size,
+                                      profile)
+    elif profile['uses_index']:
+        blocks = indexedSelection(table, qdescr, tcond, chunk_size, profile)
+    else:
+        blocks = scannedSelection(table, qdescr, tcond, chunk_size, profile)
+    for (coordinates, selection, scanned) in blocks:
+        if is_copied:
+            block = out_buffer[:selection.shape[0]]
+            for field in src_fields:
+                block[field] = selection[field]
+            if indices_field_name:
+                # The indices column of the filtered table contains
+                # the indices of the rows selected in the source table
+                block[indices_field_name] = coordinates
+        else:
+            block = selection
+        profile['rows_scanned'] = int(scanned - start)
+        yield (block, scanned - start)
+
+
+def queryTable(conn, qdescr, ft_dtype):
+    """Query a table and send the selected rows through a pipe.
+
+    This is the target of the query worker processes. See
+    :func:`vitables.workerutils.startWorker` for details.
+
+    :Parameters:
+
+    - `conn`: the sending end of the pipe connected to the GUI process
+    - `qdescr`: dictionary description of the query. Condition variables are
+      given as column pathnames
+    - `ft_dtype`: the dtype of the filtered table
+    """
+
+    try:
+        with tables.open_file(qdescr['src_filepath'], 'r') as h5file:
+            table = h5file.get_node(qdescr['src_path'])
+            (tcond, profile) = parseCondition(table, qdescr)
+            conn.send(('indexed', profile['uses_index']))
+            for (block, scanned) in selectRows(table, qdescr, tcond,
+                                               ft_dtype, profile):
+                if block.shape != (0, ):
+                    conn.send(('rows', block))
+                conn.send(('progress', scanned))
+            conn.send(('profile', profile))
+    except Exception:
+        conn.send(('error', traceback.format_exc()))
+    else:
+        conn.send(('done', None))
+    finally:
+        conn.close()
+
+
+def queryFile(task):
+    """Query a table of a file and return the selected rows.
+
+    This is the function mapped by the pool of worker processes of batch
+    queries, which run the same query on several files. Files are queried
+    in their entirety, i.e. the query result is returned at once.
+
+    The `task` argument is a tuple with components:
+
+    - `qdescr`: dictionary description of the query. Condition variables are
+      given as column pathnames and the stop of the rows range can be None
+      (meaning the end of the table)
+    - `src_dtype`: the dtype that the queried table must have
+    - `ft_dtype`: the dtype of the filtered table
+    - `source_field`: the field of the filtered table where the path of the
+      queried file is stored
+
+    :Returns: a tuple (file path, selected rows, query profile, formatted
+      traceback). If the query fails the selected rows are None.
+    """
+
+    (qdescr, src_dtype, ft_dtype, source_field) = task
+    filepath = qdescr['src_filepath']
+    try:
+        with tables.open_file(filepath, 'r') as h5file:
+            table = h5file.get_node(qdescr['src_path'])
+            if not isinstance(table, tables.Table) or \
+                    (table.dtype != src_dtype):
+                raise TypeError('{0} is not a table with the description '
+                                'of the queried table'.format(
+                                    qdescr['src_path']))
+            (start, stop, step) = qdescr['rows_range']
+            if (stop is None) or (stop > table.nrows):
+                stop = table.nrows
+            start = min(start, stop)
+            qdescr = dict(qdescr, rows_range=(start, stop, step))
+            (tcond, profile) = parseCondition(table, qdescr)
+            blocks = [block.copy() for (block, scanned)
+                      in selectRows(table, qdescr, tcond, ft_dtype,
+                                    profile)]
+            rows = numpy.concatenate(blocks) if blocks else \
+                numpy.empty(0, dtype=ft_dtype)
+            rows[source_field] = filepath.encode('utf-8')
+            return (filepath, rows, profile, None)
+    except Exception:
+        return (filepath, None, newProfile(), traceback.format_exc())
+
+
+def arrayMask(condition, values):
+    """Evaluate an array query condition over a block of array elements.
+
+    :Parameters:
+
+    - `condition`: the query condition. Elements are referred to by the
+      `ARRAY_VARIABLE` variable
+    - `values`: a ``numpy`` array with the block of elements
+
+    :Returns: a boolean ``numpy`` array with the shape of `values`
+    """
+
+    mask = numexpr.evaluate(condition, local_dict={ARRAY_VARIABLE: values})
+    if (mask.dtype != numpy.bool_) or (mask.shape != values.shape):
+        raise TypeError('the condition {0!r} does not return a boolean value '
+                        'for every array element'.format(condition))
+    return mask
+
+
+def queryArray(conn, qdescr, ft_dtype):
+    """Query an array and send the selected elements through a pipe.
+
+    This is the target of the array query worker processes. The array is
+    read in blocks of rows along its main dimension and the condition is
+    evaluated for every block with ``numexpr``. The coordinates and the
+    values of the selected elements are sent to the GUI process.
+
+    :Parameters:
+
+    - `conn`: the sending end of the pipe connected to the GUI process
+    - `qdescr`: dictionary description of the query. The indices field name
+      is the name of the coordinates column of the filtered table
+    - `ft_dtype`: the dtype of the filtered table
+    """
+
+    try:
+        with tables.open_file(qdescr['src_filepath'], 'r') as h5file:
+            array = h5file.get_node(qdescr['src_path'])
+            coords_name = str(qdescr['indices_field_name'])
+            maindim = array.maindim
+            (start, stop, step) = qdescr['rows_range']
+            chunk_size = scanSize(array, int(step))
+            profile = newProfile()
+            conn.send(('indexed', False))
+            for (lstart, lstop) in rowsRange(start, stop, chunk_size):
+                started = time.perf_counter()
+                values = array.read(lstart, lstop, step)
+                mask = arrayMask(qdescr['condition'], values)
+                profile['select_time'] += time.perf_counter() - started
+                profile['bytes_read'] += values.nbytes
+                profile['chunks'] += 1
+                profile['rows_scanned'] = int(lstop - start)
+                coordinates = numpy.array(numpy.nonzero(mask)).T
+                # Map block coordinates to array coordinates
+                coordinates[:, maindim] *= step
+                coordinates[:, maindim] += lstart
+                block = numpy.empty(coordinates.shape[0], dtype=ft_dtype)
+                if len(array.shape) > 1:
+                    block[coords_name] = coordinates
+                else:
+                    block[coords_name] = coordinates[:, 0]
+                block[ARRAY_VARIABLE] = values[mask]
+                if block.shape != (0, ):
+                    conn.send(('rows', block))
+                conn.send(('progress', lstop - start))
+            conn.send(('profile', profile))
+    except Exception:
+        conn.send(('error', traceback.format_exc()))
+    else:
+        conn.send(('done', None))
+    finally:
+        conn.close()
+
+
+def fieldData(rows, colpath):
+    """Return the values of a (maybe nested) field of a structured array.
+
+    :Parameters:
+
+    - `rows`: a ``numpy`` structured array
+    - `colpath`: the pathname of the column, e.g. ``'info/energy'``
+    """
+
+    for name in colpath.split('/'):
+        rows = rows[name]
+    return rows
+
+
+def sumDtype(dtype):
+    """Return the dtype used for adding values of a given dtype.
+
+    :Parameter dtype: the dtype of the added values
+    """
+
+    if dtype.kind == 'f':
+        return numpy.dtype(numpy.float64)
+    elif dtype.kind == 'u':
+        return numpy.dtype(numpy.uint64)
+    return numpy.dtype(numpy.int64)
+
+
+def extremeValue(dtype, is_max):
+    """Return the greatest (or the lowest) value of a given dtype.
+
+    These values are the identity elements of the `minimum` (or `maximum`)
+    reductions.
+
+    :Parameters:
+
+    - `dtype`: a numeric or boolean dtype
+    - `is_max`: True for the greatest value, False for the lowest value
+    """
+
+    if dtype.kind == 'f':
+        return numpy.inf if is_max else -numpy.inf
+    elif dtype.kind == 'b':
+        return is_max
+    info = numpy.iinfo(dtype)
+    return info.max if is_max else info.min
+
+
+class GroupAccumulator(object):
+    """Streaming accumulator of per group aggregates.
+
+    Blocks of rows are added by calling :meth:`update`. The accumulator keeps
+    the sorted keys of the groups found so far and, for every group, the
+    number of rows and the sum, minimum and maximum of the aggregated
+    columns. So memory depends only on the number of groups.
+
+    :Parameters:
+
+    - `key_dtype`: the dtype of the grouping column
+    - `columns`: a mapping of aggregated column pathnames to their dtypes
+    """
+
+    def __init__(self, key_dtype, columns):
+        """Setup an empty accumulator."""
+
+        self.keys = numpy.empty(0, dtype=key_dtype)
+        self.count = numpy.empty(0, dtype=numpy.int64)
+        self.sums = {}
+        self.mins = {}
+        self.maxs = {}
+        for (colpath, dtype) in columns.items():
+            self.sums[colpath] = numpy.empty(0, dtype=sumDtype(dtype))
+            self.mins[colpath] = numpy.empty(0, dtype=dtype)
+            self.maxs[colpath] = numpy.empty(0, dtype=dtype)
+
+    def addGroups(self, keys):
+        """Add the new groups of a block to the accumulator.
+
+        Accumulators of the new groups are initialised with the identity
+        element of their reduction.
+
+        :Parameter keys: the sorted keys of the groups found in a block
+        """
+
+        all_keys = numpy.union1d(self.keys, keys)
+        if all_keys.shape == self.keys.shape:
+            return
+        positions = numpy.searchsorted(all_keys, self.keys)
+
+        def expand(values, identity):
+            expanded = numpy.full(all_keys.shape, identity,
+                                  dtype=values.dtype)
+            expanded[positions] = values
+            return expanded
+
+        self.count = expand(self.count, 0)
+        for colpath in self.sums:
+            dtype = self.mins[colpath].dtype
+            self.sums[colpath] = expand(self.sums[colpath], 0)
+            self.mins[colpath] = expand(self.mins[colpath],
+                                        extremeValue(dtype, True))
+            self.maxs[colpath] = expand(self.maxs[colpath],
+                                        extremeValue(dtype, False))
+        self.keys = all_keys
+
+    def update(self, keys, values):
+        """Add a block of rows to the accumulator.
+
+        :Parameters:
+
+        - `keys`: the values of the grouping column in the block
+        - `values`: a mapping of aggregated column pathnames to their values
+          in the block
+        """
+
+        if not keys.shape[0]:
+            return
+        block_keys, inverse = numpy.unique(keys, return_inverse=True)
+        inverse = inverse.ravel()
+        counts = numpy.bincount(inverse, minlength=block_keys.shape[0])
+        self.addGroups(block_keys)
+        groups = numpy.searchsorted(self.keys, block_keys)
+        self.count[groups] += counts
+
+        # Rows are sorted by group so every group is a contiguous segment
+        # that can be reduced with reduceat
+        order = numpy.argsort(inverse, kind='stable')
+        starts = numpy.concatenate(([0], numpy.cumsum(counts)[:-1]))
+        for (colpath, data) in values.items():
+            data = data[order]
+            sums = self.sums[colpath]
+            sums[groups] += numpy.add.reduceat(data.astype(sums.dtype),
+                                               starts)
+            mins = self.mins[colpath]
+            mins[groups] = numpy.minimum(
+                mins[groups], numpy.minimum.reduceat(data, starts))
+            maxs = self.maxs[colpath]
+            maxs[groups] = numpy.maximum(
+                maxs[groups], numpy.maximum.reduceat(data, starts))
+
+    def result(self, dtype, key_field, aggregates):
+        """Return the aggregates of every group.
+
+        :Parameters:
+
+        - `dtype`: the dtype of the result. It has a `count` field
+        - `key_field`: the field of the result where group keys are stored
+        - `aggregates`: a sequence of tuples (column pathname, function,
+          field of the result) where function is one of 'sum', 'min', 'max'
+          and 'mean'
+        """
+
+        result = numpy.empty(self.keys.shape[0], dtype=dtype)
+        result[key_field] = self.keys
+        result['count'] = self.count
+        for (colpath, function, field) in aggregates:
+            if function == 'sum':
+                result[field] = self.sums[colpath]
+            elif function == 'min':
+                result[field] = self.mins[colpath]
+            elif function == 'max':
+                result[field] = self.maxs[colpath]
+            else:
+                result[field] = self.sums[colpath] / self.count
+        return result
+
+
+def aggregateTable(conn, qdescr, ft_dtype):
+    """Compute the aggregates of the groups of rows of a table.
+
+    This is the target of the aggregation worker processes. The table is
+    read chunk by chunk (only the rows that fulfill the condition, if any)
+    and rows are added to a `GroupAccumulator`. The aggregates are sent
+    through the pipe when the whole range has been scanned.
+
+    :Parameters:
+
+    - `conn`: the sending end of the pipe connected to the GUI process
+    - `qdescr`: dictionary description of the query. Besides the usual
+      items it has the items `group_by` (the pathname of the grouping
+      column), `key_field` (the field of the result with the group keys) and
+      `aggregates` (see :meth:`GroupAccumulator.result`). The condition can
+      be empty
+    - `ft_dtype`: the dtype of the result table
+    """
+
+    try:
+        with tables.open_file(qdescr['src_filepath'], 'r') as h5file:
+            table = h5file.get_node(qdescr['src_path'])
+            tcond = None
+            if qdescr['condition']:
+                tcond = tablecondition.TableCondition(
+                    table, qdescr['condition'], qdescr['condvars'])
+            colpaths = set(colpath for (colpath, function, field)
+                           in qdescr['aggregates'])
+            accumulator = GroupAccumulator(
+                table.coldtypes[qdescr['group_by']],
+                dict((colpath, table.coldtypes[colpath])
+                     for colpath in colpaths))
+            profile = newProfile()
+            conn.send(('indexed', False))
+            (start, stop, step) = qdescr['rows_range']
+            chunk_size = scanSize(table, int(step))
+            for (lstart, lstop) in rowsRange(start, stop, chunk_size):
+                started = time.perf_counter()
+                if tcond is None:
+                    rows = table.read(lstart, lstop, step)
+                elif tcond.elementwise:
+                    rows = table.read(lstart, lstop, step)
+                    rows = rows[tcond.mask(tcond.rowColumns(rows),
+                                           rows.shape[0])]
+                else:
+                    rows = table.read_where(tcond.expression,
+                                            tcond.condvars, start=lstart,
+                                            stop=lstop, step=step)
+                profile['select_time'] += time.perf_counter() - started
+                profile['bytes_read'] += int(lstop - lstart) * table.rowsize
+                profile['chunks'] += 1
+                profile['rows_scanned'] = int(lstop - start)
+                accumulator.update(
+                    fieldData(rows, qdescr['group_by']),
+                    dict((colpath, fieldData(rows, colpath))
+                         for colpath in colpaths))
+                conn.send(('progress', lstop - start))
+            result = accumulator.result(ft_dtype, qdescr['key_field'],
+                                        qdescr['aggregates'])
+            if result.shape != (0, ):
+                conn.send(('rows', result))
+            conn.send(('profile', profile))
+    except Exception:
+        conn.send(('error', traceback.format_exc()))
+    else:
+        conn.send(('done', None))
+    finally:
+        conn.close()
+
+
+def buildSideSize(table):
+    """Return the estimated memory (in bytes) used by a join build side.
+
+    The whole table is kept in memory, along with a copy of its key column
+    and the sort order of the keys.
+
+    :Parameter table: the table being loaded
+    """
+
+    return table.nrows * (table.rowsize + 16)
+
+
+def matchKeys(sorted_keys, keys):
+    """Find the matches of a block of probe keys in the sorted build keys.
+
+    :Parameters:
+
+    - `sorted_keys`: the sorted keys of the build side
+    - `keys`: the keys of a block of the probe side
+
+    :Returns: a tuple (probe positions, sorted build positions) with an
+      entry per matching pair
+    """
+
+    lower = numpy.searchsorted(sorted_keys, keys, side='left')
+    upper = numpy.searchsorted(sorted_keys, keys, side='right')
+    counts = upper - lower
+    total = int(counts.sum())
+    probe_positions = numpy.repeat(numpy.arange(keys.shape[0]), counts)
+    # Every probe key matches a contiguous segment of the sorted keys
+    starts = numpy.cumsum(counts) - counts
+    build_positions = numpy.arange(total) - \
+        numpy.repeat(starts - lower, counts)
+    return probe_positions, build_positions
+
+
+def joinTables(conn, qdescr, ft_dtype):
+    """Join two tables on a key column and send the joined rows.
+
+    This is the target of the join worker processes. The build side table is
+    read in memory and its keys are sorted, which gives an index of the
+    table by key. The probe side table is read in blocks and the matches of
+    every block are looked up with binary searches. The joined rows have a
+    ``left`` and a ``right`` nested field with the rows of the first and
+    the second table.
+
+    The query fails if the build side doesn't fit in the memory budget.
+
+    :Parameters:
+
+    - `conn`: the sending end of the pipe connected to the GUI process
+    - `qdescr`: dictionary description of the query. Besides the usual items
+      it has the items `right_filepath` and `right_path` (the second
+      table), `left_key` and `right_key` (the pathnames of the key columns),
+      `build_side` ('left' or 'right') and `memory_budget` (in bytes)
+    - `ft_dtype`: the dtype of the joined table
+    """
+
+    try:
+        with tables.open_file(qdescr['src_filepath'], 'r') as left_file:
+            if qdescr['right_filepath'] == qdescr['src_filepath']:
+                right_file = left_file
+            else:
+                right_file = tables.open_file(qdescr['right_filepath'], 'r')
+            try:
+                sides = {
+                    'left': (left_file.get_node(qdescr['src_path']),
+                             qdescr['left_key']),
+                    'right': (right_file.get_node(qdescr['right_path']),
+                              qdescr['right_key'])}
+                build_side = qdescr['build_side']
+                probe_side = 'right' if build_side == 'left' else 'left'
+                (build_table, build_key) = sides[build_side]
+                (probe_table, probe_key) = sides[probe_side]
+
+                memory = buildSideSize(build_table)
+                if memory > qdescr['memory_budget']:
+                    raise MemoryError(
+                        'the {0} table needs {1:.1f} MB, which exceeds the '
+                        'memory budget of {2:.1f} MB'.format(
+                            build_side, memory / 2.**20,
+                            qdescr['memory_budget'] / 2.**20))
+                conn.send(('info', 'Join build side: {0} table, {1} rows, '
+                                   '{2:.1f} MB'.format(
+                                       build_side, build_table.nrows,
+                                       memory / 2.**20)))
+                profile = newProfile()
+                conn.send(('indexed', False))
+
+                started = time.perf_counter()
+                build_rows = build_table.read()
+                profile['select_time'] += time.perf_counter() - started
+                profile['bytes_read'] += build_rows.nbytes
+                order = numpy.argsort(fieldData(build_rows, build_key),
+                                      kind='stable')
+                sorted_keys = fieldData(build_rows, build_key)[order]
+
+                (start, stop, step) = qdescr['rows_range']
+                chunk_size = scanSize(probe_table)
+                for (lstart, lstop) in rowsRange(start, stop, chunk_size):
+                    started = time.perf_counter()
+                    probe_rows = probe_table.read(lstart, lstop)
+                    profile['select_time'] += time.perf_counter() - started
+                    profile['bytes_read'] += probe_rows.nbytes
+                    profile['chunks'] += 1
+                    profile['rows_scanned'] = int(lstop - start)
+                    (probe_positions, build_positions) = matchKeys(
+                        sorted_keys, fieldData(probe_rows, probe_key))
+                    if probe_positions.shape[0]:
+                        block = numpy.empty(probe_positions.shape[0],
+                                            dtype=ft_dtype)
+                        block[probe_side] = probe_rows[probe_positions]
+                        block[build_side] = \
+                            build_rows[order[build_positions]]
+                        conn.send(('rows', block))
+                    conn.send(('progress', lstop - start))
+                conn.send(('profile', profile))
+            finally:
+                if right_file is not left_file:
+                    right_file.close()
+    except Exception:
+        conn.send(('error', traceback.format_exc()))
+    else:
+        conn.send(('done', None))
+    finally:
+        conn.close()
+
+
+def manageIndex(conn, filepath, tablepath, colpath, action):
+    """Create, rebuild or remove the index of a table column.
+
+    This is the target of the index worker processes. The file must not be
+    open in the GUI process while the worker writes to it.
+
+    :Parameters:
+
+    - `conn`: the sending end of the pipe connected to the GUI process
+    - `filepath`: the full path of the file where the table lives
+    - `tablepath`: the path of the table in the file
+    - `colpath`: the path of the column in the table
+    - `action`: one of 'create', 'reindex' or 'remove'
+    """
+
+    try:
+        with tables.open_file(filepath, 'a') as h5file:
+            column = h5file.get_node(tablepath).cols._f_col(colpath)
+            if action == 'create':
+                column.create_csindex()
+            elif action == 'reindex':
+                column.reindex()
+            else:
+                column.remove_index()
+    except Exception:
+        conn.send(('error', traceback.format_exc()))
+    else:
+        conn.send(('done', None))
+    finally:
+        conn.close()
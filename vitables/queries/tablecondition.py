@@ -0,0 +1,360 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#       Copyright (C) 2008-2017 Vicent Mas. All rights reserved
+#
+#       This program is free software: you can redistribute it and/or modify
+#       it under the terms of the GNU General Public License as published by
+#       the Free Software Foundation, either version 3 of the License, or
+#       (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#       MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#       GNU General Public License for more details.
+#
+#       You should have received a copy of the GNU General Public License
+#       along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#       Author:  Vicent Mas - vmas@vitables.org
+
+"""
+This module parses the conditions of table queries.
+
+Besides the columns supported by `PyTables` in-kernel queries, conditions can
+refer to:
+
+- nested columns, by their dotted path (e.g. ``info.energy``)
+- multidimensional columns. Their elements can be indexed (e.g.
+  ``position[0] > 1``) and the element-wise predicates can be reduced to a
+  value per row with the ``any`` and ``all`` functions (e.g.
+  ``any(samples > 3)``)
+
+Conditions on scalar columns (nested or not) are rewritten for being
+evaluated in-kernel so they can still use column indexes. Conditions on
+multidimensional columns are evaluated blockwise with ``numpy`` after reading
+only the columns involved in the condition.
+
+Beware that this module is imported by the query worker processes so it must
+not import ``Qt`` nor any ``ViTables`` module that requires a running
+application.
+"""
+
+__docformat__ = 'restructuredtext'
+
+import ast
+
+import numpy
+
+
+def anyElement(values):
+    """Return True for the rows that have some element that is True.
+
+    :Parameter values: a block of values of a multidimensional column
+    """
+    return numpy.any(values, axis=tuple(range(1, values.ndim)))
+
+
+def allElement(values):
+    """Return True for the rows whose elements are all True.
+
+    :Parameter values: a block of values of a multidimensional column
+    """
+    return numpy.all(values, axis=tuple(range(1, values.ndim)))
+
+
+# The functions that can be called by conditions evaluated with numpy. They
+# are the functions supported by in-kernel queries plus the element-wise
+# reductions
+NUMPY_FUNCTIONS = {
+    'where': numpy.where,
+    'sin': numpy.sin,
+    'cos': numpy.cos,
+    'tan': numpy.tan,
+    'arcsin': numpy.arcsin,
+    'arccos': numpy.arccos,
+    'arctan': numpy.arctan,
+    'arctan2': numpy.arctan2,
+    'sinh': numpy.sinh,
+    'cosh': numpy.cosh,
+    'tanh': numpy.tanh,
+    'arcsinh': numpy.arcsinh,
+    'arccosh': numpy.arccosh,
+    'arctanh': numpy.arctanh,
+    'log': numpy.log,
+    'log10': numpy.log10,
+    'log1p': numpy.log1p,
+    'exp': numpy.exp,
+    'expm1': numpy.expm1,
+    'sqrt': numpy.sqrt,
+    'abs': numpy.absolute,
+    'real': numpy.real,
+    'imag': numpy.imag,
+    'complex': lambda real, imag: real + 1j * imag,
+    'any': anyElement,
+    'all': allElement,
+}
+
+# The syntax allowed in conditions. Anything else (comprehensions, lambdas,
+# boolean operators...) is rejected
+ALLOWED_NODES = (
+    ast.Expression, ast.BinOp, ast.UnaryOp, ast.Compare, ast.Call,
+    ast.Name, ast.Attribute, ast.Subscript, ast.Constant, ast.Tuple,
+    ast.Slice, ast.Load, ast.operator, ast.unaryop, ast.cmpop,
+)
+
+
+class ConditionRewriter(ast.NodeTransformer):
+    """Rewrite the syntax tree of a query condition.
+
+    Dotted paths of nested columns are replaced by condition variables.
+    Indexes of multidimensional columns are shifted by one dimension (the
+    first dimension of a block of column values is the row) and the ``any``
+    and ``all`` functions are replaced by element-wise reductions.
+
+    :Parameters:
+
+    - `table`: the queried table
+    - `condvars`: a mapping of condition variable names to column pathnames
+    """
+
+    def __init__(self, table, condvars):
+        """Initialise the rewriter."""
+
+        super(ConditionRewriter, self).__init__()
+        self.table = table
+        self.condvars = dict(condvars)
+        # The condition variables used by the condition
+        self.variables = {}
+        # True if the condition must be evaluated with numpy
+        self.elementwise = False
+        # True if some dotted path has been replaced
+        self.rewritten = False
+
+
+    def columnPath(self, node):
+        """Return the pathname of the column referred to by a node.
+
+        :Parameter node: a `Name` or (a chain of) `Attribute` node
+
+        :Returns: the column pathname or None if the node is not a column
+        """
+
+        if isinstance(node, ast.Name):
+            if node.id in self.condvars:
+                return self.condvars[node.id]
+            if node.id in self.table.coldescrs:
+                return node.id
+        elif isinstance(node, ast.Attribute) and \
+                isinstance(node.value, (ast.Name, ast.Attribute)):
+            parts = []
+            while isinstance(node, ast.Attribute):
+                parts.insert(0, node.attr)
+                node = node.value
+            if isinstance(node, ast.Name):
+                colpath = '/'.join([node.id] + parts)
+                if colpath in self.table.coldescrs:
+                    return colpath
+        return None
+
+
+    def variable(self, colpath):
+        """Return the name of the condition variable of a column.
+
+        :Parameter colpath: the column pathname
+        """
+
+        for (name, path) in self.condvars.items():
+            if path == colpath and name.isidentifier():
+                break
+        else:
+            name = colpath.replace('/', '__')
+            while (name in self.condvars) or \
+                    (name in self.table.colnames) or \
+                    (name in NUMPY_FUNCTIONS):
+                name = '_' + name
+            self.condvars[name] = colpath
+        self.variables[name] = colpath
+        if self.table.coldescrs[colpath].shape != ():
+            self.elementwise = True
+        return name
+
+
+    def generic_visit(self, node):
+        """Reject the syntax not allowed in conditions."""
+
+        if not isinstance(node, ALLOWED_NODES):
+            raise SyntaxError('{0} expressions are not allowed in query '
+                              'conditions'.format(type(node).__name__))
+        return super(ConditionRewriter, self).generic_visit(node)
+
+
+    def visit_Name(self, node):
+        """Register the columns referred to by name."""
+
+        colpath = self.columnPath(node)
+        if colpath is None:
+            return node
+        return ast.copy_location(ast.Name(self.variable(colpath),
+                                          ast.Load()), node)
+
+
+    def visit_Attribute(self, node):
+        """Replace the dotted paths of nested columns by variables."""
+
+        colpath = self.columnPath(node)
+        if colpath is None:
+            raise NameError('{0} is not a column of the queried '
+                            'table'.format(ast.unparse(node)))
+        self.rewritten = True
+        return ast.copy_location(ast.Name(self.variable(colpath),
+                                          ast.Load()), node)
+
+
+    def visit_Subscript(self, node):
+        """Index the elements of multidimensional columns."""
+
+        colpath = self.columnPath(node.value)
+        if (colpath is None) or (self.table.coldescrs[colpath].shape == ()):
+            raise SyntaxError('only multidimensional columns can be indexed '
+                              'in query conditions')
+        node = self.generic_visit(node)
+        index = node.slice
+        index = list(index.elts) if isinstance(index, ast.Tuple) \
+            else [index]
+        node.slice = ast.Tuple([ast.Slice()] + index, ast.Load())
+        return node
+
+
+    def visit_Call(self, node):
+        """Check the called functions."""
+
+        if (not isinstance(node.func, ast.Name)) or node.keywords:
+            raise SyntaxError('only functions can be called in query '
+                              'conditions')
+        if node.func.id in ('any', 'all'):
+            self.elementwise = True
+        node.args = [self.visit(arg) for arg in node.args]
+        return node
+
+
+class TableCondition(object):
+    """The condition of a table query.
+
+    If the condition refers to multidimensional columns then it is evaluated
+    blockwise with ``numpy`` (see :meth:`readColumns` and :meth:`mask`).
+    Otherwise `expression` and `condvars` are the condition and the condition
+    variables of an in-kernel query.
+
+    :Parameters:
+
+    - `table`: the queried table
+    - `condition`: the query condition
+    - `condvars`: a mapping of condition variable names to column pathnames
+    """
+
+    def __init__(self, table, condition, condvars):
+        """Parse the condition."""
+
+        self.table = table
+        condition = condition.strip()
+        rewriter = ConditionRewriter(table, condvars)
+        tree = rewriter.visit(ast.parse(condition, mode='eval'))
+        self.elementwise = rewriter.elementwise
+        self.variables = rewriter.variables
+        self.condvars = dict((name, table.cols._f_col(colpath))
+                             for (name, colpath) in rewriter.condvars.items())
+        if self.elementwise:
+            self.expression = None
+            self.code = compile(ast.fix_missing_locations(tree),
+                                '<condition>', 'eval')
+        else:
+            # Conditions without nested paths are passed untouched to
+            # PyTables
+            self.expression = ast.unparse(tree) if rewriter.rewritten \
+                else condition
+            self.code = None
+
+
+    def readColumns(self, start, stop, step):
+        """Read a block of the columns used by the condition.
+
+        :Parameters:
+
+        - `start`: the first row of the block
+        - `stop`: the last row (not included) of the block
+        - `step`: the step of the block
+
+        :Returns: a mapping of condition variable names to column values
+        """
+
+        values = {}
+        for colpath in set(self.variables.values()):
+            values[colpath] = self.table.read(start, stop, step,
+                                              field=colpath)
+        return dict((name, values[colpath])
+                    for (name, colpath) in self.variables.items())
+
+
+    def rowColumns(self, rows):
+        """Return the columns used by the condition in a block of rows.
+
+        :Parameter rows: a block of rows of the queried table
+
+        :Returns: a mapping of condition variable names to column values
+        """
+
+        columns = {}
+        for (name, colpath) in self.variables.items():
+            values = rows
+            for field in colpath.split('/'):
+                values = values[field]
+            columns[name] = values
+        return columns
+
+
+    def mask(self, columns, nrows):
+        """Evaluate the condition over a block of rows.
+
+        :Parameters:
+
+        - `columns`: a mapping of condition variable names to column values
+        - `nrows`: the number of rows of the block
+
+        :Returns: a boolean ``numpy`` array with a value per row
+        """
+
+        namespace = dict(NUMPY_FUNCTIONS)
+        namespace.update(columns)
+        mask = numpy.asarray(eval(self.code, {'__builtins__': {}},
+                                  namespace))
+        if (mask.dtype != numpy.bool_) or (mask.shape != (nrows, )):
+            raise TypeError('the condition does not return a boolean value '
+                            'for every row. Element-wise conditions on '
+                            'multidimensional columns must be reduced with '
+                            'any() or all()')
+        return mask
+
+
+def checkCondition(table, condition, condvars):
+    """Check a query condition on a table.
+
+    The condition is evaluated over the first row of the table so syntax
+    errors, unknown names and type errors raise the usual exceptions.
+
+    :Parameters:
+
+    - `table`: the queried table
+    - `condition`: the query condition
+    - `condvars`: a mapping of condition variable names to column pathnames
+
+    :Returns: the parsed condition, a `TableCondition` instance
+    """
+
+    tcond = TableCondition(table, condition, condvars)
+    if tcond.elementwise:
+        nrows = min(1, table.nrows)
+        tcond.mask(tcond.readColumns(0, nrows, 1), nrows)
+    else:
+        table.will_query_use_indexing(tcond.expression, tcond.condvars)
+    return tcond
@@ -43,6 +43,7 @@ import vitables.preferences.pluginsloader as pluginsloader
 from vitables.preferences import preferences
 
 import vitables.queries.querymgr as qmgr
+import vitables.queries.indexmgr as imgr
 
 import vitables.vtwidgets.nodenamedlg as nodenamedlg
 import vitables.vtwidgets.renamedlg as renamedlg
@@ -53,6 +54,8 @@ import vitables.vttables.datasheet as datasheet
 
 import vitables.csv.import_csv as importcsv
 import vitables.csv.export_csv as exportcsv
+import vitables.npy.import_npy as importnpy
+import vitables.npy.export_npy as exportnpy
 
 import vitables.vtgui as vtgui
 
@@ -139,6 +142,10 @@ class VTApp(QtCore.QObject):
         self.csv_importer = importcsv.ImportCSV()
         self.csv_exporter = exportcsv.ExportToCSV()
 
+        # Add import/export .npy capabilities
+        self.npy_importer = importnpy.ImportNPY()
+        self.npy_exporter = exportnpy.ExportToNPY()
+
         # Load plugins.
         # Some plugins modify existing menus so plugins must be loaded after
         # creating the user interface.
@@ -152,6 +159,8 @@ class VTApp(QtCore.QObject):
 
         # The queries manager
         self.queries_mgr = qmgr.QueriesManager()
+        # The column indexes manager
+        self.indexes_mgr = imgr.IndexesManager()
 
         # Print the welcome message
         self.gui.logger.write(
@@ -637,6 +646,16 @@ class VTApp(QtCore.QObject):
             # Make sure filepath uses Unix-like separators
             filepath = vitables.utils.forwardPath(filepath)
 
+        # A file being indexed is closed until the index worker finishes,
+        # then it is reopened by the indexes manager
+        if filepath in self.indexes_mgr.jobs:
+            log.error(
+                translate('VTApp',
+                          'File {0} cannot be opened until its index '
+                          'operation finishes.',
+                          'A file open error').format(filepath))
+            return
+
         # Open the database and select it in the tree view
         if self.gui.dbs_tree_model.openDBDoc(filepath, mode, position):
             self.gui.dbs_tree_view.setCurrentIndex(
@@ -1080,6 +1099,7 @@ class VTApp(QtCore.QObject):
         # If item is a filtered table then update the list of used names
         if hasattr(node.node._v_attrs, 'query_condition'):
             self.queries_mgr.ft_names.remove(node.name)
+            self.queries_mgr.removeCachedResult(node.nodepath)
 
         # If the deletion involves a node with attached views then these
         # views are closed before the deletion is done
@@ -1109,6 +1129,18 @@ class VTApp(QtCore.QObject):
         """Slot for querying tables."""
         self.queries_mgr.newQuery()
 
+    def newBatchQuery(self):
+        """Slot for querying a table in several files."""
+        self.queries_mgr.newBatchQuery()
+
+    def newAggregateQuery(self):
+        """Slot for computing aggregates of tables."""
+        self.queries_mgr.newAggregateQuery()
+
+    def newJoinQuery(self):
+        """Slot for joining tables."""
+        self.queries_mgr.newJoinQuery()
+
     def deleteAllQueries(self):
         """Slot for emptying the `Query results` node."""
         self.queries_mgr.deleteAllQueries()
@@ -327,6 +327,32 @@ class VTGUI(QtWidgets.QMainWindow):
                 'Status bar text for the Query -> New... action'))
         actions['queryNew'].setObjectName('queryNew')
 
+        actions['queryBatch'] = QtWidgets.QAction(
+            translate('VTGUI', 'Query &Files...', 'Query -> Batch...'), self,
+            triggered=self.vtapp.newBatchQuery,
+            statusTip=translate(
+                'VTGUI', 'Query the selected table in several files at once',
+                'Status bar text for the Query -> Batch... action'))
+        actions['queryBatch'].setObjectName('queryBatch')
+
+        actions['queryAggregate'] = QtWidgets.QAction(
+            translate('VTGUI', '&Aggregate...', 'Query -> Aggregate...'),
+            self,
+            triggered=self.vtapp.newAggregateQuery,
+            statusTip=translate(
+                'VTGUI', 'Group the rows of the selected table and compute '
+                'aggregates',
+                'Status bar text for the Query -> Aggregate... action'))
+        actions['queryAggregate'].setObjectName('queryAggregate')
+
+        actions['queryJoin'] = QtWidgets.QAction(
+            translate('VTGUI', '&Join...', 'Query -> Join...'), self,
+            triggered=self.vtapp.newJoinQuery,
+            statusTip=translate(
+                'VTGUI', 'Join the selected table with other table',
+                'Status bar text for the Query -> Join... action'))
+        actions['queryJoin'].setObjectName('queryJoin')
+
         actions['queryDeleteAll'] = QtWidgets.QAction(
             translate('VTGUI', 'Delete &All', 'Query -> Delete All'), self,
             triggered=self.vtapp.deleteAllQueries,
@@ -577,7 +603,8 @@ class VTGUI(QtWidgets.QMainWindow):
         self.dataset_menu = self.menuBar().addMenu(
             translate('VTGUI', "&Dataset", 'The Dataset menu entry'))
         self.dataset_menu.setObjectName('dataset_menu')
-        dataset_actions = ['queryNew', 'calculate']
+        dataset_actions = ['queryNew', 'queryBatch', 'queryAggregate',
+                           'queryJoin', 'calculate']
         vitables.utils.addActions(self.dataset_menu, dataset_actions,
                                   self.gui_actions)
 
@@ -653,7 +680,8 @@ class VTGUI(QtWidgets.QMainWindow):
         self.leaf_node_cm.setObjectName('leaf_node_cm')
         actions = ['nodeOpen', 'nodeClose', None, 'nodeProperties', None,
                    'nodeRename', 'nodeCut', 'nodeCopy', 'nodePaste',
-                   'nodeDelete', None, 'queryNew']
+                   'nodeDelete', None, 'queryNew', 'queryBatch',
+                   'queryAggregate', 'queryJoin']
         vitables.utils.addActions(self.leaf_node_cm, actions, self.gui_actions)
 
         self.mdi_cm = QtWidgets.QMenu(self)
@@ -735,7 +763,8 @@ class VTGUI(QtWidgets.QMainWindow):
                              'nodeOpen', 'nodeClose', 'nodeProperties',
                              'nodeNew', 'nodeRename', 'nodeCut', 'nodeCopy',
                              'nodePaste', 'nodeDelete',
-                             'queryNew', 'queryDeleteAll'])
+                             'queryNew', 'queryBatch', 'queryAggregate',
+                             'queryJoin', 'queryDeleteAll'])
         enabled = set([])
 
         model_rows = self.dbs_tree_model.rowCount(QtCore.QModelIndex())
@@ -765,9 +794,14 @@ class VTGUI(QtWidgets.QMainWindow):
                 enabled = enabled.union(['fileSaveAs', 'fileClose'])
 
             kind = node.node_kind
-            # If the node is a table --> queryNew is enabled
-            if kind == 'table':
+            # If the node is a table or an array --> queryNew is enabled
+            if kind in ('table', 'array', 'carray', 'earray'):
                 enabled = enabled.union(['queryNew'])
+            # Batch, aggregation and join queries are supported for tables
+            # only
+            if kind == 'table':
+                enabled = enabled.union(['queryBatch', 'queryAggregate',
+                                         'queryJoin'])
 
             # If the file is not open in read-only mode
             mode = self.dbs_tree_model.getDBDoc(node.filepath).mode
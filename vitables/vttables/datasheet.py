@@ -41,11 +41,15 @@ class DataSheet(QtWidgets.QMdiSubWindow):
     """
     The widget containing the displayed data of a given dataset.
 
-    :Parameter index: the index (in the tree of databases model) of the leaf
-      whose data will be displayed
+    :Parameters:
+
+    - `index`: the index (in the tree of databases model) of the leaf whose
+      data will be displayed
+    - `model`: the model of the displayed data. By default it is built from
+      the leaf
     """
 
-    def __init__(self, index):
+    def __init__(self, index, model=None):
         """Display a given dataset in the MDI area.
         """
 
@@ -65,7 +69,9 @@ class DataSheet(QtWidgets.QMdiSubWindow):
         else:
             leaf = pt_node
 
-        self.leaf_model = df_model.try_opening_as_dataframe(leaf)
+        self.leaf_model = model
+        if not self.leaf_model:
+            self.leaf_model = df_model.try_opening_as_dataframe(leaf)
         if not self.leaf_model:
             self.leaf_model = leaf_model.LeafModel(leaf)
 
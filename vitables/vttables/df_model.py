@@ -20,11 +20,18 @@
 """
 This module implements a model (in the `MVC` sense) for the real data stored
 in a `tables.Leaf`.
+
+Leaves written by pandas in `frame_table` format can also be filtered with
+``HDFStore.select(where=...)``, so predicates on their data columns use the
+indexes that pandas writes.
 """
 
 __docformat__ = 'restructuredtext'
 
 import logging
+import re
+
+import numpy
 
 from qtpy import QtCore, QtGui
 from qtpy.QtCore import Qt
@@ -42,7 +49,17 @@ _axis_label_font.setBold(True)
 _axis_label_font.setItalic(True)
 
 
-def try_opening_as_dataframe(leaf):
+# The number of rows read in every block when a predicate cannot be
+# evaluated by pandas and the frame is scanned
+SCAN_CHUNK_SIZE = 100000
+
+# Quoted strings and names in `where` predicates
+_where_strings = re.compile(r'"[^"]*"|\'[^\']*\'')
+_where_names = re.compile(r'\b[A-Za-z_]\w*\b')
+
+
+def open_hdfstore(tables_h5file):
+    """Return a pandas store for an open file, or None without pandas."""
     try:
         from pandas.io import pytables
     except ImportError:
@@ -59,14 +76,72 @@ def try_opening_as_dataframe(leaf):
 
             pytables._tables()
 
+    return HDFStoreWrapper(tables_h5file)
+
+
+def get_pandas_type(leaf):
+    """Returns the pandas format of a leaf, ``None`` if not from pandas."""
     pgroup = leaf._g_getparent()
     assert pgroup._c_classid == 'GROUP', (leaf, pgroup)
 
-    pandas_attr = getattr(pgroup._v_attrs, 'pandas_type', None)
-    if pandas_attr in ['frame', 'frame_table']:
-        hstore = HDFStoreWrapper(leaf._v_file)
+    return getattr(pgroup._v_attrs, 'pandas_type', None)
+
+
+def try_opening_as_dataframe(leaf):
+    if get_pandas_type(leaf) in ['frame', 'frame_table']:
+        hstore = open_hdfstore(leaf._v_file)
+        if hstore is not None:
+            return DataFrameModel(leaf, hstore)
+
 
-        return DataFrameModel(leaf, hstore)
+def select_coordinates(hstore, key, where):
+    """
+    Find the rows of a `frame_table` that fulfill a `where` predicate.
+
+    The predicate is passed to ``HDFStore.select_as_coordinates``, which
+    evaluates it in-kernel and uses the indexes of the data columns. If the
+    predicate refers to columns that are not data columns pandas refuses it,
+    so the frame is read in chunks and the predicate is evaluated with
+    ``DataFrame.eval`` (a full scan).
+
+    :param hstore:
+        The store of the file.
+    :param key:
+        The path of the frame (the parent group of the leaf).
+    :param where:
+        The predicate, in ``HDFStore.select`` syntax.
+    :return:
+        A tuple ``(coordinates, used_columns)``. `used_columns` maps the
+        data columns (and ``index``) referred to by the predicate to
+        whether they are indexed or not, and is ``None`` if the frame has
+        been fully scanned.
+    """
+    storer = hstore.get_storer(key)
+    try:
+        coordinates = hstore.select_as_coordinates(key, where)
+    except ValueError:
+        coordinates = []
+        offset = 0
+        for chunk in hstore.select(key, iterator=True,
+                                   chunksize=SCAN_CHUNK_SIZE):
+            mask = chunk.eval(where)
+            if getattr(mask, 'dtype', None) != numpy.bool_:
+                raise ValueError(
+                    'The where expression {0!r} is not a predicate'.format(
+                        where))
+            coordinates.append(offset + numpy.flatnonzero(mask.values))
+            offset += len(chunk)
+        coordinates = numpy.concatenate(coordinates) if coordinates \
+            else numpy.empty(0, dtype=numpy.int64)
+        return coordinates, None
+
+    names = set(_where_names.findall(_where_strings.sub('', where)))
+    colindexed = storer.table.colindexed
+    used_columns = dict(
+        (name, colindexed.get(name, False))
+        for name in names
+        if name == 'index' or name in (storer.data_columns or []))
+    return numpy.asarray(coordinates, dtype=numpy.int64), used_columns
 
 
 def get_index_name(index, i, fallback_pattern):
@@ -107,9 +182,12 @@ class DataFrameModel(QtCore.QAbstractTableModel):
         A tuple ``(row_span, col_span)`` for the number of *columns/indices*
         headers respectively, in case they are pandas multi-index, or
         just ``(1, 1)``.
+    :attribute coordinates:
+        The coordinates of the displayed rows of a filtered `frame_table`
+        (see :func:`select_coordinates`), or ``None`` for all rows.
     """
 
-    def __init__(self, leaf, hstore, parent=None):
+    def __init__(self, leaf, hstore, parent=None, coordinates=None):
         """Create the model.
         """
         self._leaf = leaf
@@ -117,11 +195,15 @@ class DataFrameModel(QtCore.QAbstractTableModel):
 
         self._hstore = hstore
         self.start = 0
+        self.coordinates = coordinates
 
         ## The dataset number of rows is potentially huge but tables are
         #  kept small: just the data returned by a read operation of the
         #  buffer are displayed
-        self.leaf_numrows = leaf.shape[0]
+        if coordinates is None:
+            self.leaf_numrows = leaf.shape[0]
+        else:
+            self.leaf_numrows = len(coordinates)
         self.numrows = min(self.leaf_numrows, leaf_model.CHUNK_SIZE)
 
         # Track selected cell.
@@ -184,8 +266,12 @@ class DataFrameModel(QtCore.QAbstractTableModel):
         actual_start = stop - self.numrows
         start = max(min(actual_start, start), 0)
 
-        self._chunk = self._hstore.select(self._pgroup,
-                                          start=start, stop=stop)
+        if self.coordinates is None:
+            self._chunk = self._hstore.select(self._pgroup,
+                                              start=start, stop=stop)
+        else:
+            self._chunk = self._hstore.select(
+                self._pgroup, where=self.coordinates[start:stop])
         self.start = start
 
     def get_corner_span(self):
@@ -287,13 +373,33 @@ class DataFrameModel(QtCore.QAbstractTableModel):
     def cell(self, row, col):
         return None  # Disable zoom.
 
+    @property
+    def leaf(self):
+        """The `tables.Table` where the frame is stored."""
+        return self._leaf
+
+    def csv_export_options(self, add_header):
+        """
+        The options for exporting the rows of the model in a worker process.
+
+        Only the displayed rows of filtered frames are exported. See
+        :func:`vitables.csv.exportworker.exportDataset`.
+        """
+        return {'frame_key': self._pgroup,
+                'coordinates': self.coordinates,
+                'add_header': add_header}
+
     def to_csv(self, filepath, add_header):
-        import io
+        """
+        Write the rows of the model to a CSV file in the calling process.
 
-        with io.open(filepath, 'wt', encoding='utf-8') as fd:
-            chunks = iter(self._hstore.select(self._pgroup, iterator=True))
-            df = next(chunks)
-            df.to_csv(fd, header=add_header)
+        Exports started from the GUI run in a worker process instead (see
+        :meth:`csv_export_options`).
+        """
+        from vitables.csv import csvwriter
 
-            for df in chunks:
-                df.to_csv(fd, header=False)
+        with open(filepath, 'wb') as fd:
+            for written in csvwriter.writeFrameRows(
+                    fd, self._hstore, self._pgroup, self.coordinates,
+                    add_header, SCAN_CHUNK_SIZE):
+                pass
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#       Copyright (C) 2008-2017 Vicent Mas. All rights reserved
+#
+#       This program is free software: you can redistribute it and/or modify
+#       it under the terms of the GNU General Public License as published by
+#       the Free Software Foundation, either version 3 of the License, or
+#       (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#       MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#       GNU General Public License for more details.
+#
+#       You should have received a copy of the GNU General Public License
+#       along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#       Author:  Vicent Mas - vmas@vitables.org
+
+"""
+Utilities for running long `PyTables` operations in worker processes.
+
+`PyTables` is not thread-safe so long-running operations cannot be moved to a
+secondary thread of the GUI process. Instead they are run in worker processes
+that open the involved files on their own and talk to the GUI process through
+a pipe.
+
+This module doesn't import ``Qt`` so it can be safely imported by the worker
+processes.
+"""
+
+__docformat__ = 'restructuredtext'
+
+import contextlib
+import multiprocessing
+import os
+
+
+@contextlib.contextmanager
+def fileLockingDisabled():
+    """Disable HDF5 file locking in the processes spawned in this context.
+
+    HDF5 file locking is disabled in the worker processes so that they can
+    open files that ViTables keeps open in append mode. The variable is read
+    when the HDF5 library is initialised so it is set only while the workers
+    are being spawned.
+    """
+
+    old_value = os.environ.get('HDF5_USE_FILE_LOCKING')
+    os.environ['HDF5_USE_FILE_LOCKING'] = 'FALSE'
+    try:
+        yield
+    finally:
+        if old_value is None:
+            del os.environ['HDF5_USE_FILE_LOCKING']
+        else:
+            os.environ['HDF5_USE_FILE_LOCKING'] = old_value
+
+
+def startWorker(target, args):
+    """Start a worker process and return it with the end of its pipe.
+
+    The worker process is started with the `spawn` method because a forked
+    process would share the HDF5 library state (and the open files) of
+    ViTables. HDF5 file locking is disabled in the worker process, see
+    :func:`fileLockingDisabled`.
+
+    The sending end of the pipe is passed to `target` as its first argument.
+
+    :Parameters:
+
+    - `target`: the callable run by the worker process
+    - `args`: a tuple with the remaining arguments of the callable
+
+    :Returns: a tuple (process, receiving end of the pipe)
+    """
+
+    context = multiprocessing.get_context('spawn')
+    conn, child_conn = context.Pipe(duplex=False)
+    worker = context.Process(target=target, args=(child_conn,) + tuple(args),
+                             daemon=True)
+    with fileLockingDisabled():
+        worker.start()
+    # Only the worker process writes to the pipe
+    child_conn.close()
+    return worker, conn
+
+
+def startPool(processes):
+    """Start a pool of worker processes.
+
+    Like single workers, the processes of the pool are spawned with HDF5 file
+    locking disabled. The processes are started when the pool is created.
+
+    :Parameter processes: the number of worker processes. It is limited to
+      the number of CPUs of the machine
+
+    :Returns: a `multiprocessing.pool.Pool` instance
+    """
+
+    context = multiprocessing.get_context('spawn')
+    processes = max(1, min(processes, os.cpu_count() or 1))
+    with fileLockingDisabled():
+        return context.Pool(processes)